@@ -0,0 +1,136 @@
+import json
+
+from code.query_engine import sort_key, ID_FIELD
+
+AGGREGATE_OPERATORS = ("@count", "@sum", "@avg", "@min", "@max")
+
+
+class Aggregation:
+    # Агрегаты по документам, подходящим под запрос, одним потоковым проходом (документы в памяти не копятся).
+    # aggregations - {имя результата: {"@count"|"@sum"|"@avg"|"@min"|"@max": путь поля}}; "@count": "*" - число документов,
+    # "@count": поле - число документов, у которых есть это поле. group_by - поле или список полей группировки.
+    # Результат - список строк {поле группировки: значение, ..., имя результата: значение} по возрастанию значений группировки.
+    # Число документов, а также min/max и число документов по группам для проиндексированного поля берутся из индекса
+
+    def __init__(self, collection, query: dict, aggregations: dict, group_by=None):
+        self.collection = collection
+        self.query = query
+        self.group_by = [group_by] if isinstance(group_by, str) else list(group_by or [])
+        self.metrics = []   # [(имя, оператор, поле)]
+        for name, spec in aggregations.items():
+            if not isinstance(spec, dict) or len(spec) != 1 or next(iter(spec)) not in AGGREGATE_OPERATORS:
+                raise ValueError(f"Aggregation '{name}' must be {{operator: field}} with one of {', '.join(AGGREGATE_OPERATORS)}")
+            operator, field = next(iter(spec.items()))
+            self.metrics.append((name, operator, field))
+        if not self.metrics:
+            raise ValueError("No aggregations given")
+
+    def run(self) -> list:
+        rows = self._from_indexes()
+        if rows is not None:
+            return rows
+
+        groups = {}     # {ключ группы (строка JSON): (значения полей группировки, [состояния агрегатов])}
+        for json_document in self.collection.search(self.query):
+            values = [self._group_value(json_document, field) for field in self.group_by]
+            key = json.dumps(values, sort_keys=True, default=str)
+            if key not in groups:
+                groups[key] = (values, [self._new_state(operator) for _, operator, _ in self.metrics])
+            states = groups[key][1]
+            for i, (_, operator, field) in enumerate(self.metrics):
+                states[i] = self._update(operator, states[i], json_document, field)
+
+        if not groups and not self.group_by:   # Без группировки - одна строка и для пустой выборки
+            groups[""] = ([], [self._new_state(operator) for _, operator, _ in self.metrics])
+        ordered = sorted(groups.values(), key=lambda group: [sort_key([] if value is None else [value]) for value in group[0]])
+        return [self._row(values, [self._result(operator, state) for (_, operator, _), state in zip(self.metrics, states)])
+                for values, states in ordered]
+
+    def _row(self, group_values: list, results: list) -> dict:
+        row = dict(zip(self.group_by, group_values))
+        row.update((name, result) for (name, _, _), result in zip(self.metrics, results))
+        return row
+
+    def _group_value(self, json_document: dict, field: str):
+        values = self.collection.get_value(json_document, field)
+        if not values:
+            return None
+        return values[0] if len(values) == 1 else values
+
+    def _new_state(self, operator: str):
+        if operator == "@avg":
+            return [0, 0]   # [сумма, количество]
+        if operator in ("@min", "@max"):
+            return None
+        return 0
+
+    def _update(self, operator: str, state, json_document: dict, field: str):
+        if operator == "@count":
+            return state + (1 if field in (None, "*") or self.collection.get_value(json_document, field) else 0)
+
+        values = self.collection.get_value(json_document, field)
+        if operator in ("@sum", "@avg"):
+            numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+            if operator == "@sum":
+                return state + sum(numbers)
+            return [state[0] + sum(numbers), state[1] + len(numbers)]
+
+        for value in values:    # Значения разных типов сравниваются как при сортировке
+            if state is None:
+                state = value
+                continue
+            key, best = sort_key([value]), sort_key([state])
+            if (key > best) if operator == "@max" else (key < best):
+                state = value
+        return state
+
+    def _result(self, operator: str, state):
+        if operator == "@avg":
+            return state[0] / state[1] if state[1] else None
+        return state
+
+    def _from_indexes(self):
+        # Ответ без чтения документов, если его дают индексы. Иначе None
+        indexation = self.collection.indexation
+        indexes = indexation.get_indexes()
+        total_rows = sum(1 for _ in self.collection.get_filenames())
+
+        if self.group_by:   # Число документов по группам - обход точного индекса поля группировки
+            field = self.group_by[0]
+            if self.query or len(self.group_by) > 1 or field not in indexes or not indexes[field].exact:
+                return None
+            if any(operator != "@count" or metric_field not in (None, "*") for _, operator, metric_field in self.metrics):
+                return None
+            index = indexes[field]
+            with_field = len(index.keys_by_id)
+            if with_field != index.key_count:   # У документов бывает несколько значений - группа определяется всем списком
+                return None
+            rows = [self._row([key], [len(ids)] * len(self.metrics)) for key, ids in index.btree.range_search() if ids]
+            without_field = self._document_count(total_rows) - with_field
+            if without_field:
+                rows.append(self._row([None], [without_field] * len(self.metrics)))
+            return rows
+
+        ids = None
+        if self.query:      # Число документов под условием - по индексам, если запрос ими покрыт
+            plan = self.collection.query_planner._plan_index_only(self.query, [ID_FIELD], indexation, total_rows)
+            if plan is None or any(operator != "@count" or field not in (None, "*") for _, operator, field in self.metrics):
+                return None
+            ids = plan.ids()
+
+        results = []
+        for _, operator, field in self.metrics:
+            if operator == "@count" and field in (None, "*"):
+                results.append(self._document_count(total_rows) if ids is None else len(ids))
+            elif operator == "@count" and field in indexes:
+                results.append(len(indexes[field].keys_by_id))
+            elif operator in ("@min", "@max") and field in indexes and indexes[field].exact:
+                btree = indexes[field].btree
+                results.append(btree.min_key() if operator == "@min" else btree.max_key())
+            else:
+                return None
+        return [self._row([], results)]
+
+    def _document_count(self, total_rows: int) -> int:
+        # Число документов, которые выдаёт перебор: пустые документы {} он пропускает
+        return total_rows - sum(1 for _ in self.collection.get_empty_filenames())
@@ -0,0 +1,213 @@
+import bisect
+
+from code.btree import Node, BTree
+
+
+class BPlusNode(Node):
+    __slots__ = ("next",)
+
+    def __init__(self, leaf=False):
+        super().__init__(leaf)
+        self.next = None                                            # Следующий лист по возрастанию ключей (только у листьев)
+
+
+class BPlusTree(BTree):
+    # B+ дерево: пары (key, [id1, id2,...]) лежат только в листьях, внутренние узлы хранят ключи-разделители.
+    # Листья связаны в список по возрастанию ключей: диапазонный поиск спускается к первому листу один раз,
+    # а дальше идёт по листьям подряд, без рекурсивного обхода дерева.
+    # В узле от t - 1 до 2 * t - 1 ключей (кроме корня); ключи children[i] < keys[i] <= ключи children[i + 1]
+
+    def _create_node(self, leaf=False):
+        return BPlusNode(leaf)
+
+    def _find_leaf(self, key):                                      # Лист, в котором лежит (или должен лежать) key
+        node = self.root
+        while not node.leaf:
+            node = node.children[bisect.bisect_right(node.keys, key)]
+        return node
+
+    def _first_leaf(self):
+        node = self.root
+        while not node.leaf:
+            node = node.children[0]
+        return node
+
+    def search(self, key, node=None):
+        leaf = self._find_leaf(key)
+        i = bisect.bisect_left(leaf.keys, key)
+        if i < len(leaf.keys) and leaf.keys[i] == key:
+            return leaf.values[i]                                   # Возвращает [id1_i, id2_i,...]
+        return []
+
+    def range_search(self, lower=None, upper=None, include_lower=True, include_upper=True, node=None):
+        # Упорядоченный обход ключей в интервале [lower; upper] (None - граница не задана) по связанным листьям
+        # Возвращает генератор пар (key, [id1, id2,...]) по возрастанию key
+        if lower is None:
+            leaf, i = self._first_leaf(), 0
+        else:
+            leaf = self._find_leaf(lower)
+            i = bisect.bisect_left(leaf.keys, lower) if include_lower else bisect.bisect_right(leaf.keys, lower)
+
+        while leaf is not None:
+            keys = leaf.keys
+            for j in range(i, len(keys)):
+                key = keys[j]
+                if upper is not None and (key > upper or (key == upper and not include_upper)):
+                    return
+                yield key, leaf.values[j]
+            leaf, i = leaf.next, 0
+
+    def reverse_search(self, node=None):
+        # Листья связаны только вперёд, поэтому по убыванию идём рекурсивно; пары берутся только из листьев
+        if node is None:
+            node = self.root
+
+        if node.leaf:
+            for i in range(len(node.keys) - 1, -1, -1):
+                yield node.keys[i], node.values[i]
+            return
+        for child in reversed(node.children):
+            yield from self.reverse_search(child)
+
+    def min_key(self):
+        leaf = self._first_leaf()
+        return leaf.keys[0] if leaf.keys else None
+
+    def max_key(self):
+        node = self.root
+        while not node.leaf:
+            node = node.children[-1]
+        return node.keys[-1] if node.keys else None
+
+    def insert(self, key, value: str):
+        split = self._insert(self.root, key, value)
+        if split is not None:                                       # Разделился корень - дерево растёт вверх
+            separator, right = split
+            new_root = self._create_node()
+            new_root.keys = [separator]
+            new_root.children = [self.root, right]
+            self.root = new_root
+
+    def _insert(self, node, key, value):
+        # Вставляет пару в поддерево node. Если node переполнился и разделился - возвращает (разделитель, правый узел)
+        if node.leaf:
+            i = bisect.bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                node.add_values(i, value)
+                return None
+            node.keys.insert(i, key)
+            node.values.insert(i, [value] if isinstance(value, str) else value)
+            if len(node.keys) < 2 * self.t:
+                return None
+
+            middle = len(node.keys) // 2                            # Лист делится пополам, первый ключ правой половины копируется в родителя
+            right = self._create_node(True)
+            right.keys, right.values = node.keys[middle:], node.values[middle:]
+            node.slice_data(0, middle)
+            right.next, node.next = node.next, right
+            return right.keys[0], right
+
+        i = bisect.bisect_right(node.keys, key)
+        split = self._insert(node.children[i], key, value)
+        if split is None:
+            return None
+        separator, child = split
+        node.keys.insert(i, separator)
+        node.children.insert(i + 1, child)
+        if len(node.keys) < 2 * self.t:
+            return None
+
+        middle = len(node.keys) // 2                                # Средний разделитель поднимается в родителя
+        right = self._create_node()
+        separator = node.keys[middle]
+        right.keys, right.children = node.keys[middle + 1:], node.children[middle + 1:]
+        node.keys, node.children = node.keys[:middle], node.children[:middle + 1]
+        return separator, right
+
+    def _bulk_leaves(self, entries):
+        # Все пары лежат в связанных листьях, разделитель листа - копия его первого ключа (без значений)
+        nodes = [self._create_node(True)]
+        separators = []
+        for key, values in entries:
+            leaf = nodes[-1]
+            if len(leaf.keys) == 2 * self.t - 1:
+                leaf.next = self._create_node(True)
+                separators.append((key, None))
+                self._bulk_append(nodes, leaf.next)
+                leaf = leaf.next
+            leaf.keys.append(key)
+            leaf.values.append(values)
+
+        if len(nodes) > 1 and len(nodes[-1].keys) < self.t - 1:  # Недобор в последнем листе - делим пары двух последних листов поровну
+            left, right = nodes[-2], nodes[-1]
+            keys, values = left.keys + right.keys, left.values + right.values
+            middle = len(keys) // 2
+            left.keys, left.values = keys[:middle], values[:middle]
+            right.keys, right.values = keys[middle:], values[middle:]
+            separators[-1] = (right.keys[0], None)
+        return nodes, separators
+
+    def delete(self, key, node=None):
+        self._delete(self.root, key)
+        root = self.root
+        if not root.leaf and not root.keys:                         # В корне остался один ребёнок - дерево уменьшается в высоту
+            self.root = root.children[0]
+            self._discard_node(root)
+
+    def _delete(self, node, key):
+        if node.leaf:
+            i = bisect.bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                node.pop_pair(i)
+            return
+
+        i = bisect.bisect_right(node.keys, key)
+        self._delete(node.children[i], key)
+        if len(node.children[i].keys) < self.t - 1:                 # Ребёнку не хватает ключей - занимаем у соседа или сливаем
+            self._rebalance(node, i)
+
+    def _rebalance(self, parent, i):
+        child = parent.children[i]
+        left = parent.children[i - 1] if i > 0 else None
+        right = parent.children[i + 1] if i + 1 < len(parent.children) else None
+
+        if left is not None and len(left.keys) >= self.t:           # Занимаем последний ключ левого соседа
+            if child.leaf:
+                child.keys.insert(0, left.keys.pop())
+                child.values.insert(0, left.values.pop())
+                parent.keys[i - 1] = child.keys[0]
+            else:
+                child.keys.insert(0, parent.keys[i - 1])
+                parent.keys[i - 1] = left.keys.pop()
+                child.children.insert(0, left.children.pop())
+        elif right is not None and len(right.keys) >= self.t:       # Занимаем первый ключ правого соседа
+            if child.leaf:
+                child.keys.append(right.keys.pop(0))
+                child.values.append(right.values.pop(0))
+                parent.keys[i] = right.keys[0]
+            else:
+                child.keys.append(parent.keys[i])
+                parent.keys[i] = right.keys.pop(0)
+                child.children.append(right.children.pop(0))
+        elif left is not None:                                      # Соседям нечего отдать - сливаем с соседом (правый узел всегда в левый)
+            self._merge(parent, i - 1)
+        else:
+            self._merge(parent, i)
+
+    def _merge(self, parent, i):                                    # Сливает children[i + 1] в children[i]
+        left, right = parent.children[i], parent.children[i + 1]
+        if left.leaf:
+            left.keys.extend(right.keys)
+            left.values.extend(right.values)
+            left.next = right.next
+        else:
+            left.keys.extend([parent.keys[i]] + right.keys)
+            left.children.extend(right.children)
+        parent.keys.pop(i)
+        parent.children.pop(i + 1)
+        self._discard_node(right)
+
+    def remove_value(self, value: str, node=None):                  # Удаление value из всех ключей
+        keys = [key for key, values in self.range_search() if value in values]
+        for key in keys:
+            self.remove_key_value(key, value)
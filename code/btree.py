@@ -1,74 +1,89 @@
+import bisect
+
+
 class Node:
+    __slots__ = ("keys", "values", "children", "leaf")             # Без __dict__ у каждого узла - меньше памяти на миллионах узлов
+
     def __init__(self, leaf=False):
-        self.data = [[], []]                                        # Самопичный итерируемый словарь [[keys], [values]] ВАЖНО: на 1 ключ может быть несколько values(id), поэтому key: [id1, id2, id3...]
+        self.keys = []                                              # Отсортированные ключи узла [key_1, key_2,...]
+        self.values = []                                            # Параллельный массив значений: values[i] - список id ключа keys[i]. ВАЖНО: на 1 ключ может быть несколько values(id), поэтому key: [id1, id2, id3...]
         self.children = []                                          # Массив дочерних узлов [key]
         self.leaf = leaf                                            # Проверка на дочерний узел
                                                                     # t - 1 <= keys <= 2 * t - 1
                                                                     # t <= children_keys <= 2 * t
 
+    @property
+    def data(self) -> list:                                         # Прежнее представление узла [[keys], [values]] (те же списки, не копия)
+        return [self.keys, self.values]
+
+    @data.setter
+    def data(self, data: list):
+        self.keys, self.values = data[0], data[1]
+
     def get_keys(self) -> list:                                     # Возвращает [key_1, key_2,...]
-        return self.data[0]
+        return self.keys
 
     def get_values(self) -> list:                                   # Возвращает [[id1_1, id2_1,...], [id1_2, id2_2,...]...]
-        return self.data[1]
+        return self.values
 
     def get_pair(self, index: int) -> tuple:
-        return self.data[0][index], self.data[1][index]
+        return self.keys[index], self.values[index]
+
+    def find(self, key) -> int:                                     # Номер первого ключа >= key (бинарный поиск)
+        return bisect.bisect_left(self.keys, key)
+
+    def _position(self, key, hint: int) -> int:                     # Номер key в узле или -1; сначала проверяем ожидаемые места, затем бинарный поиск
+        for i in (hint, hint - 1):
+            if 0 <= i < len(self.keys) and self.keys[i] == key:
+                return i
+        i = self.find(key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return -1
+
+    def add_values(self, index: int, value):                        # Дописывает value (str или list) к значениям ключа keys[index]
+        if isinstance(value, str):
+            self.values[index].append(value)
+        elif isinstance(value, list):
+            self.values[index].extend(value)
 
     def append_pair(self, key, value):
-        if isinstance(value, str):                                  # Если value: str (стандартный случай)
-            if key not in self.data[0]:
-                self.data[0].append(key)
-                self.data[1].append([value])
-            else:
-                i = self.data[0].index(key)
-                self.data[1][i].append(value)
-        if isinstance(value, list):                                 # Если value: list (например из get_pair())
-            if key not in self.data[0]:
-                self.data[0].append(key)
-                self.data[1].append(value)
-            else:
-                i = self.data[0].index(key)
-                for j in range(len(value)):
-                    self.data[1][i].append(value[j])
+        if not isinstance(value, (str, list)):
+            return
+        i = self._position(key, len(self.keys) - 1)
+        if i >= 0:                                                  # Ключ уже есть - дописываем значения к нему
+            self.add_values(i, value)
+        else:
+            self.keys.append(key)
+            self.values.append([value] if isinstance(value, str) else value)
 
     def insert_pair(self, index: int, key, value):
-        if isinstance(value, str):                                  # Если value: str (стандартный случай)
-            if key not in self.data[0]:
-                self.data[0].insert(index, key)
-                self.data[1].insert(index, [value])
-            else:
-                i = self.data[0].index(key)
-                self.data[1][i].append(value)
-        if isinstance(value, list):                                 # Если value: list (например из get_pair())
-            if key not in self.data[0]:
-                self.data[0].insert(index, key)
-                self.data[1].insert(index, value)
-            else:
-                i = self.data[0].index(key)
-                for j in range(len(value)):
-                    self.data[1][i].append(value[j])
+        if not isinstance(value, (str, list)):
+            return
+        i = self._position(key, index)
+        if i >= 0:                                                  # Ключ уже есть - дописываем значения к нему
+            self.add_values(i, value)
+        else:
+            self.keys.insert(index, key)
+            self.values.insert(index, [value] if isinstance(value, str) else value)
 
     def pop_pair(self, index: int):
-        self.data[0].pop(index)
-        self.data[1].pop(index)
+        self.keys.pop(index)
+        self.values.pop(index)
 
     def remove_value(self, key, value: str):                        # Удаляет value по заданному key
-        i = self.data[0].index(key)
-        self.data[1][i].remove(value)
+        i = self._position(key, self.find(key))
+        if i < 0:
+            raise ValueError(f"{key!r} is not in node")
+        self.values[i].remove(value)
 
     def slice_data(self, start: int, end: int):
-        temp_data = [[], []]
-        for i in range(start, end):
-            key, value = self.get_pair(i)
-            temp_data[0].append(key)
-            temp_data[1].append(value)
-        self.data.clear()
-        self.data = temp_data
+        self.keys = self.keys[start:end]
+        self.values = self.values[start:end]
 
     def replace_data(self, index: int, key, values: list):
-        self.data[0][index] = key
-        self.data[1][index] = values
+        self.keys[index] = key
+        self.values[index] = values
 
 
 class BTree:
@@ -77,27 +92,75 @@ class BTree:
                                                                     # n - количество элементов
 
                                                                     # h <= log(t)[(n + 1) / 2]
-        self.root = Node(True)
         self.t = t
+        self.root = self._create_node(True)
+
+    def _create_node(self, leaf=False):                             # Создание нового узла (переопределяется у дерева, хранящегося на диске)
+        return Node(leaf)
+
+    def _discard_node(self, node):                                  # Узел выпал из дерева при слиянии (дерево на диске освобождает его страницы)
+        pass
 
     def search(self, key, node=None):                               # key - искомое значение
         if node is None:                                            # Если начало поиска - "курсор" на корень
             node = self.root
 
-        i = 0                                                       # Номер интервала, в котором может находиться key (искомое значение)
-        while i < len(node.get_keys()) and key > node.get_keys()[i]:
-            i += 1
-        if i < len(node.get_keys()) and key == node.get_keys()[i]:  # Если нашли key в текущем узле
-            return node.get_values()[i]                             # Возвращает [[id1_i, id2_i,...]
-        elif node.leaf:                                             # Если не нашли key в B-дереве
-            return []
-        else:
-            return self.search(key, node.children[i])               # Переходим к нужному дочернему узлу
+        while True:
+            i = node.find(key)                                      # Номер интервала, в котором может находиться key (искомое значение)
+            if i < len(node.keys) and key == node.keys[i]:          # Если нашли key в текущем узле
+                return node.values[i]                               # Возвращает [[id1_i, id2_i,...]
+            if node.leaf:                                           # Если не нашли key в B-дереве
+                return []
+            node = node.children[i]                                 # Переходим к нужному дочернему узлу
+
+    def range_search(self, lower=None, upper=None, include_lower=True, include_upper=True, node=None):
+        # Упорядоченный обход ключей в интервале [lower; upper] (None - граница не задана)
+        # Возвращает генератор пар (key, [id1, id2,...]) по возрастанию key
+        if node is None:
+            node = self.root
+
+        keys = node.keys
+        start = 0
+        if lower is not None:                                       # Ключи левее start и их левые поддеревья меньше нижней границы
+            start = bisect.bisect_right(keys, lower) if not include_lower else bisect.bisect_left(keys, lower)
+        for i in range(start, len(keys)):
+            key = keys[i]
+            if not node.leaf:
+                yield from self.range_search(lower, upper, include_lower, include_upper, node.children[i])
+            if upper is not None and (key > upper or (key == upper and not include_upper)):
+                return                                              # key и всё правое поддерево больше верхней границы
+            yield key, node.values[i]
+
+        if not node.leaf:
+            yield from self.range_search(lower, upper, include_lower, include_upper, node.children[len(keys)])
+
+    def reverse_search(self, node=None):
+        # Обход всех пар (key, [id1, id2,...]) по убыванию key
+        if node is None:
+            node = self.root
+
+        for i in range(len(node.keys), -1, -1):
+            if not node.leaf:
+                yield from self.reverse_search(node.children[i])
+            if i > 0:
+                yield node.keys[i - 1], node.values[i - 1]
+
+    def min_key(self):                                              # Минимальный ключ дерева (самый левый лист) или None
+        node = self.root
+        while not node.leaf:
+            node = node.children[0]
+        return node.get_keys()[0] if node.get_keys() else None
+
+    def max_key(self):                                              # Максимальный ключ дерева (самый правый лист) или None
+        node = self.root
+        while not node.leaf:
+            node = node.children[-1]
+        return node.get_keys()[-1] if node.get_keys() else None
 
     def insert(self, key, value: str):
         root = self.root
         if len(root.get_keys()) == (2 * self.t) - 1:                # Если при вставке переполняется корень
-            new_root = Node()                                       # Создаем новый корень
+            new_root = self._create_node()                          # Создаем новый корень
             self.root = new_root
             new_root.children.append(root)                          # Старый корень становится ребенком нового корня
             self._split_child(new_root, 0)
@@ -106,163 +169,200 @@ class BTree:
             self._insert_non_full(root, key, value)                 # Вставляем в новый корень значение
 
     def _insert_non_full(self, node, key, value: str):
-        i = len(node.get_keys()) - 1
-
-        if node.leaf:                                               # Листовая вставка
-            while i >= 0 and key < node.get_keys()[i]:              # Находим нужный интервал для вставки
-                i -= 1
-            node.insert_pair(i + 1, key, value)
-        else:                                                       # Узловая вставка (нелистовая)
-            while i >= 0 and key < node.get_keys()[i]:              # Ищем нужный интервал, в который потом перейдем
-                i -= 1
-            i += 1
-            if len(node.children[i].get_keys()) == (2 * self.t) - 1:# Если дочерний узел заполнен
+        while True:
+            keys = node.keys
+            i = bisect.bisect_left(keys, key)                       # Находим нужный интервал для вставки
+            if i < len(keys) and key == keys[i]:                    # Ключ уже есть в узле (в том числе во внутреннем) - дописываем value к нему, а не дублируем ключ в листе
+                node.add_values(i, value)
+                return
+
+            if node.leaf:                                           # Листовая вставка: ключа в узле точно нет, повторно не ищем
+                keys.insert(i, key)
+                node.values.insert(i, [value] if isinstance(value, str) else value)
+                return
+
+            if len(node.children[i].keys) == (2 * self.t) - 1:      # Если дочерний узел заполнен (узловая вставка)
                 self._split_child(node, i)                          # Разделяем дочерний узел на 2 узла
-                if key > node.get_keys()[i]:
+                if key == node.keys[i]:                             # Поднятый при разделении ключ совпал со вставляемым
+                    node.add_values(i, value)
+                    return
+                if key > node.keys[i]:
                     i += 1
-            self._insert_non_full(node.children[i], key, value)     # Рекурсивно доходим до листового узла
+            node = node.children[i]                                 # Спускаемся до листового узла
 
     def _split_child(self, parent, i):
         child = parent.children[i]
 
-        new_child_node = Node(leaf=child.leaf)                      # Создаем 2 дочерний узел и копируем в него значения из 1 узла
-        new_child_node.data = [child.data[0][:], child.data[1][:]]
-        original_children = child.children[:]
-
+        new_child_node = self._create_node(child.leaf)              # Создаем 2 дочерний узел
         parent.children.insert(i + 1, new_child_node)               # Связываем родительский и новый дочерний узлы
 
         split = self.t - 1                                          # Уменьшаем степень, ибо теперь у нас 2 дочерних узла, вместо 1
 
-        middle_key, middle_value = child.get_pair(split)            # Берем средний ключ у дочернего узла и вставляем его в родительский узел
-        parent.insert_pair(i, middle_key, middle_value)
+        parent.keys.insert(i, child.keys[split])                    # Берем средний ключ у дочернего узла и вставляем его в родительский узел
+        parent.values.insert(i, child.values[split])
 
-        child.slice_data(0, split)                                  # Разделяем значения между 2 дочерними узлами (учитываем, что перекинули центральное значение в родительский узел)
-        new_child_node.slice_data(split + 1, len(new_child_node.get_keys()))
-        # new_child_node.slice_data(split + 1, 2 * (split + 1) - 1)
+        new_child_node.keys = child.keys[split + 1:]                # Разделяем значения между 2 дочерними узлами (учитываем, что перекинули центральное значение в родительский узел)
+        new_child_node.values = child.values[split + 1:]
+        child.slice_data(0, split)
 
         if not child.leaf:                                          # Разделяем дочерние узлы между 2 узлами
-            child.children = original_children[:split + 1]
-            new_child_node.children = original_children[split + 1:]
-
-    def delete(self, key, node=None, key_exists=None):
-        if key_exists is None:
-            if self.search(key) is None:
-                return -1                                           # Возвращаем исключение - удаляемого ключа не существует в дереве
-            else:
-                key_exists = True
-
+            children = child.children
+            child.children = children[:split + 1]
+            new_child_node.children = children[split + 1:]
+
+    def bulk_load(self, entries):
+        # Построение пустого дерева снизу вверх из пар (key, [id1, id2,...]), отсортированных по возрастанию различных key.
+        # Узлы заполняются полностью (2 * t - 1 ключей), без поиска места и разделений; недобор бывает только у двух последних узлов уровня
+        nodes, separators = self._bulk_leaves(entries)
+        while len(nodes) > 1:
+            nodes, separators = self._bulk_level(nodes, separators)
+        self.root = nodes[0]
+
+    def _bulk_leaves(self, entries):
+        # Нижний уровень: листья и разделители между ними [(key, values)] - в B-дереве разделители сами являются парами дерева
+        nodes = [self._create_node(True)]
+        separators = []
+        for key, values in entries:
+            leaf = nodes[-1]
+            if len(leaf.keys) == 2 * self.t - 1:                    # Лист полон - пара уходит разделителем на уровень выше
+                separators.append((key, values))
+                self._bulk_append(nodes, self._create_node(True))
+                continue
+            leaf.keys.append(key)
+            leaf.values.append(values)
+
+        if len(nodes) > 1 and len(nodes[-1].keys) < self.t - 1:
+            self._bulk_redistribute(nodes, separators)
+        return nodes, separators
+
+    def _bulk_level(self, nodes, separators):
+        # Уровень выше: по 2 * t детей на узел; разделители внутри группы становятся ключами узла, между группами - поднимаются
+        parents = []
+        upper = []
+        for start in range(0, len(nodes), 2 * self.t):
+            parent = self._create_node()
+            parent.children = nodes[start:start + 2 * self.t]
+            end = start + len(parent.children) - 1
+            parent.keys = [key for key, _ in separators[start:end]]
+            if separators[start:end] and separators[start][1] is not None:   # У разделителей B+ дерева значений нет
+                parent.values = [values for _, values in separators[start:end]]
+            if end < len(separators):
+                upper.append(separators[end])
+            self._bulk_append(parents, parent)
+
+        if len(parents) > 1 and len(parents[-1].children) < self.t:
+            self._bulk_redistribute(parents, upper)
+        return parents, upper
+
+    def _bulk_append(self, nodes, node):
+        # Узел, за которым уже два новых, больше не изменится (перераспределяются только два последних узла уровня)
+        nodes.append(node)
+        if len(nodes) > 2:
+            self._bulk_done(nodes[-3])
+
+    def _bulk_done(self, node):                                     # Узел построен окончательно (дерево на диске сразу записывает его)
+        pass
+
+    def _bulk_redistribute(self, nodes, separators):
+        # Делит поровну ключи двух последних узлов уровня вместе с разделителем между ними (у последнего был недобор)
+        left, right = nodes[-2], nodes[-1]
+        key, values = separators[-1]
+        keys = left.keys + [key] + right.keys
+        middle = (len(keys) - 1) // 2
+        left.keys, right.keys = keys[:middle], keys[middle + 1:]
+        if values is None:
+            separators[-1] = (keys[middle], None)
+        else:
+            all_values = left.values + [values] + right.values
+            left.values, right.values = all_values[:middle], all_values[middle + 1:]
+            separators[-1] = (keys[middle], all_values[middle])
+        if not left.leaf:
+            children = left.children + right.children
+            left.children, right.children = children[:middle + 1], children[middle + 1:]
+
+    def delete(self, key, node=None):
         if node is None:
             node = self.root
 
-        i = 0                                                       # Номер интервала, в котором может находиться key (удаляемое значение)
-        while i < len(node.get_keys()) and key > node.get_keys()[i]:
-            i += 1
-        if node.leaf:                                               # Если нашли key и он находится в листе - просто удаляем его
-            if i < len(node.get_keys()) and node.get_keys()[i] == key:
+        i = node.find(key)                                          # Номер интервала, в котором может находиться key (удаляемое значение)
+
+        if i < len(node.keys) and node.keys[i] == key:              # Если нашли key в текущем узле
+            if node.leaf:                                           # Если key находится в листе - просто удаляем его
                 node.pop_pair(i)
+            else:
+                self._delete_internal_node(node, key, i)
+            return
+        if node.leaf:                                               # Удаляемого ключа не существует в дереве
             return
 
-        if i < len(node.get_keys()) and node.get_keys()[i] == key:  # Если нашли key в текущем узле
-            return self._delete_internal_node(node, key, i)
-        elif len(node.children[i].get_keys()) >= self.t:            # Если не нашли key в текущем узле и условие с t выполняется, рекурсивно ищем в дочернем узле
-            self.delete(key, node.children[i], key_exists)
-        else:                                                       # Если не нашли key в текущем узле и условие с t не выполняется
-            if i != 0 and i + 2 < len(node.children):               # Если у текущего узла есть сосед слева и справа
-                if len(node.children[i - 1].get_keys()) >= self.t:  # Если у левого соседа можно одолжить ключ - перемещаем этот ключ
-                    self._delete_sibling(node, i, i - 1)
-                elif len(node.children[i + 1].get_keys()) >= self.t:# Если у правого соседа можно одолжить ключ - перемещаем этот ключ
-                    self._delete_sibling(node, i, i + 1)
-                else:                                               # Если у обоих соседей нельзя одолжить ключ - объединяем узлы
-                    self._delete_merge(node, i, i + 1)
-            elif i == 0:                                            # Если текущий узел - самый левый
-                if len(node.children[i + 1].get_keys()) >= self.t:  # Если у правого соседа можно одолжить ключ - перемещаем этот ключ
-                    self._delete_sibling(node, i, i + 1)
-                else:                                               # Иначе объединяем узлы
-                    self._delete_merge(node, i, i + 1)
-            elif i + 1 == len(node.children):                       # Если текущий узел - самый правый
-                if len(node.children[i - 1].get_keys()) >= self.t:  # Если у левого соседа можно одолжить ключ - перемещаем этот ключ
-                    self._delete_sibling(node, i, i - 1)
-                else:                                               # Иначе объединяем узлы
-                    self._delete_merge(node, i, i - 1)
-            self.delete(key, node.children[i], key_exists)          # Рекурсивный вызов для повторного просмотра и удаления
+        if len(node.children[i].get_keys()) < self.t:               # Перед спуском в дочерний узел гарантируем, что в нём хотя бы t ключей
+            i = self._delete_fill(node, i)
+        self.delete(key, node.children[i])                          # Рекурсивный вызов для дочернего узла
 
     def _delete_internal_node(self, node, key, i):
-        if node.leaf:                                               # Если нашли key и он находится в листе - просто удаляем его
-            if node.get_keys()[i] == key:
-                node.pop_pair(i)
-            return
-
         if len(node.children[i].get_keys()) >= self.t:              # Если левый ребёнок имеет хотя бы t ключей - заменяем удаляемый ключ на максимальный ключ в левом поддереве
             predecessor_key, predecessor_value = self._delete_predecessor(node.children[i])
             node.replace_data(i, predecessor_key, predecessor_value)
-            return
         elif len(node.children[i + 1].get_keys()) >= self.t:        # Если правый ребёнок имеет хотя бы t ключей - заменяем удаляемый ключ на минимальный ключ в правом поддереве
             successor_key, successor_value = self._delete_successor(node.children[i + 1])
             node.replace_data(i, successor_key, successor_value)
-            return
-        else:                                                       # Если условие для узлов ломается - объединяем их
+        else:                                                       # Если условие для узлов ломается - объединяем их (key опускается в объединённый узел)
+            merge_node = node.children[i]
             self._delete_merge(node, i, i + 1)
-            self._delete_internal_node(node.children[i], key, self.t - 1) # Рекурсивный вызов из дочернего узла
+            self.delete(key, merge_node)                            # Рекурсивный вызов из объединённого узла
 
-    def _delete_predecessor(self, node):                            # Удаляет из узла максимальное (самое правое) ключ-значение и возвращает его
+    def _delete_predecessor(self, node):                            # Удаляет из поддерева максимальное (самое правое) ключ-значение и возвращает его
         if node.leaf:
             key, value = node.get_pair(-1)
             node.pop_pair(-1)
             return key, value
 
-        last_key_index = len(node.get_keys()) - 1                   # Индекс последнего ключа в узле
-        if len(node.children[last_key_index].get_keys()) >= self.t: # Проверяем, можно ли забрать у дочернего узла ключ
-            self._delete_sibling(node, last_key_index + 1, last_key_index)
-        else:                                                       # Если нет - объединяем их
-            self._delete_merge(node, last_key_index, last_key_index + 1)
-        return self._delete_predecessor(node.children[last_key_index])
+        last_child_index = len(node.children) - 1
+        if len(node.children[last_child_index].get_keys()) < self.t:# Проверяем, хватает ли ключей в самом правом дочернем узле
+            last_child_index = self._delete_fill(node, last_child_index)
+        return self._delete_predecessor(node.children[last_child_index])
 
-    def _delete_successor(self, node):                              # Удаляет из узла минимальное (самое левое) ключ-значение и возвращает его
+    def _delete_successor(self, node):                              # Удаляет из поддерева минимальное (самое левое) ключ-значение и возвращает его
         if node.leaf:
             key, value = node.get_pair(0)
             node.pop_pair(0)
             return key, value
 
-        if len(node.children[1].get_keys()) >= self.t:              # Аналогично delete_predecessor(self, node)
-            self._delete_sibling(node, 0, 1)
-        else:
-            self._delete_merge(node, 0, 1)
+        if len(node.children[0].get_keys()) < self.t:               # Аналогично _delete_predecessor(self, node)
+            self._delete_fill(node, 0)
         return self._delete_successor(node.children[0])
 
-    def _delete_merge(self, node, i, j):                            # Когда 2 соседних дочерних узла содержат меньше t ключей, происходит их объединение
-        merge_node = node.children[i]                               # i - главый дочерний узел (центральный), j - либо левый, либо правый дочерний узел
-
-        if j > i:                                                   # Если j - правый дочерний узел
-            right_child = node.children[j]
-            merge_node.append_pair(*node.get_pair(i))               # Записываем ключ-значение, которое разделяет 2 дочерних узла
-
-            for k in range(len(right_child.get_keys())):            # Переносим все ключи-значения и дочерние узлы в merge_node
-                merge_node.append_pair(*right_child.get_pair(k))
-                if len(right_child.children) > 0:
-                    merge_node.children.append(right_child.children[k])
-            if len(right_child.children) > 0:
-                merge_node.children.append(right_child.children.pop()) # Добавляем последний дочерний узел (его не захватил цикл выше)
+    def _delete_fill(self, node, i) -> int:                         # Добавляет ключ в дочерний узел i, у которого меньше t ключей
+                                                                    # Возвращает новый номер дочернего узла (меняется при слиянии с левым соседом)
+        if i > 0 and len(node.children[i - 1].get_keys()) >= self.t:# Если у левого соседа можно одолжить ключ - перемещаем этот ключ
+            self._delete_sibling(node, i, i - 1)
+        elif i + 1 < len(node.children) and len(node.children[i + 1].get_keys()) >= self.t: # Если у правого соседа можно одолжить ключ
+            self._delete_sibling(node, i, i + 1)
+        elif i + 1 < len(node.children):                            # Иначе объединяем с правым соседом
+            self._delete_merge(node, i, i + 1)
+        else:                                                       # Самый правый узел объединяем с левым соседом
+            self._delete_merge(node, i - 1, i)
+            i -= 1
+        return i
 
-            new_node = merge_node
-            node.pop_pair(i)                                        # Удаляем ключ-значение, которым разделялись 2 дочерних узла, и который мы опустили
-            node.children.pop(j)                                    # Удаляем связь с правым дочерним узлом (он слился с центральным дочерним узлом)
-        else:                                                       # Если j - левый дочерний узел
-            left_child = node.children[j]
-            merge_node.append_pair(*node.get_pair(j))
+    def _delete_merge(self, node, i, j):                            # Когда 2 соседних дочерних узла содержат меньше t ключей, происходит их объединение
+        if j < i:                                                   # Всегда сливаем правый узел в левый
+            i, j = j, i
+        merge_node = node.children[i]
+        right_child = node.children[j]
 
-            for i in range(len(merge_node.get_keys())):             # Всё то же самое, но слияние в другую сторону
-                left_child.append_pair(*merge_node.get_pair(i))
-                if len(left_child.children) > 0:
-                    left_child.children.append(merge_node.children[i])
-            if len(left_child.children) > 0:
-                left_child.children.append(merge_node.children.pop())
+        merge_node.append_pair(*node.get_pair(i))                   # Записываем ключ-значение, которое разделяет 2 дочерних узла
+        for k in range(len(right_child.get_keys())):                # Переносим все ключи-значения и дочерние узлы в merge_node
+            merge_node.append_pair(*right_child.get_pair(k))
+        merge_node.children.extend(right_child.children)
 
-            new_node = left_child
-            node.pop_pair(j)
-            node.children.pop(i)
+        node.pop_pair(i)                                            # Удаляем ключ-значение, которым разделялись 2 дочерних узла, и который мы опустили
+        node.children.pop(j)                                        # Удаляем связь с правым дочерним узлом (он слился с левым)
+        self._discard_node(right_child)
 
-        if node == self.root and len(node.get_keys()) == 0:         # Если после слияния в корне больше нет data — дерево уменьшилось в высоту, и new_node становится новым корнем
-            self.root = new_node
+        if node == self.root and len(node.get_keys()) == 0:         # Если после слияния в корне больше нет data — дерево уменьшилось в высоту, и merge_node становится новым корнем
+            self.root = merge_node
+            self._discard_node(node)
 
     def _delete_sibling(self, node, i, j):                          # Отбираем ключ у соседнего дочернего узла, если в текущем дочернем узле не хватает ключей, а у соседа их достаточно
         add_node = node.children[i]                                 # i - узел, которому добавляем ключи, j - узел, у которого забираем ключи
@@ -283,6 +383,13 @@ class BTree:
             if len(left_child.children) > 0:                        # Если есть дочерние узлы, переносим последнего ребёнка из левого соседа в начало
                 add_node.children.insert(0, left_child.children.pop())
 
+    def remove_key_value(self, key, value: str):                    # Удаление value только из заданного key
+        values = self.search(key)                                   # search возвращает сам список значений из узла
+        if value in values:
+            values.remove(value)
+            if len(values) == 0:
+                self.delete(key)                                    # Ключ без значений удаляем с балансировкой
+
     def remove_value(self, value: str, node=None):                  # Удаление value из всех node
         if node is None:
             node = self.root
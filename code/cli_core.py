@@ -3,7 +3,9 @@ import os
 import shutil
 import json
 
-from code.database import Database
+# Движок (code.database, code.server) импортируется только в командах, которые его используют:
+# в режиме клиента (--server) процесс загружает лишь клиент
+from code.client import Client, RemoteDatabase, DEFAULT_HOST, DEFAULT_PORT, DEFAULT_THREADS
 
 
 class Storage:
@@ -63,14 +65,25 @@ class Storage:
 
 
 class DB:
-    def __init__(self, current_database: str, path_to_storage: str, current_collection: str):
+    def __init__(self, current_database: str, path_to_storage: str, current_collection: str, engine: str = None,
+                 workers: int = None, client: Client = None, document_format: str = None):
         self.path_to_database = os.path.join(path_to_storage, current_database)
 
+        if client is not None:  # Режим клиента: команды выполняет сервер, у которого базы уже открыты
+            self.database = RemoteDatabase(client, f"{current_database}/{current_collection}", engine, workers, document_format)
+            return
+
         if not os.path.exists(self.path_to_database):
             typer.echo(f"[ERROR]: Database '{current_database}' at '{path_to_storage}' not found.")
             raise typer.Exit(1)
 
-        self.database = Database(self.path_to_database, current_collection)
+        from code.database import Database
+
+        try:
+            self.database = Database(self.path_to_database, current_collection, engine, workers, document_format)
+        except ValueError as error:
+            typer.echo(f"[ERROR]: {error}")
+            raise typer.Exit(1)
 
     def insert(self, string: str):
         # Вставка json-объекта в выбранную базу данных.
@@ -90,6 +103,22 @@ class DB:
             typer.echo(f"[ERROR]: {type(error).__name__}")
             raise typer.Exit(1)
 
+    def import_file(self, path_to_file: str, batch_size: int = 1000):
+        # Вставка json-объектов из файла (JSON-массив или JSON Lines) в выбранную базу данных.
+        # Пример 1: python -m code.cli_core db mydb/users import users.json
+        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users import users.jsonl
+        if not os.path.exists(path_to_file):
+            typer.echo(f"[ERROR]: File '{path_to_file}' not found.")
+            raise typer.Exit(1)
+
+        try:
+            count = self.database.import_file(path_to_file, batch_size)
+            typer.echo(f"[IMPORTED]: {count} json_documents.")
+            return count
+        except Exception as error:
+            typer.echo(f"[ERROR]: {type(error).__name__}: {error}")
+            raise typer.Exit(1)
+
     def delete(self, filename: str):
         # Удаление json-файла из выбранной базы данных.
         # Пример 1: python -m code.cli_core db mydb/users delete "531b4cdd-bc58-4aa9-aca5-5d1b7c44715f"
@@ -105,38 +134,118 @@ class DB:
             typer.echo(f"[ERROR]: {type(error).__name__}")
             raise typer.Exit(1)
 
-    def index(self, field: str):
+    def index(self, field: str, pin: bool = None, order: int = None, tree: str = None, date: bool = None):
         # Индексация выбранного поля по всем json-объектам в выбранной базе данных.
         # Пример 1: python -m code.cli_core db mydb/users index age
-        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users index age
+        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users index age --order 64 --tree bplus
         if not field.strip():
             typer.echo("[ERROR]: Empty field name.")
             raise typer.Exit(1)
 
         try:
-            count = self.database.index(field)
+            count = self.database.index(field, pin, order, tree, date)
             typer.echo(f"[INDEXED]: {count} entries indexed by field '{field}'.")
             return count
         except Exception as error:
             typer.echo(f"[ERROR]: {type(error).__name__}: {error}")
             raise typer.Exit(1)
 
-    def search_by_condition(self, query: str):
+    def compact(self):
+        # Сжатие хранилища коллекции (для engine=segments удаляет из сегментов удалённые документы).
+        # Пример 1: python -m code.cli_core db mydb/users compact
+        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users compact
+        try:
+            reclaimed = self.database.compact()
+            typer.echo(f"[COMPACTED]: {reclaimed} bytes reclaimed.")
+            return reclaimed
+        except Exception as error:
+            typer.echo(f"[ERROR]: {type(error).__name__}: {error}")
+            raise typer.Exit(1)
+
+    def checkpoint(self):
+        # Контрольная точка: изменения из журнала коллекции записываются в индексы на диске, журнал очищается.
+        # Пример: python -m code.cli_core db mydb/users checkpoint
+        try:
+            self.database.checkpoint()
+            typer.echo("[CHECKPOINT]: Write-ahead log applied.")
+        except Exception as error:
+            typer.echo(f"[ERROR]: {type(error).__name__}: {error}")
+            raise typer.Exit(1)
+
+    def search_by_condition(self, query: str, limit: int = None, skip: int = None, fields: str = None,
+                            sort: str = None, descending: bool = False):
         # Поиск json-документов по заданному условию в выбранной базе данных.
+        # Документы выводятся по мере нахождения; после limit документов поиск останавливается.
+        # fields - поля через запятую, которые нужно вывести вместо документов целиком ("_id" - id документа)
+        # sort - поле, по которому упорядочить выдачу (descending - по убыванию)
         # Пример 1: python -m code.cli_core db mydb/users condition "{'age': {'@eq': 18}}"
-        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users condition "{'age': {'@eq': 18}}"
+        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users condition "{'age': {'@eq': 18}}" --limit 10
         if not query.strip():
             typer.echo("[ERROR]: Empty query.")
             raise typer.Exit(1)
 
         try:
-            json_documents = self.database.search_by_condition(query)  # Список "подходящих" json-документов
-            if not json_documents:
+            found = 0
+            projection = self._projection(fields)
+            order = None if sort is None else (sort, "desc" if descending else "asc")
+            for json_document in self.database.search(query, limit, skip, projection, order):  # Генератор "подходящих" json-документов
+                if not found:
+                    typer.echo("[FOUND]:")
+                found += 1
+                typer.echo(json_document)
+            if not found:
                 typer.echo("[SEARCH]: Not found json_documents.")
-            else:
-                typer.echo("[FOUND]:")
-                for json_document in json_documents:
-                    typer.echo(json_document)
+        except Exception as error:
+            typer.echo(f"[ERROR]: {type(error).__name__}: {error}")
+            raise typer.Exit(1)
+
+    def _projection(self, fields: str):
+        if fields is None:
+            return None
+        projection = [field.strip() for field in fields.split(",") if field.strip()]
+        return projection or None
+
+    def explain(self, query: str, fields: str = None):
+        # Вывод плана выполнения запроса (какие индексы выбраны, оценка и фактическое число строк).
+        # Пример 1: python -m code.cli_core db mydb/users explain "{'age': {'@gt': 18}}"
+        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users explain "{'age': {'@gt': 18}}"
+        if not query.strip():
+            typer.echo("[ERROR]: Empty query.")
+            raise typer.Exit(1)
+
+        try:
+            lines = self.database.explain(query, self._projection(fields))
+            typer.echo("[PLAN]:")
+            for line in lines:
+                typer.echo(line)
+            return lines
+        except Exception as error:
+            typer.echo(f"[ERROR]: {type(error).__name__}: {error}")
+            raise typer.Exit(1)
+
+    def aggregate(self, query: str, group: str = None, count: bool = False, sums: str = None, avgs: str = None,
+                  mins: str = None, maxs: str = None):
+        # Агрегаты по подходящим документам. Поля перечисляются через запятую; результат - строка на группу:
+        # {"status": "paid", "count": 10, "sum(amount)": 120.5}. Без агрегатов считается число документов.
+        # Пример 1: python -m code.cli_core db mydb/orders aggregate "{}" --group status --count
+        # Пример 2: python -m code.cli_core db mydb/orders aggregate "{'status': 'paid'}" --sum amount --min amount --max amount
+        if not query.strip():
+            typer.echo("[ERROR]: Empty query.")
+            raise typer.Exit(1)
+
+        aggregations = {"count": {"@count": "*"}} if count else {}
+        for operator, fields in (("sum", sums), ("avg", avgs), ("min", mins), ("max", maxs)):
+            for field in self._projection(fields) or []:
+                aggregations[f"{operator}({field})"] = {f"@{operator}": field}
+        if not aggregations:
+            aggregations = {"count": {"@count": "*"}}
+
+        try:
+            rows = self.database.aggregate(query, aggregations, self._projection(group))
+            typer.echo("[AGGREGATE]:")
+            for row in rows:
+                typer.echo(row)
+            return rows
         except Exception as error:
             typer.echo(f"[ERROR]: {type(error).__name__}: {error}")
             raise typer.Exit(1)
@@ -161,8 +270,31 @@ db_app = typer.Typer()
 
 @app.callback()
 def main(ctx: typer.Context, storage_path: str = typer.Option("./databases", "--storage-path", "-p",
-                                                              help="Path to database storage directory.")):
-    ctx.obj = {"storage_path": storage_path}
+                                                              help="Path to database storage directory."),
+         server: str = typer.Option(None, "--server", "-s",
+                                    help="Send db commands to a running 'serve' process: 'host:port' or a Unix socket path.")):
+    ctx.obj = {"storage_path": storage_path, "server": server}
+
+
+@app.command("serve", help="Keep databases open and answer requests over a local socket (JSON lines).")
+def serve(ctx: typer.Context,
+          host: str = typer.Option(DEFAULT_HOST, help="Address to listen on (localhost by default)."),
+          port: int = typer.Option(DEFAULT_PORT, help="TCP port to listen on."),
+          socket_path: str = typer.Option(None, "--socket", help="Listen on a Unix socket at this path instead of TCP."),
+          threads: int = typer.Option(DEFAULT_THREADS, help="Worker threads for requests (reads of one collection run in parallel).")):
+    # Сервер: базы данных открываются один раз и остаются в памяти вместе с индексами и кэшем документов.
+    # Пример 1: python -m code.cli_core serve --port 7433
+    # Пример 2: python -m code.cli_core --server 127.0.0.1:7433 db mydb/users condition "{'age': 18}"
+    from code.server import Server
+
+    server = Server(ctx.obj["storage_path"], host, port, socket_path, threads)
+    typer.echo(f"[SERVING]: '{ctx.obj['storage_path']}' at {server.address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
 
 
 @app.command("list", help="Show databases.")
@@ -186,7 +318,11 @@ def delete_db(database_name: str, ctx: typer.Context):
 @db_app.callback()
 def db_callback(ctx: typer.Context,
                 database_and_collection: str = typer.Argument(..., help="Format: 'database_name/current_collection'"),
-                path_to_storage: str = typer.Option(None, help="Path to database storage directory.")):
+                path_to_storage: str = typer.Option(None, help="Path to database storage directory."),
+                engine: str = typer.Option(None, help="Storage engine for a new collection: 'files' or 'segments'."),
+                document_format: str = typer.Option(None, "--format",
+                                                    help="Document format for a new collection: 'json', 'compact' or 'binary'."),
+                workers: int = typer.Option(None, help="Processes for full collection scans (default: 'scan_workers' in collection.conf, 1).")):
     # Если параметр path_to_storage не указан явно для команды db, берем глобальное значение
     if path_to_storage is None:
         path_to_storage = ctx.obj["storage_path"]
@@ -195,7 +331,15 @@ def db_callback(ctx: typer.Context,
         typer.echo("[ERROR]: Please use format 'database_name/current_collection'")
         raise typer.Exit(1)
     current_database, current_collection = database_and_collection.split("/", 1)
-    ctx.obj = DB(current_database, path_to_storage, current_collection)
+
+    client = None
+    if ctx.obj["server"] is not None:
+        try:
+            client = Client.from_address(ctx.obj["server"])
+        except OSError as error:
+            typer.echo(f"[ERROR]: Server '{ctx.obj['server']}' is not available: {error}")
+            raise typer.Exit(1)
+    ctx.obj = DB(current_database, path_to_storage, current_collection, engine, workers, client, document_format)
 
 
 @db_app.command("insert", help="Insert json-object in collection.")
@@ -203,19 +347,61 @@ def insert(ctx: typer.Context, string: str):
     ctx.obj.insert(string)
 
 
+@db_app.command("import", help="Insert json-objects from a JSON array or JSON Lines file.")
+def import_file(ctx: typer.Context, path_to_file: str,
+                batch_size: int = typer.Option(1000, help="Documents written per batch.")):
+    ctx.obj.import_file(path_to_file, batch_size)
+
+
 @db_app.command("delete", help="Delete json-object in collection.")
 def delete(ctx: typer.Context, filename: str):
     ctx.obj.delete(filename)
 
 
 @db_app.command("index", help="Index json-object in collection.")
-def index(ctx: typer.Context, field: str):
-    ctx.obj.index(field)
+def index(ctx: typer.Context, field: str,
+          pin: bool = typer.Option(None, "--pin/--no-pin", help="Keep the whole index in memory once it is opened."),
+          order: int = typer.Option(None, help="B-tree order t: nodes hold t-1 .. 2t-1 keys (default 32)."),
+          tree: str = typer.Option(None, help="Index tree: 'btree' or 'bplus' (B+ tree with linked leaves)."),
+          date: bool = typer.Option(None, "--date/--no-date", help="Index the field as ISO dates: @year/@month/@day use the index.")):
+    ctx.obj.index(field, pin, order, tree, date)
+
+
+@db_app.command("compact", help="Compact collection storage.")
+def compact(ctx: typer.Context):
+    ctx.obj.compact()
+
+
+@db_app.command("checkpoint", help="Flush index changes from the write-ahead log to disk and clear the log.")
+def checkpoint(ctx: typer.Context):
+    ctx.obj.checkpoint()
 
 
 @db_app.command("condition", help="Search by condition in collection.")
-def search_by_condition(ctx: typer.Context, query: str):
-    ctx.obj.search_by_condition(query)
+def search_by_condition(ctx: typer.Context, query: str,
+                        limit: int = typer.Option(None, help="Stop after this many documents."),
+                        skip: int = typer.Option(None, help="Skip this many matching documents first."),
+                        fields: str = typer.Option(None, help="Comma-separated fields to output instead of whole documents ('_id' - document id)."),
+                        sort: str = typer.Option(None, help="Field to order results by (uses its index when there is one)."),
+                        desc: bool = typer.Option(False, "--desc", help="Order by --sort field descending.")):
+    ctx.obj.search_by_condition(query, limit, skip, fields, sort, desc)
+
+@db_app.command("explain", help="Show query plan with estimated and actual rows.")
+def explain(ctx: typer.Context, query: str,
+            fields: str = typer.Option(None, help="Comma-separated fields to output (index-only plans are shown when covered).")):
+    ctx.obj.explain(query, fields)
+
+
+@db_app.command("aggregate", help="Count/sum/avg/min/max over matching documents, optionally per group.")
+def aggregate(ctx: typer.Context, query: str,
+              group: str = typer.Option(None, help="Comma-separated fields to group by."),
+              count: bool = typer.Option(False, "--count", help="Count documents (the default when nothing else is asked)."),
+              sum_: str = typer.Option(None, "--sum", help="Comma-separated fields to sum."),
+              avg: str = typer.Option(None, "--avg", help="Comma-separated fields to average."),
+              min_: str = typer.Option(None, "--min", help="Comma-separated fields to take the minimum of."),
+              max_: str = typer.Option(None, "--max", help="Comma-separated fields to take the maximum of.")):
+    ctx.obj.aggregate(query, group, count, sum_, avg, min_, max_)
+
 
 @db_app.command("list_jsons", help="Show jsons in collection.")
 def list_jsons(ctx: typer.Context):
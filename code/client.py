@@ -0,0 +1,112 @@
+import os
+import json
+import socket
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7433
+DEFAULT_THREADS = 8     # Потоки сервера, в которых выполняются запросы (чтение файлов и индексов блокирующее)
+
+
+class ServerError(Exception):
+    # Ошибка, которую вернул сервер (текст - "ТипОшибки: сообщение")
+    pass
+
+
+class Client:
+    # Клиент сервера (python -m code.cli_core serve): одно соединение, запросы и ответы - строки JSON.
+    # Использует только стандартную библиотеку, поэтому не загружает ни коллекции, ни индексы.
+    # with Client(port=7433) as client: client.request("search", "mydb/users", query={"age": 18})
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str = None, timeout: float = None):
+        if socket_path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(socket_path)
+        else:
+            self.socket = socket.create_connection((host, port), timeout)
+        self.file = self.socket.makefile("rwb")
+
+    @staticmethod
+    def from_address(address: str, timeout: float = None):
+        # "host:port" или ":port" - TCP, иначе - путь к Unix-сокету
+        host, separator, port = address.rpartition(":")
+        if separator and port.isdigit():
+            return Client(host or DEFAULT_HOST, int(port), timeout=timeout)
+        return Client(socket_path=address, timeout=timeout)
+
+    def request(self, operation: str, database: str = None, **arguments):
+        # Отправляет запрос и возвращает result ответа; ошибка на сервере - ServerError
+        request = {"op": operation, **arguments}
+        if database is not None:
+            request["db"] = database
+        self.file.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.file.flush()
+
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise ServerError(response.get("error"))
+        return response.get("result")
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RemoteDatabase:
+    # Те же методы, что у Database, но каждый - запрос к серверу (для режима клиента в CLI)
+
+    def __init__(self, client: Client, name: str, engine: str = None, workers: int = None, document_format: str = None):
+        self.client = client
+        self.name = name    # "база/коллекция"
+        self.options = {key: value for key, value in (("engine", engine), ("workers", workers), ("format", document_format))
+                        if value is not None}
+
+    def _request(self, operation: str, **arguments):
+        return self.client.request(operation, self.name, **self.options, **arguments)
+
+    def insert(self, string: str) -> str:
+        return self._request("insert", document=string)
+
+    def insert_many(self, string: str) -> list:
+        return self._request("insert_many", documents=string)
+
+    def import_file(self, path_to_file: str, batch_size: int = 1000) -> int:
+        # Файл читает сервер - путь передаётся абсолютным
+        return self._request("import", path=os.path.abspath(path_to_file), batch_size=batch_size)
+
+    def delete(self, filename: str) -> str:
+        return self._request("delete", id=filename)
+
+    def index(self, field: str, pin: bool = None, order: int = None, tree: str = None, date: bool = None) -> int:
+        return self._request("index", field=field, pin=pin, order=order, tree=tree, date=date)
+
+    def compact(self) -> int:
+        return self._request("compact")
+
+    def checkpoint(self):
+        return self._request("checkpoint")
+
+    def search_by_condition(self, query: str, limit: int = None, skip: int = None, projection: list = None,
+                            sort=None) -> list:
+        return self.search(query, limit, skip, projection, sort)
+
+    def search(self, query: str, limit: int = None, skip: int = None, projection: list = None, sort=None) -> list:
+        return self._request("search", query=query, limit=limit, skip=skip, projection=projection, sort=sort)
+
+    def explain(self, query: str, projection: list = None) -> list:
+        return self._request("explain", query=query, projection=projection)
+
+    def aggregate(self, query: str, aggregations: dict, group_by=None) -> list:
+        return self._request("aggregate", query=query, aggregations=aggregations, group_by=group_by)
+
+    def get_filenames(self) -> list:
+        return [(filename, None) for filename in self._request("list_jsons")]  # Как у Database: пары (id, документ)
@@ -1,23 +1,168 @@
 import os
+import re
 import uuid
 import json
+import functools
+import itertools
+import logging
+import multiprocessing
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 import jsonpath_ng
 import jsonpath_ng.exceptions
 
-from code.query_engine import QueryEngine
+from code.query_engine import QueryEngine, split_options, parse_sort, ID_FIELD
 from code.indexation import Indexation
+from code.query_planner import QueryPlanner
+from code.aggregation import Aggregation
+from code.storage import STORAGE_ENGINES
+from code.document_format import DOCUMENT_FORMATS
+from code.document_cache import DEFAULT_CACHE_BYTES
+from code.locks import FileLock
+from code.wal import WriteAheadLog, DEFAULT_CHECKPOINT_BYTES
+
+PLAIN_KEY = re.compile(r"[A-Za-z_][A-Za-z0-9_\-]*")   # Ключ, который jsonpath_ng разбирает как обычное имя поля
+JSONPATH_RESERVED_WORDS = ("where", "wherenot")
+
+PARTITIONS_PER_WORKER = 4       # Частей на обработчик при параллельном переборе (быстрые обработчики берут следующие части)
+MIN_PARALLEL_DOCUMENTS = 2000   # Коллекции меньше этого перебираются в одном процессе - запуск обработчиков дороже перебора
+
+_executors = {}                 # {число обработчиков: ProcessPoolExecutor} - пулы создаются один раз на процесс
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_field(field: str):
+    # Возвращает функцию json_document -> [значения по пути field]; результат кэшируется по строке пути.
+    # Простые пути вида "address.city" разбираются прямым обходом словарей без jsonpath_ng
+
+    parts = field.split(".")
+    if all(PLAIN_KEY.fullmatch(part) and part not in JSONPATH_RESERVED_WORDS for part in parts):
+        def find(json_document) -> list:
+            value = json_document
+            for part in parts:
+                if not isinstance(value, dict) or part not in value:
+                    return []
+                value = value[part]
+            return [value]
+
+        return find
+
+    try:
+        expression = jsonpath_ng.parse(field)
+    except jsonpath_ng.exceptions.JsonPathParserError:  # Некорректный синтаксис пути
+        return lambda json_document: []
+    return lambda json_document: [match.value for match in expression.find(json_document)]
+
+
+def query_fields(query: dict):
+    # Поля верхнего уровня, значения которых читает запрос ("address.city" -> "address"); None - путь jsonpath_ng,
+    # которому может понадобиться любое поле
+    fields = set()
+    for field, condition in query.items():
+        if field in ("@and", "@or"):
+            sub_queries = condition
+        elif field == "@not":
+            sub_queries = [condition]
+        else:
+            parts = field.split(".")
+            if not all(PLAIN_KEY.fullmatch(part) and part not in JSONPATH_RESERVED_WORDS for part in parts):
+                return None
+            fields.add(parts[0])
+            continue
+        for sub_query in sub_queries:
+            sub_fields = query_fields(sub_query)
+            if sub_fields is None:
+                return None
+            fields |= sub_fields
+    return fields
+
+
+def _scan_partition(engine: str, document_format: str, path_to_collection: str, partition: list, query: dict) -> list:
+    # Выполняется в процессе-обработчике: читает одну часть коллекции и возвращает подходящие пары (id, json-документ).
+    # Запрос - обычный словарь, поэтому он передаётся в обработчик и компилируется там
+    predicate = QueryEngine(Collection).parse_query(query) if query else None   # Скомпилированные запросы кэшируются в обработчике
+    fields = query_fields(query) if query else None
+    return list(STORAGE_ENGINES[engine].read_partition(path_to_collection, partition, document_format, predicate, fields))
+
+
+def _executor(workers: int) -> ProcessPoolExecutor:
+    # Обработчики запускаются через spawn, а не fork: пул создаётся при первом большом переборе, и в сервере в этот момент
+    # другие потоки могут держать блокировки (кэша, страниц индексов) - скопированная fork-ом занятая блокировка повесит обработчик
+    if workers not in _executors:
+        _executors[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _executors[workers]
 
 
 class Collection:
-    def __init__(self, path_to_collection: str):
+    def __init__(self, path_to_collection: str, engine: str = None, document_format: str = None):
         self.path_to_collection = path_to_collection
 
         self.path_to_indexes = os.path.join(self.path_to_collection, "./indexes")
         os.makedirs(self.path_to_indexes,
                     exist_ok=True)  # Создаст path_to_indexes если его нет, либо проигнорирует, есть пусть уже создан
 
+        self.settings = self._load_settings(engine, document_format)
+        # Кэш прочитанных документов: размер в байтах - параметр "cache_bytes" в collection.conf (0 - без кэша)
+        self.storage = STORAGE_ENGINES[self.settings["engine"]](self.path_to_collection,
+                                                                self.settings.get("cache_bytes", DEFAULT_CACHE_BYTES),
+                                                                self.settings["format"])
+        self.scan_workers = self.settings.get("scan_workers", 1)  # Процессов для полного перебора (1 - перебор в текущем процессе)
+
+        # Чтение коллекции - под общей блокировкой, изменения документов и индексов - под исключительной (и между процессами)
+        self.lock = FileLock(os.path.join(self.path_to_collection, "collection.lock"))
+        # Изменения сначала пишутся в журнал; "wal_sync": false - без fsync журнала на каждую запись,
+        # "wal_checkpoint_bytes" - размер журнала, после которого индексы и документы сбрасываются на диск
+        self.wal = WriteAheadLog(os.path.join(self.path_to_collection, "wal.log"), self.settings.get("wal_sync", True))
+        self.checkpoint_bytes = self.settings.get("wal_checkpoint_bytes", DEFAULT_CHECKPOINT_BYTES)
+        self.pending = []       # Группы изменений, ждущие записи в журнал (см. _write)
+        self.pending_lock = threading.Lock()
         self.query_engine = QueryEngine(self)
         self.indexation = Indexation(self)
+        self.query_planner = QueryPlanner(self)
+        # Записи журнала, не попавшие в контрольную точку (после сбоя), применяются заново. Открытие берёт общую блокировку
+        # и не ждёт читателей из других процессов - исключительная нужна, только если журнал не пуст (см. reading)
+        with self.reading():
+            pass
+
+    def _load_settings(self, engine: str = None, document_format: str = None) -> dict:
+        # Настройки коллекции хранятся в collection.conf; engine - способ хранения документов (см. code.storage),
+        # document_format - формат документов: json (с отступами), compact (JSON без пробелов), binary (см. code.document_format).
+        # Способ хранения и формат выбираются только при создании коллекции
+
+        path_to_settings = os.path.join(self.path_to_collection, "collection.conf")
+        if os.path.exists(path_to_settings):
+            with open(path_to_settings, encoding="utf-8") as file:
+                settings = json.load(file)
+        else:
+            settings = {"engine": "files"}
+        settings.setdefault("format", "json")  # Коллекции, созданные до появления форматов
+
+        created = not os.path.exists(path_to_settings) and not any(
+            file.endswith((".json", ".bin")) for file in os.listdir(self.path_to_collection))
+        changed = False
+        for key, value, choices, title in (("engine", engine, STORAGE_ENGINES, "storage engine"),
+                                           ("format", document_format, DOCUMENT_FORMATS, "document format")):
+            if value is None or value == settings[key]:
+                continue
+            if value not in choices:
+                raise ValueError(f"Unknown {title} '{value}'. Available: {', '.join(choices)}")
+            if not created:
+                raise ValueError(f"Collection already uses {title} '{settings[key]}'")
+            settings[key] = value
+            changed = True
+        if changed:
+            self.save_settings(settings)
+        return settings
+
+    def save_settings(self, settings: dict = None):
+        if settings is None:
+            settings = self.settings
+        path_to_settings = os.path.join(self.path_to_collection, "collection.conf")
+        with open(path_to_settings, "w", encoding="utf-8") as file:
+            json.dump(settings, file, indent=2, ensure_ascii=False)
 
     def insert(self, json_document: dict) -> str:
         # Вставка json-объекта в выбранную базу данных.
@@ -26,88 +171,288 @@ class Collection:
 
         filename = str(uuid.uuid4())  # Генерация уникального id документа
 
-        path_to_json_document = os.path.join(self.path_to_collection, f"{filename}.json")
-        with open(path_to_json_document, "w", encoding="utf-8") as file:
-            json.dump(json_document, file, indent=2, ensure_ascii=False)
+        self._write([("insert", filename, json_document)])  # Индексы тоже поддерживаются в актуальном состоянии
         return filename
 
+    def insert_many(self, json_documents) -> list:
+        # Пакетная вставка json-объектов: документы пишутся в хранилище и в индексы одной пачкой.
+        # Возвращает список id в порядке вставки
+
+        documents = [(str(uuid.uuid4()), json_document) for json_document in json_documents]
+        self._write([("insert", filename, json_document) for filename, json_document in documents])
+        return [filename for filename, _ in documents]
+
     def delete(self, filename: str) -> str:
         # Удаление json-объекта из выбранной базы данных.
         # Пример 1: python cli_core.py db mydb/users delete "{'name': 'Иван', 'age': 18}"
         # Пример 2: python cli_core.py --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users delete "{'name': 'Иван', 'age': 18}"
 
-        path_to_json_document = os.path.join(self.path_to_collection, f"{filename}.json")
-        if not os.path.exists(path_to_json_document):
-            raise FileNotFoundError
-        self.indexation.remove_from_index(filename)
-        os.remove(path_to_json_document)
-        return path_to_json_document
+        return self._write([("delete", filename)])[0]
+
+    def compact(self) -> int:
+        # Сжатие хранилища коллекции (удаление из сегментов удалённых документов).
+        # Пример: python cli_core.py db mydb/users compact
+        with self.writing():
+            return self.storage.compact()  # Возвращает количество освобождённых байт
+
+    def checkpoint(self):
+        # Контрольная точка: документы и изменённые страницы индексов сбрасываются на диск, журнал очищается.
+        # Делается сама, когда журнал вырастает до checkpoint_bytes; перед выходом её стоит сделать явно,
+        # чтобы следующему открытию коллекции не пришлось применять журнал
+        with self.writing():
+            self._checkpoint()
+
+    @contextmanager
+    def reading(self):
+        # Общая блокировка коллекции. Если журнал дописал другой процесс, его изменения сначала применяются здесь
+        with self.lock.read():
+            if self.wal.behind():
+                with self.lock.write():
+                    self._recover()
+            yield
 
-    def search_by_condition(self, query: dict) -> list:
+    @contextmanager
+    def writing(self):
+        # Исключительная блокировка коллекции (с применением чужих записей журнала, как в reading)
+        with self.lock.write():
+            if self.wal.behind():
+                self._recover()
+            yield
+
+    def _write(self, operations: list) -> list:
+        # Групповая запись: потоки ставят свои изменения в очередь, первый получивший блокировку пишет в журнал всю очередь
+        # одним fsync и применяет её; остальные находят свои изменения уже выполненными. Возвращает результаты операций
+        group = {"operations": operations, "results": None, "error": None, "done": False}
+        with self.pending_lock:
+            self.pending.append(group)
+        with self.writing():
+            if not group["done"]:
+                with self.pending_lock:
+                    groups, self.pending = self.pending, []
+                self._commit(groups)
+        if group["error"] is not None:
+            raise group["error"]
+        return group["results"]
+
+    def _commit(self, groups: list):
+        # Группы с ошибкой (удаление несуществующего документа, ключи, несравнимые с ключами индекса) отсеиваются
+        # до записи в журнал: запись журнала, которую нельзя применить, повторялась бы при каждом открытии коллекции
+        try:
+            deleted = set()
+            references = {}     # Ключи индексов из уже принятых групп - ключи следующих групп должны быть сравнимы и с ними
+            valid = []
+            for group in groups:
+                filenames = [operation[1] for operation in group["operations"] if operation[0] == "delete"]
+                if any(filename in deleted or not self.storage.exists(filename) for filename in filenames):
+                    group["error"] = FileNotFoundError()
+                    continue
+                try:
+                    group["entries"] = self.indexation.index_entries(self._documents(group["operations"]), references)
+                except TypeError as error:
+                    group["error"] = error
+                    continue
+                deleted.update(filenames)
+                valid.append(group)
+
+            self.wal.append([operation for group in valid for operation in group["operations"]])
+            for group in valid:
+                group["results"] = self._apply(group["operations"], group["entries"])
+            if self.wal.size >= self.checkpoint_bytes:
+                self._checkpoint()
+        except Exception as error:
+            for group in groups:
+                if group["results"] is None and group["error"] is None:
+                    group["error"] = error
+            raise
+        finally:
+            for group in groups:
+                group["done"] = True
+
+    @staticmethod
+    def _documents(operations: list) -> list:
+        return [(operation[1], operation[2]) for operation in operations if operation[0] == "insert"]
+
+    def _apply(self, operations: list, entries: list) -> list:
+        # Применяет записанные в журнал операции к хранилищу и индексам (страницы индексов меняются только в памяти).
+        # entries - ключи вставляемых документов, заранее проверенные index_entries
+        documents = self._documents(operations)
+        if documents:
+            self.storage.insert_many(documents)
+            self.indexation.add_index_entries(entries)
+        results = []
+        for operation in operations:
+            if operation[0] == "insert":
+                results.append(operation[1])
+            else:
+                self.indexation.remove_from_index(operation[1])
+                results.append(self.storage.delete(operation[1]))
+        return results
+
+    def _recover(self):
+        # Повторяет операции журнала после последней контрольной точки (все они идемпотентны) и делает контрольную точку.
+        # Если журнал содержит начало контрольной точки, индексы могли быть записаны наполовину - они строятся заново.
+        # Запись, которую применить нельзя (например, журнал старой версии с ключом, несравнимым с ключами индекса),
+        # не останавливает открытие коллекции: она переносится в wal.rejected, документ этой вставки удаляется
+        operations = self.wal.records()
+        rebuild = any(operation[0] == "checkpoint" for operation in operations)
+        self.storage.refresh()
+        rejected = []
+        for operation in operations:
+            try:
+                self._replay(operation, rebuild)
+            except Exception as error:
+                logger.warning("Skipping write-ahead log record %r of '%s': %s: %s", operation[:2],
+                               self.path_to_collection, type(error).__name__, error)
+                rejected.append(operation)
+                if operation[0] == "insert":
+                    self.indexation.remove_from_index(operation[1])
+                    if self.storage.exists(operation[1]):
+                        self.storage.delete(operation[1])
+        if rejected:
+            WriteAheadLog(os.path.join(self.path_to_collection, "wal.rejected"), self.wal.sync).append(rejected)
+        if rebuild:
+            for field in list(self.indexation.indexes):
+                self.indexation.create_index(field)
+        self._checkpoint()
+
+    def _replay(self, operation: tuple, rebuild: bool):
+        if operation[0] == "insert":
+            entries = self.indexation.index_entries([(operation[1], operation[2])])
+            self.storage.restore(operation[1], operation[2])
+            if not rebuild:
+                self.indexation.remove_from_index(operation[1])
+                self.indexation.add_index_entries(entries)
+        elif operation[0] == "delete":
+            if self.storage.exists(operation[1]):
+                self.storage.delete(operation[1])
+            if not rebuild:
+                self.indexation.remove_from_index(operation[1])
+
+    def _checkpoint(self):
+        if not self.wal.size:
+            return
+        self.wal.append([("checkpoint",)])
+        self.storage.sync()
+        self.indexation.flush()
+        self.wal.truncate()
+
+    def search_by_condition(self, query: dict, limit: int = None, skip: int = None, projection: list = None,
+                            sort=None) -> list:
         # Поиск json-документов по заданному условию в выбранной базе данных.
         # Пример 1: python cli_core.py db mydb/users condition "{'age': {'@eq': 18}}"
         # Пример 2: python cli_core.py --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users condition "{'age': {'@eq': 18}}"
 
-        indexes = self.indexation.get_indexes()
-        indexed_fields = []  # проиндексированные поля, которые содержатся в запросе
-        for field in query:
-            if field in indexes:
-                indexed_fields.append(field)
-
-        query_func = self.query_engine.parse_query(query)
-
-        all_eq = True
-        for field in indexed_fields:
-            condition = query[field]
-            if isinstance(condition, dict):
-                operator, _ = next(iter(condition.items()))
-                if operator != "@eq":
-                    all_eq = False
-                    break
-
-        if all_eq:
-            matched_ids_sets = []
-            for field in indexed_fields:
-                matched_ids = self.indexation.indexed_search(field, query)
-                matched_ids_sets.append(set(matched_ids))
-            if matched_ids_sets:
-                filenames = set.intersection(*matched_ids_sets)
-            else:
-                filenames = set(filename for filename, _ in self.get_jsons())
-        else:
-            # Иначе — перебираем все файлы
-            filenames = set(filename for filename, _ in self.get_jsons())
+        return list(self.search(query, limit, skip, projection, sort))  # Список всех, подходящих под условие, json-документов
 
-        json_documents = []  # Список всех, подходящих под условие, json-документов
-        for filename in filenames:
-            json_document = self.get_json(filename)
-            if json_document and query_func(json_document):
-                json_documents.append(json_document)
-        return json_documents
+    def search(self, query: dict, limit: int = None, skip: int = None, projection: list = None, sort=None):
+        # Потоковый поиск: генератор подходящих json-документов по мере нахождения.
+        # limit/skip - сколько документов выдать и сколько пропустить сначала; их можно задать и в самом запросе:
+        # {"age": 18, "@limit": 10, "@skip": 20} (явно переданные аргументы важнее).
+        # После limit документов перебор останавливается - остальные документы не читаются.
+        # projection - список полей ["_id", "age", "address.city"]: вместо документов выдаются словари только с этими полями;
+        # если все поля проекции и условия покрыты индексами, документы не читаются вовсе.
+        # sort - порядок выдачи: "age" или ("age", "desc") (в запросе - "@sort"); по индексу поля, если он есть, иначе куча top-k
 
+        query, options = split_options(query)
+        limit = options.get("@limit") if limit is None else limit
+        skip = options.get("@skip", 0) if skip is None else skip
+        sort = options.get("@sort") if sort is None else parse_sort(sort)
+        if (limit is not None and limit < 0) or skip < 0:
+            raise ValueError("limit and skip must be non-negative")
+        if limit == 0:
+            return
+
+        count = None if limit is None else skip + limit
+        with self.reading():  # Пока идёт выдача, другие процессы не меняют коллекцию
+            plan = self.query_planner.plan(query, projection, sort, count)
+            yield from itertools.islice(plan.stream(), skip, count)
+
+    def project(self, filename: str, json_document: dict, projection: list) -> dict:
+        # Оставляет в документе только поля проекции
+        values = {field: self.get_value(json_document, field) for field in projection if field != ID_FIELD}
+        return self.make_projection(filename, values, projection)
+
+    @staticmethod
+    def make_projection(filename: str, values: dict, projection: list) -> dict:
+        # {field: [значения]} -> {field: значение}: одно значение выдаётся как есть, несколько - списком, поле без значений пропускается
+        result = {}
+        for field in projection:
+            if field == ID_FIELD:
+                result[ID_FIELD] = filename
+            elif values.get(field):
+                result[field] = values[field][0] if len(values[field]) == 1 else values[field]
+        return result
+
+    def explain(self, query: dict, projection: list = None) -> list:
+        # Выполняет запрос и возвращает строки выбранного плана с оценками и фактическим числом строк.
+        # Пример: python cli_core.py db mydb/users explain "{'age': {'@gt': 18}}"
+
+        query, options = split_options(query)
+        count = options.get("@limit")
+        if count is not None:
+            count += options.get("@skip", 0)
+        with self.reading():
+            plan = self.query_planner.plan(query, projection, options.get("@sort"), count)
+            for _ in itertools.islice(plan.stream(), count):  # Выполняется так же, как при поиске: до count документов
+                pass
+        return plan.explain()
+
+    def aggregate(self, query: dict, aggregations: dict, group_by=None) -> list:
+        # Агрегаты по подходящим документам: {"total": {"@sum": "amount"}, "n": {"@count": "*"}}, по группам group_by ("status").
+        # Документы перебираются один раз и не копятся в памяти; count и min/max по проиндексированным полям - из индексов.
+        # Пример: python -m code.cli_core db mydb/orders aggregate "{}" --group status --count --sum amount
+
+        query, options = split_options(query)
+        if options:
+            raise ValueError(f"{', '.join(options)} not supported in aggregation")
+        with self.reading():
+            return Aggregation(self, query, aggregations, group_by).run()
+
+    def get_filenames(self):    # Возвращает id всех json-документов в коллекции (без чтения документов)
+        return self.storage.get_filenames()
+
+    def get_empty_filenames(self):  # Возвращает id пустых документов ({}), которые перебор и поиск не выдают
+        return self.storage.empty_filenames()
 
     def get_jsons(self):    # Возвращает массив всех json-документов в коллекции
+        return self.scan()
+
+    def scan(self, query: dict = None, predicate=None):
+        # Полный перебор коллекции: генератор пар (id, json-документ), подходящих под query (None - все документы).
+        # При scan_workers > 1 части коллекции читаются и проверяются в пуле процессов, результаты приходят по мере готовности частей
+        # predicate - уже скомпилированный query для перебора в текущем процессе
 
-        for file in os.listdir(self.path_to_collection):
-            if file.endswith(".json"):
-                filename = file[:-len(".json")]    # Убираем ".json" в конце имени файла
-                json_document = self.get_json(filename)
-                if json_document:
-                    yield (filename, json_document)
+        with self.reading():
+            if self.scan_workers > 1:
+                partitions = self.storage.partitions(self.scan_workers * PARTITIONS_PER_WORKER)
+                if sum(len(partition) for partition in partitions) >= MIN_PARALLEL_DOCUMENTS:
+                    engine, document_format = self.settings["engine"], self.settings["format"]
+                    results = _executor(self.scan_workers).map(_scan_partition, [engine] * len(partitions),
+                                                               [document_format] * len(partitions),
+                                                               [self.path_to_collection] * len(partitions), partitions,
+                                                               [query] * len(partitions))
+                    for documents in results:
+                        yield from documents
+                    return
+
+            if predicate is None and query:
+                predicate = self.query_engine.parse_query(query)
+            # В формате binary документ сначала проверяется по одним полям запроса, целиком разбирается только подошедший
+            yield from self.storage.get_jsons(predicate, query_fields(query) if query else None)
 
     def get_json(self, filename: str):  # Возвращает json-документ
-        path_to_json_document = os.path.join(self.path_to_collection, f"{filename}.json")
-        if not os.path.exists(path_to_json_document):
-            return None
-        with open(path_to_json_document, encoding="utf-8") as file:
-            return json.load(file)
+        with self.reading():
+            return self.storage.get_json(filename)
+
+    def cache_stats(self) -> dict:  # Счётчики кэша документов: попадания, промахи, вытеснения, занятый размер
+        return self.storage.cache.stats()
 
-    def get_value(self, json_document, field: str) -> list:
-        # По заданному полю возвращает его значение
+    @staticmethod
+    def get_value(json_document, field: str) -> list:
+        # По заданному полю возвращает его значение (не зависит от коллекции - используется и в процессах-обработчиках)
 
         try:
-            matches = jsonpath_ng.parse(field).find(json_document)
-            values = [match.value for match in matches]
+            values = compile_field(field)(json_document)
             flattened = []
             for value in values:
                 if isinstance(value, list):
@@ -115,7 +460,5 @@ class Collection:
                 else:
                     flattened.append(value)
             return flattened
-        except jsonpath_ng.exceptions.JsonPathParserError as error:  # Некорректный синтаксис пути
-            return []
         except (AttributeError, KeyError, TypeError, IndexError) as error:
             return []
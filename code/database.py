@@ -6,12 +6,15 @@ from code.collection import Collection
 
 
 class Database:
-    def __init__(self, path_to_database, current_collection: str):
+    def __init__(self, path_to_database, current_collection: str, engine: str = None, workers: int = None,
+                 document_format: str = None):
         self.path_to_collection = os.path.join(path_to_database, current_collection)
         os.makedirs(self.path_to_collection,
                     exist_ok=True)  # Создаст path_to_collection если его нет, либо проигнорирует, есть пусть уже создан
 
-        self.collection = Collection(self.path_to_collection)
+        self.collection = Collection(self.path_to_collection, engine, document_format)
+        if workers is not None:     # Число процессов для полного перебора только на эту команду (иначе - из collection.conf)
+            self.collection.scan_workers = workers
         self.indexation = self.collection.indexation
 
     def insert(self, string: str) -> str:
@@ -28,6 +31,74 @@ class Database:
         except Exception as error:
             raise error
 
+    def insert_many(self, string: str) -> list:
+        # Вставка массива json-объектов в выбранную базу данных.
+        # Пример: Database(...).insert_many("[{'name': 'Иван'}, {'name': 'Пётр'}]")
+        try:
+            json_documents = json.loads(string)
+        except json.JSONDecodeError:
+            json_documents = ast.literal_eval(string)  # type(json_documents): list
+
+        if isinstance(json_documents, dict):
+            json_documents = [json_documents]
+        try:
+            return self.collection.insert_many(json_documents)  # Возвращает список id json-документов
+        except Exception as error:
+            raise error
+
+    def import_file(self, path_to_file: str, batch_size: int = 1000) -> int:
+        # Потоковая вставка json-объектов из файла (JSON-массив, JSON-объекты подряд или JSON Lines - .jsonl).
+        # Документы вставляются пачками по batch_size: одна запись в хранилище и в каждый индекс на пачку.
+        # Пример 1: python -m code.cli_core db mydb/users import users.json
+        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users import users.jsonl
+
+        count = 0
+        batch = []
+        for json_document in self._read_json_documents(path_to_file):
+            batch.append(json_document)
+            if len(batch) == batch_size:
+                count += len(self.collection.insert_many(batch))
+                batch = []
+        if batch:
+            count += len(self.collection.insert_many(batch))
+        return count  # Возвращает количество вставленных json-документов
+
+    def _read_json_documents(self, path_to_file: str, chunk_size: int = 1024 * 1024):
+        # Читает json-объекты из файла по одному, не загружая файл целиком в память
+
+        with open(path_to_file, encoding="utf-8") as file:
+            if path_to_file.endswith(".jsonl"):
+                for line in file:
+                    if line.strip():
+                        yield json.loads(line)
+                return
+
+            decoder = json.JSONDecoder()
+            buffer = file.read(chunk_size).lstrip()
+            in_array = buffer.startswith("[")
+            position = 1 if in_array else 0
+            eof = False
+            while True:
+                while position < len(buffer) and (buffer[position].isspace() or (in_array and buffer[position] == ",")):
+                    position += 1                                               # Пропускаем разделители между элементами массива
+                if position == len(buffer) and not eof:
+                    buffer = file.read(chunk_size)
+                    position = 0
+                    eof = not buffer
+                    continue
+                if position == len(buffer) or (in_array and buffer[position] == "]"):
+                    return
+                try:
+                    json_document, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    chunk = "" if eof else file.read(chunk_size)
+                    if not chunk:                                               # Документ не дописан до конца файла
+                        raise
+                    buffer = buffer[position:] + chunk                          # Документ не поместился в буфер - дочитываем
+                    position = 0
+                    continue
+                yield json_document     # Вне массива файл может содержать несколько объектов подряд, разделённых пробелами
+
     def delete(self, filename: str) -> str:
         # Удаление json-файла из выбранной базы данных.
         # Пример 1: python -m code.cli_core db mydb/users delete "531b4cdd-bc58-4aa9-aca5-5d1b7c44715f"
@@ -38,19 +109,57 @@ class Database:
         except Exception as error:
             raise error
 
-    def index(self, field: str) -> int:
+    def index(self, field: str, pin: bool = None, order: int = None, tree: str = None, date: bool = None) -> int:
         # Индексация выбранного поля по всем json-объектам в выбранной базе данных.
         # Пример 1: python -m code.cli_core db mydb/users index age
-        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users index age
+        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users index age --order 64 --tree bplus
+        # Пример 3: python -m code.cli_core db mydb/events index created --date
+        try:
+            return self.indexation.create_index(field, pin, order, tree, date)  # Возвращает количество проиндексированных значений
+        except Exception as error:
+            raise error
+
+    def compact(self) -> int:
+        # Сжатие хранилища коллекции.
+        # Пример 1: python -m code.cli_core db mydb/users compact
+        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users compact
+        try:
+            return self.collection.compact()  # Возвращает количество освобождённых байт
+        except Exception as error:
+            raise error
+
+    def checkpoint(self):
+        # Контрольная точка: индексы и документы сбрасываются на диск, журнал коллекции очищается.
+        # Пример: python -m code.cli_core db mydb/users checkpoint
         try:
-            return self.indexation.create_index(field)  # Возвращает количество проиндексированных значений
+            return self.collection.checkpoint()
         except Exception as error:
             raise error
 
-    def search_by_condition(self, query: str) -> list:
+    def search_by_condition(self, query: str, limit: int = None, skip: int = None, projection: list = None,
+                            sort=None) -> list:
         # Поиск json-документов по заданному условию в выбранной базе данных.
         # Пример 1: python -m code.cli_core db mydb/users condition "{'age': {'@eq': 18}}"
-        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users condition "{'age': {'@eq': 18}}"
+        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users condition "{'age': {'@eq': 18}}" --limit 10
+
+        return list(self.search(query, limit, skip, projection, sort))  # Возвращает список "подходящих" json-документов
+
+    def search(self, query: str, limit: int = None, skip: int = None, projection: list = None, sort=None):
+        # Потоковый поиск: генератор "подходящих" json-документов по мере нахождения
+        # projection - список полей для выдачи, например ["_id", "age"] (None - документы целиком)
+        # sort - порядок выдачи: "age" или ("age", "desc")
+
+        try:
+            query_dict = json.loads(query)
+        except json.JSONDecodeError:
+            query_dict = ast.literal_eval(query)  # type(query_dict): dict
+
+        return self.collection.search(query_dict, limit, skip, projection, sort)
+
+    def explain(self, query: str, projection: list = None) -> list:
+        # План выполнения запроса с оценкой и фактическим числом строк на каждом шаге.
+        # Пример 1: python -m code.cli_core db mydb/users explain "{'age': {'@gt': 18}}"
+        # Пример 2: python -m code.cli_core --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users explain "{'age': {'@gt': 18}}"
 
         try:
             query_dict = json.loads(query)
@@ -58,10 +167,22 @@ class Database:
             query_dict = ast.literal_eval(query)  # type(query_dict): dict
 
         try:
-            return self.collection.search_by_condition(query_dict)  # Возвращает список "подходящих" json-документов
+            return self.collection.explain(query_dict, projection)  # Возвращает строки плана
         except Exception as error:
             raise error
 
+    def aggregate(self, query: str, aggregations: dict, group_by=None) -> list:
+        # Агрегаты (count/sum/avg/min/max) по подходящим документам, по группам group_by.
+        # Пример 1: python -m code.cli_core db mydb/orders aggregate "{}" --group status --count
+        # Пример 2: python -m code.cli_core db mydb/orders aggregate "{'status': 'paid'}" --sum amount --avg amount
+
+        try:
+            query_dict = json.loads(query)
+        except json.JSONDecodeError:
+            query_dict = ast.literal_eval(query)  # type(query_dict): dict
+
+        return self.collection.aggregate(query_dict, aggregations, group_by)  # Возвращает строки результата
+
     def get_filenames(self) -> list:
         # Вывод списка всех json-документов в заданной коллекции.
         # Пример 1: python -m code.cli_core list_jsons
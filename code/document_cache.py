@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024     # Размер кэша документов коллекции по умолчанию (0 - кэш выключен)
+
+
+class DocumentCache:
+    # LRU-кэш разобранных json-документов, ограниченный суммарным размером документов в хранилище (в байтах JSON).
+    # Запись хранит версию документа (время изменения и размер файла, место записи в сегменте): если версия в хранилище
+    # другая, запись устарела и документ читается заново. Кэш хранит свою копию документа и отдаёт копии:
+    # изменение выданного документа не меняет следующие чтения.
+    # Счётчики hits/misses/evictions показывают, насколько кэш помогает
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # {id: (версия, документ, размер)} от давно использованных к недавним
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, filename: str, version):
+        # Документ из кэша или None, если его нет или версия не совпала
+        with self.lock:
+            entry = self.entries.get(filename)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(filename)
+            self.hits += 1
+            json_document = entry[1]
+        return _copy(json_document)
+
+    def put(self, filename: str, version, json_document: dict, size: int, evict: bool = True):
+        # evict=False - документ добавляется, только если для него есть свободное место
+        # (полный перебор коллекции не вытесняет часто читаемые документы)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self._discard(filename)
+            if not evict and self.size + size > self.max_bytes:
+                return
+            self.entries[filename] = (version, _copy(json_document), size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def discard(self, filename: str):
+        with self.lock:
+            self._discard(filename)
+
+    def _discard(self, filename: str):
+        entry = self.entries.pop(filename, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "documents": len(self.entries), "bytes": self.size, "max_bytes": self.max_bytes}
+
+
+def _copy(value):
+    # Глубокая копия json-значения: заново создаются только словари и списки (быстрее copy.deepcopy)
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
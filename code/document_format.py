@@ -0,0 +1,189 @@
+import json
+import struct
+
+BINARY_HEADER = struct.Struct("<II")    # Начало документа в формате binary: число полей и длина списка имён полей
+
+
+class JsonFormat:
+    # Документ - текст JSON в UTF-8. indent=2 - исходный формат коллекций (удобно читать файлы глазами), None - без пробелов
+    PARTIAL = False     # Отдельные поля без разбора всего документа не читаются
+    TEXT = True         # Текст (без indent - в одну строку)
+    EXTENSION = ".json"
+
+    def __init__(self, indent: int = None):
+        self.indent = indent
+        self.separators = None if indent else (",", ":")
+
+    def dumps(self, json_document) -> bytes:
+        return json.dumps(json_document, indent=self.indent, separators=self.separators, ensure_ascii=False).encode("utf-8")
+
+    def loads(self, data: bytes, fields=None):
+        return json.loads(data)
+
+
+class BinaryFormat:
+    # Документ с заголовком смещений полей верхнего уровня:
+    # [число полей n, длина имён k: <II][имена полей через \0, k байт][концы значений: n x uint32][значения]
+    # Значения закодированы двоично с тегом типа (см. _encode): числа - целыми фиксированной ширины и double, строки и вложенные
+    # списки и объекты - с длиной впереди, поэтому при разборе не нужно искать конец значения в тексте.
+    # loads(data, fields) разбирает только нужные поля - документ, не прошедший условие запроса, целиком не читается.
+    # Документ - не словарь (или с \0 и не строками в именах полей) - хранится одним значением при n = 0xFFFFFFFF
+    PARTIAL = True
+    TEXT = False
+    EXTENSION = ".bin"
+    WHOLE = 0xFFFFFFFF
+
+    def dumps(self, json_document) -> bytes:
+        if not isinstance(json_document, dict) or any(not isinstance(key, str) or "\0" in key for key in json_document):
+            out = bytearray(BINARY_HEADER.pack(self.WHOLE, 0))
+            _encode(json_document, out)
+            return bytes(out)
+        keys = "\0".join(json_document).encode("utf-8")
+        values = bytearray()
+        ends = []   # Смещения - от начала значений
+        for value in json_document.values():
+            _encode(value, values)
+            ends.append(len(values))
+        return BINARY_HEADER.pack(len(ends), len(keys)) + keys + struct.pack(f"<{len(ends)}I", *ends) + values
+
+    def loads(self, data: bytes, fields=None):
+        # fields - имена полей верхнего уровня, которые нужны (None - весь документ); остальных полей в результате не будет
+        count, keys_length = BINARY_HEADER.unpack_from(data)
+        start = BINARY_HEADER.size + keys_length
+        if count == self.WHOLE:
+            return _decode(data, start)[0]
+        keys = data[BINARY_HEADER.size:start].decode("utf-8").split("\0") if count else []
+        values_start = start + 4 * count
+        if fields is None:
+            json_document = {}
+            position = values_start
+            for key in keys:
+                json_document[key], position = _decode(data, position)
+            return json_document
+
+        ends = struct.unpack_from(f"<{count}I", data, start)
+        json_document = {}
+        for field in fields:
+            if field in keys:
+                i = keys.index(field)
+                json_document[field] = _decode(data, values_start + (ends[i - 1] if i else 0))[0]
+        return json_document
+
+
+# Значения формата binary: байт-тег типа и данные. Целые - наименьшим из int8/int16/int32/int64 (b, h, i, q),
+# больше int64 - длина и байты (I); double - d; null/true/false - N/T/F без данных.
+# Строка UTF-8 (s/S), список (l/L) и объект (o/O; пары ключ-строка без тега, значение) - длина или число элементов
+# одним байтом (строчная буква) или uint32 (заглавная), затем данные
+_INTEGERS = [(b"b", struct.Struct("<b")), (b"h", struct.Struct("<h")), (b"i", struct.Struct("<i")), (b"q", struct.Struct("<q"))]
+_INTEGER_TAGS = {tag[0]: integer for tag, integer in _INTEGERS}
+_DOUBLE = struct.Struct("<d")
+_LENGTH = struct.Struct("<I")
+_CONSTANTS = {None: b"N", True: b"T", False: b"F"}
+_DECODED_CONSTANTS = {tag[0]: value for value, tag in _CONSTANTS.items()}
+
+
+def _encode(value, out: bytearray):
+    if value is None or value is True or value is False:
+        out += _CONSTANTS[value]
+    elif isinstance(value, int):
+        for tag, integer in _INTEGERS:
+            if -1 << (integer.size * 8 - 1) <= value < 1 << (integer.size * 8 - 1):
+                out += tag
+                out += integer.pack(value)
+                return
+        data = value.to_bytes((value.bit_length() + 8) // 8, "little", signed=True)
+        out += b"I" + _LENGTH.pack(len(data)) + data
+    elif isinstance(value, float):
+        out += b"d"
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, str):
+        _encode_sized(b"s", value.encode("utf-8"), out)
+    elif isinstance(value, (list, tuple)):
+        _encode_count(b"l", len(value), out)
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        _encode_count(b"o", len(value), out)
+        for key, item in value.items():
+            data = _json_key(key).encode("utf-8")
+            _encode_count(b"", len(data), out)
+            out += data
+            _encode(item, out)
+    else:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode_sized(tag: bytes, data: bytes, out: bytearray):
+    _encode_count(tag, len(data), out)
+    out += data
+
+
+def _encode_count(tag: bytes, count: int, out: bytearray):
+    # Длина одним байтом после строчного тега или uint32 после заглавного; ключ объекта (без тега) - 0xFF перед uint32
+    if count < 0xFF:
+        out += tag
+        out.append(count)
+    else:
+        out += tag.upper() if tag else b"\xff"
+        out += _LENGTH.pack(count)
+
+
+def _decode_count(data: bytes, position: int, long: bool) -> tuple:
+    if long:
+        return _LENGTH.unpack_from(data, position)[0], position + 4
+    return data[position], position + 1
+
+
+def _json_key(key) -> str:
+    # Ключи объекта приводятся к строкам так же, как в json.dumps (1 -> "1", True -> "true")
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, (int, float)):
+        return json.dumps(key)
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+
+
+def _decode(data: bytes, position: int) -> tuple:
+    # Значение, начинающееся в data[position], и позиция сразу за ним
+    tag = data[position]
+    position += 1
+    if tag == 0x73 or tag == 0x53:      # s, S
+        length, position = _decode_count(data, position, tag == 0x53)
+        return data[position:position + length].decode("utf-8"), position + length
+    integer = _INTEGER_TAGS.get(tag)
+    if integer is not None:
+        return integer.unpack_from(data, position)[0], position + integer.size
+    if tag == 0x6F or tag == 0x4F:      # o, O
+        count, position = _decode_count(data, position, tag == 0x4F)
+        value = {}
+        for _ in range(count):
+            length = data[position]
+            if length == 0xFF:
+                length = _LENGTH.unpack_from(data, position + 1)[0]
+                position += 4
+            position += 1
+            key = data[position:position + length].decode("utf-8")
+            value[key], position = _decode(data, position + length)
+        return value, position
+    if tag == 0x6C or tag == 0x4C:      # l, L
+        count, position = _decode_count(data, position, tag == 0x4C)
+        value = []
+        for _ in range(count):
+            item, position = _decode(data, position)
+            value.append(item)
+        return value, position
+    if tag == 0x64:     # d
+        return _DOUBLE.unpack_from(data, position)[0], position + 8
+    if tag in _DECODED_CONSTANTS:
+        return _DECODED_CONSTANTS[tag], position
+    if tag == 0x49:     # I
+        length, position = _decode_count(data, position, True)
+        return int.from_bytes(data[position:position + length], "little", signed=True), position + length
+    raise ValueError(f"Unknown value tag {tag!r} at position {position - 1}")
+
+
+DOCUMENT_FORMATS = {
+    "json": JsonFormat(indent=2),
+    "compact": JsonFormat(),
+    "binary": BinaryFormat(),
+}
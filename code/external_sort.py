@@ -0,0 +1,64 @@
+import os
+import heapq
+import pickle
+import tempfile
+
+RUN_SIZE = 1_000_000    # Сколько элементов сортируется в памяти; больше - отсортированные куски уходят во временные файлы
+CHUNK_SIZE = 10_000     # Элементы пишутся в файл куска пачками (одна запись pickle на пачку)
+
+
+class ExternalSorter:
+    # Сортировка данных, не помещающихся в память: элементы копятся в памяти, при переполнении отсортированный кусок
+    # пишется во временный файл, в конце куски сливаются heapq.merge. Пока кусок один - файлы не создаются.
+    # with ExternalSorter(directory) as sorter: sorter.add(item)...; for item in sorter.sorted(): ...
+
+    def __init__(self, directory: str = None, run_size: int = None):
+        self.directory = directory
+        self.run_size = run_size or RUN_SIZE
+        self.buffer = []
+        self.runs = []      # Пути временных файлов с отсортированными кусками
+
+    def add(self, item):
+        self.buffer.append(item)
+        if len(self.buffer) >= self.run_size:
+            self._spill()
+
+    def _spill(self):
+        self.buffer.sort()
+        descriptor, path = tempfile.mkstemp(suffix=".run", dir=self.directory)
+        self.runs.append(path)
+        with os.fdopen(descriptor, "wb") as file:
+            for i in range(0, len(self.buffer), CHUNK_SIZE):
+                pickle.dump(self.buffer[i:i + CHUNK_SIZE], file, pickle.HIGHEST_PROTOCOL)
+        self.buffer = []
+
+    def _read_run(self, path: str):
+        with open(path, "rb") as file:
+            while True:
+                try:
+                    chunk = pickle.load(file)
+                except EOFError:
+                    return
+                yield from chunk
+
+    def sorted(self):
+        # Генератор всех добавленных элементов по возрастанию
+        if not self.runs:
+            self.buffer.sort()
+            return iter(self.buffer)
+        if self.buffer:
+            self._spill()
+        return heapq.merge(*(self._read_run(path) for path in self.runs))
+
+    def close(self):
+        for path in self.runs:
+            if os.path.exists(path):
+                os.remove(path)
+        self.runs = []
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,82 +1,442 @@
 import pickle
 import os
+import datetime
+import calendar
+from itertools import groupby
+from collections.abc import MutableMapping
 
 from code.btree import BTree
+from code.paged_btree import PagedTree, PagedBTree, TREE_KINDS, open_tree
+from code.external_sort import ExternalSorter
+from code.query_engine import DATE_PARTS, SECONDS_PER_DAY, NOT_A_DATE, date_key
+
+RANGE_OPERATORS = ("@gt", "@gte", "@lt", "@lte")
+DEFAULT_ORDER = 32          # Порядок t нового индекса: в узле от t - 1 до 2t - 1 ключей (узел - примерно одна страница 4 КБ)
+DEFAULT_TREE = "btree"      # Вид дерева нового индекса: "btree" или "bplus" (B+ дерево со связанными листьями)
+
+
+def _date_ranges(operator: str, value: int, first_year: int, last_year: int) -> list:
+    # Диапазоны [начало; конец) в днях от 0001-01-01, в которых год/месяц/день равен value
+    ranges = []
+    if operator == "@year":
+        if datetime.MINYEAR <= value <= datetime.MAXYEAR:
+            start = datetime.date(value, 1, 1).toordinal()
+            ranges.append((start, start + (366 if calendar.isleap(value) else 365)))
+    elif operator == "@month":
+        if 1 <= value <= 12:
+            for year in range(first_year, last_year + 1):
+                start = datetime.date(year, value, 1).toordinal()
+                ranges.append((start, start + calendar.monthrange(year, value)[1]))
+    elif 1 <= value <= 31:
+        for year in range(first_year, last_year + 1):
+            for month in range(1, 13):
+                if value <= calendar.monthrange(year, month)[1]:
+                    start = datetime.date(year, month, value).toordinal()
+                    ranges.append((start, start + 1))
+    return ranges
+
+
+class KeysById:
+    # Обратное отображение {id: [key1, key2,...]} поверх B-дерева в файле страниц (ключ дерева - id документа)
+
+    def __init__(self, btree):
+        self.btree = btree
+
+    def get(self, filename: str, default=None):
+        keys = self.btree.search(filename)
+        return list(keys) if keys else default
+
+    def pop(self, filename: str, default=None):
+        keys = self.get(filename)
+        if keys is None:
+            return default
+        self.btree.delete(filename)
+        return keys
+
+    def flush(self):
+        self.btree.flush()
+
+    def __getitem__(self, filename: str) -> list:
+        keys = self.get(filename)
+        if keys is None:
+            raise KeyError(filename)
+        return keys
+
+    def __setitem__(self, filename: str, keys: list):
+        if filename in self:
+            self.btree.delete(filename)
+        self.btree.insert(filename, list(keys))
+
+    def __contains__(self, filename: str) -> bool:
+        return bool(self.btree.search(filename))
+
+    def __len__(self) -> int:      # Число документов в индексе - обход дерева (файлы документов не читаются)
+        return sum(1 for _ in self.btree.range_search())
 
 
 class Index:
-    def __init__(self, field, btree=None):
+    def __init__(self, field, btree=None, keys_by_id=None):
         if btree is None:
             btree = BTree(3)
+        if keys_by_id is None:
+            keys_by_id = self._build_keys_by_id(btree)
         self.field = field
         self.btree = btree
+        self.keys_by_id = keys_by_id    # Обратное отображение {id: [key1, key2,...]} - по каким ключам документ лежит в B-дереве
+
+        # Статистика для планировщика запросов: количество пар (key, id) и количество различных ключей.
+        # У индекса на диске она хранится в заголовке файла, чтобы не обходить дерево при открытии
+        if isinstance(btree, PagedTree):
+            self.key_count = btree.meta.get("key_count", 0)
+            self.distinct_keys = btree.meta.get("distinct_keys", 0)
+        else:
+            self.key_count = sum(len(keys) for keys in keys_by_id.values())
+            self.distinct_keys = len(set(key for keys in keys_by_id.values() for key in keys))
+
+        # Все проиндексированные значения поля совпадают со своими ключами (только int или только str, без приведения).
+        # Тогда значения поля можно брать прямо из индекса, не читая документы
+        self.exact = isinstance(btree, PagedTree) and btree.meta.get("exact", False)
+
+    def _build_keys_by_id(self, btree) -> dict:
+        # Восстанавливает обратное отображение одним обходом дерева (для индексов, сохранённых без него)
+        keys_by_id = {}
+        for key, values in btree.range_search():
+            for value in values:
+                keys_by_id.setdefault(value, []).append(key)
+        return keys_by_id
+
+    def add(self, filename: str, keys: list):
+        if not keys:
+            return
+        for key in keys:
+            if not self.btree.search(key):
+                self.distinct_keys += 1
+            self.btree.insert(key, filename)
+        self.key_count += len(keys)
+        self.keys_by_id[filename] = self.keys_by_id.get(filename, []) + keys
+
+    def bulk_load(self, key_pairs, id_pairs):
+        # Заполняет пустой индекс построением деревьев снизу вверх
+        # key_pairs - пары (key, id) по возрастанию, id_pairs - тройки (id, порядковый номер, key) по возрастанию
+        self.key_count = self.distinct_keys = 0
+        self.btree.bulk_load(self._group_keys(key_pairs))
+        self.keys_by_id.btree.bulk_load((filename, [key for _, _, key in group])
+                                        for filename, group in groupby(id_pairs, key=lambda pair: pair[0]))
+
+    def _group_keys(self, key_pairs):
+        for key, group in groupby(key_pairs, key=lambda pair: pair[0]):
+            ids = [filename for _, filename in group]
+            self.key_count += len(ids)
+            self.distinct_keys += 1
+            yield key, ids
+
+    def remove(self, filename: str) -> bool:
+        # Точечно удаляет документ только из тех ключей, по которым он был проиндексирован
+        keys = self.keys_by_id.pop(filename, None)
+        if keys is None:
+            return False
+        for key in keys:
+            self.btree.remove_key_value(key, filename)
+            if not self.btree.search(key):
+                self.distinct_keys -= 1
+        self.key_count -= len(keys)
+        return True
+
+    def pin(self):
+        # Читает дерево и обратное отображение в память целиком и больше не выгружает их
+        self.btree.pin()
+        self.keys_by_id.btree.pin()
+
+    def flush(self):
+        # Записывает на диск изменённые страницы дерева и обратного отображения вместе со статистикой
+        self.btree.meta.update(key_count=self.key_count, distinct_keys=self.distinct_keys, exact=self.exact)
+        self.btree.flush()
+        self.keys_by_id.flush()
+
+
+class LazyIndexes(MutableMapping):
+    # {field: Index}. При открытии коллекции известны только поля и сведения о файлах индексов (размер, mtime),
+    # само B-дерево открывается при первом обращении к полю. Если файл индекса изменил другой процесс - индекс переоткрывается
+
+    def __init__(self, opener, path_to_indexes: str):
+        self.opener = opener                # Функция field -> Index
+        self.path_to_indexes = path_to_indexes
+        self.metadata = {}                  # {field: (размер файла, mtime)}
+        self.opened = {}                    # {field: Index} - уже открытые индексы
+
+    def file_info(self, field: str) -> tuple:
+        stat = os.stat(os.path.join(self.path_to_indexes, f"{field}.idx"))
+        return stat.st_size, stat.st_mtime_ns
+
+    def touch(self, field: str):
+        # Запоминает состояние файла после записи в индекс этим процессом, чтобы не переоткрывать его
+        self.metadata[field] = self.file_info(field)
+
+    def __getitem__(self, field: str):
+        if field not in self.metadata:
+            raise KeyError(field)
+        info = self.file_info(field)
+        if field not in self.opened or info != self.metadata[field]:
+            self.opened[field] = self.opener(field)
+            self.metadata[field] = info
+        return self.opened[field]
+
+    def __setitem__(self, field: str, index):
+        self.opened[field] = index
+        self.touch(field)
+
+    def __delitem__(self, field: str):
+        del self.metadata[field]
+        self.opened.pop(field, None)
+
+    def __contains__(self, field) -> bool:    # Проверка наличия индекса не открывает его
+        return field in self.metadata
+
+    def __iter__(self):
+        return iter(list(self.metadata))
+
+    def __len__(self) -> int:
+        return len(self.metadata)
 
 
 class Indexation:
+    # Каждый индекс лежит в двух файлах страниц (см. PagedTree):
+    # <field>.idx - B-дерево или B+ дерево {key: [id1, id2,...]}, <field>.ids - обратное отображение {id: [key1, key2,...]}
+
     def __init__(self, collection):
         self.collection = collection
 
         self.path_to_indexes = os.path.join(self.collection.path_to_collection, "indexes")
         os.makedirs(self.path_to_indexes, exist_ok=True)
 
-        self.indexes = self._load_indexes()  # Загружаем с диска проиндексированные поля {key=field; value=value}
+        # Закреплённые индексы целиком держатся в памяти (список полей хранится в настройках коллекции)
+        self.pinned = set(self.collection.settings.get("pinned_indexes", []))
+        # Поля-даты: ключи их индексов - секунды от 0001-01-01, @year/@month/@day ищутся по индексу диапазонами ключей
+        self.date_fields = set(self.collection.settings.get("date_fields", []))
+        self.indexes = self._load_indexes()  # Проиндексированные поля {key=field; value=Index}, открываются при первом обращении
 
         self.query_engine = self.collection.query_engine
 
     def get_indexes(self) -> dict:
         return self.indexes
 
-    def _load_indexes(self) -> dict:
-        # Загружаем ранее проиндексированные поля
+    def _load_indexes(self) -> LazyIndexes:
+        # Находим ранее проиндексированные поля; сами файлы индексов не читаются до первого обращения
+
+        indexes = LazyIndexes(self._open_index, self.path_to_indexes)
+        for filename in os.listdir(self.path_to_indexes):
+            if filename.endswith(".idx"):
+                field = filename[:-len(".idx")]  # Убираем ".idx" в конце имени файла (получаем поле, по которому индексировали)
+                indexes.touch(field)
 
-        indexes = {}
         for filename in os.listdir(self.path_to_indexes):
-            if filename.endswith(".pkl"):
-                field = filename[
-                        :-len(".pkl")]  # Убираем ".pkl" в конце имени файла (получаем поле, по которому индексировали)
-                path_to_index = os.path.join(self.path_to_indexes, filename)
-                with open(path_to_index, "rb") as file:
-                    btree = pickle.load(file)
-                indexes[field] = Index(field, btree)
+            if filename.endswith(".pkl") and filename[:-len(".pkl")] not in indexes:
+                field = filename[:-len(".pkl")]  # Индекс в старом формате (pickle всего дерева) - переводим в страничный
+                indexes[field] = self._migrate_index(field)
         return indexes
 
-    def create_index(self, field: str) -> int:
+    def _path(self, field: str, extension: str) -> str:
+        return os.path.join(self.path_to_indexes, f"{field}{extension}")
+
+    def _open_index(self, field: str) -> Index:
+        btree = open_tree(self._path(field, ".idx"))
+        keys_by_id = KeysById(open_tree(self._path(field, ".ids")))
+        index = Index(field, btree, keys_by_id)
+        if field in self.pinned:
+            index.pin()
+        return index
+
+    def pin_index(self, field: str, pinned: bool = True):
+        # Закрепляет индекс в памяти (или снимает закрепление); настройка сохраняется в collection.conf
+        if pinned:
+            self.pinned.add(field)
+        else:
+            self.pinned.discard(field)
+        self.collection.settings["pinned_indexes"] = sorted(self.pinned)
+        self.collection.save_settings()
+        self._flush_index(field)
+        self.indexes.opened.pop(field, None)  # Откроется заново с новой настройкой при следующем обращении
+
+    def set_date_field(self, field: str, is_date: bool = True):
+        # Объявляет поле датой (или снимает объявление); настройка сохраняется в collection.conf.
+        # Ключи уже построенного индекса не меняются - индекс нужно перестроить (create_index делает это сам)
+        if is_date:
+            self.date_fields.add(field)
+        else:
+            self.date_fields.discard(field)
+        self.collection.settings["date_fields"] = sorted(self.date_fields)
+        self.collection.save_settings()
+
+    def _new_index(self, field: str, order: int = DEFAULT_ORDER, tree: str = DEFAULT_TREE) -> Index:
+        # Пустой индекс во временных файлах - старый индекс остаётся рабочим, пока новый не будет построен
+        if tree not in TREE_KINDS:
+            raise ValueError(f"Unknown index tree '{tree}'. Available: {', '.join(TREE_KINDS)}")
+        if order < 2:
+            raise ValueError("Index order must be at least 2")
+
+        for extension in (".idx.tmp", ".ids.tmp"):
+            if os.path.exists(self._path(field, extension)):
+                os.remove(self._path(field, extension))
+        btree = TREE_KINDS[tree](self._path(field, ".idx.tmp"), order)
+        keys_by_id = KeysById(PagedBTree(self._path(field, ".ids.tmp"), order))  # Обратное отображение - только точечный поиск
+        return Index(field, btree, keys_by_id)
+
+    def _replace_index(self, field: str, index: Index) -> Index:
+        # Сохраняет построенный во временных файлах индекс и подменяет им старый
+        index.flush()
+        os.replace(self._path(field, ".ids.tmp"), self._path(field, ".ids"))
+        os.replace(self._path(field, ".idx.tmp"), self._path(field, ".idx"))
+        for extension in (".pkl", ".rev", ".log"):  # Файлы индекса в старом формате
+            if os.path.exists(self._path(field, extension)):
+                os.remove(self._path(field, extension))
+        return self._open_index(field)
+
+    def _migrate_index(self, field: str) -> Index:
+        # Читает индекс старого формата (<field>.pkl, <field>.rev, журнал <field>.log) и переписывает его в страничный
+        with open(self._path(field, ".pkl"), "rb") as file:
+            btree = pickle.load(file)
+
+        keys_by_id = None
+        if os.path.exists(self._path(field, ".rev")):
+            with open(self._path(field, ".rev"), "rb") as file:
+                keys_by_id = pickle.load(file)
+
+        old_index = Index(field, btree, keys_by_id)
+        self._replay_journal(old_index)
+
+        index = self._new_index(field)
+        for filename, keys in old_index.keys_by_id.items():
+            index.add(filename, keys)
+        return self._replace_index(field, index)
+
+    def _replay_journal(self, index):
+        # Досчитываем в индекс старого формата вставки и удаления из журнала
+        # Запись журнала: (id, [keys]) - вставка, (id, None) - удаление
+
+        path_to_journal = self._path(index.field, ".log")
+        if not os.path.exists(path_to_journal):
+            return
+        with open(path_to_journal, "rb") as file:
+            while True:
+                try:
+                    filename, keys = pickle.load(file)
+                except (EOFError, pickle.UnpicklingError):  # Конец журнала (или недописанная при сбое запись)
+                    break
+                if keys is None:
+                    index.remove(filename)
+                else:
+                    index.add(filename, keys)
+
+    def create_index(self, field: str, pin: bool = None, order: int = None, tree: str = None, date: bool = None) -> int:
         # Индексация выбранного поля по всем json-объектам в выбранной базе данных.
+        # pin - закрепить индекс в памяти (True), снять закрепление (False), оставить как есть (None)
+        # date - объявить поле датой (True), снять объявление (False), оставить как есть (None)
+        # order, tree - порядок и вид дерева; не заданы - как у прежнего индекса поля (или по умолчанию)
         # Пример 1: python cli_core.py db mydb/users index age
-        # Пример 2: python cli_core.py --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users index age
+        # Пример 2: python cli_core.py --storage-path "E:\PyCharmProjects\kbdSQL\storage" db mydb/users index age --order 64 --tree bplus
 
-        index = Index(field)
+        with self.collection.writing():
+            if date is not None and date != (field in self.date_fields):
+                self.set_date_field(field, date)
+            if field in self.indexes:
+                old_tree = self.indexes[field].btree
+                order = old_tree.t if order is None else order
+                tree = old_tree.KIND if tree is None else tree
+            index = self._new_index(field, order or DEFAULT_ORDER, tree or DEFAULT_TREE)
 
-        count = 0
-        for filename, json_document in self.collection.get_jsons():
-            # Получаем значение из каждого json-документа по указанному полю
-            values = self.collection.get_value(json_document, field)
-            for value in values:
-                try:
-                    key = int(value)
-                except (ValueError, TypeError):
-                    key = str(value)
-                index.btree.insert(key, filename)
-                count += 1
+            # Пары (key, id) сортируются (при нехватке памяти - через временные файлы), и деревья строятся снизу вверх полными узлами
+            count = 0
+            key_types = set()
+            with ExternalSorter(self.path_to_indexes) as key_pairs, ExternalSorter(self.path_to_indexes) as id_pairs:
+                for filename, json_document in self.collection.get_jsons():
+                    # Получаем значение из каждого json-документа по указанному полю
+                    values = self.collection.get_value(json_document, field)
+                    for value in values:
+                        key = self.to_key(value, field)
+                        key_types.add(type(value) if self.is_exact(value, field) else None)
+                        key_pairs.add((key, filename))
+                        id_pairs.add((filename, count, key))    # Порядковый номер сохраняет порядок ключей документа
+                        count += 1
+                index.bulk_load(key_pairs.sorted(), id_pairs.sorted())
+            index.exact = len(key_types) <= 1 and None not in key_types
 
-        path_to_index = os.path.join(self.path_to_indexes, f"{field}.pkl")
-        with open(path_to_index, "wb") as file:
-            pickle.dump(index.btree, file)
+            if pin is not None:
+                self.pin_index(field, pin)
+            self.indexes[field] = self._replace_index(field, index)  # Записываем проиндексированное
+            return count
 
-        self.indexes[field] = index  # Записываем проиндексированное
-        return count
+    def add_to_index(self, filename: str, json_document: dict):
+        # Добавляет новый документ во все существующие индексы
+        self.add_many_to_index([(filename, json_document)])
+
+    def add_many_to_index(self, documents: list):
+        # Добавляет пачку документов [(id, json-документ)] во все индексы; на диск индексы пишутся в контрольной точке коллекции
+        self.add_index_entries(self.index_entries(documents))
+
+    def index_entries(self, documents: list, references: dict = None) -> list:
+        # Ключи пачки документов [(id, json-документ)] для всех индексов: [(field, [(id, [keys], exact)])].
+        # Ничего не меняет, но проверяет, что ключи сравнимы между собой и с ключами индекса: иначе TypeError
+        # (например, "n/a" в индекс чисел) - до того, как документ записан в журнал, в хранилище и в часть индексов.
+        # references - {field: ключ} пачек, проверенных раньше, но ещё не добавленных в индексы (дополняется)
+        if references is None:
+            references = {}
+        entries = []
+        checked = {}
+        for field in self.indexes:
+            field_entries = []
+            for filename, json_document in documents:
+                values = self.collection.get_value(json_document, field)
+                if values:
+                    exact = all(self.is_exact(value, field) for value in values)
+                    field_entries.append((filename, [self.to_key(value, field) for value in values], exact))
+            if not field_entries:     # Документы без этого поля - индекс даже не открываем
+                continue
+            reference = references.get(field)
+            if reference is None:
+                reference = self.indexes[field].btree.min_key()
+            if reference is None:   # Пустой индекс - ключи должны быть сравнимы хотя бы между собой
+                reference = field_entries[0][1][0]
+            try:
+                for _, keys, _ in field_entries:
+                    for key in keys:
+                        key < reference     # Ключи индекса - числа или строки: сравнимость с одним ключом означает сравнимость со всеми
+            except TypeError:
+                raise TypeError(f"Values of '{field}' cannot be compared with the keys of its index") from None
+            checked[field] = reference
+            entries.append((field, field_entries))
+        references.update(checked)
+        return entries
+
+    def add_index_entries(self, entries: list):
+        # Добавляет в индексы ключи, подготовленные index_entries
+        for field, field_entries in entries:
+            index = self.indexes[field]
+            for filename, keys, exact in field_entries:
+                if not exact:   # Ключ отличается от значения - из индекса поле больше не берём
+                    index.exact = False
+                index.add(filename, keys)
 
     def remove_from_index(self, filename: str):
         for field, index in self.indexes.items():
-            index.btree.remove_value(filename)
+            index.remove(filename)
 
-            # Пересохраняем индекс на диск
-            path_to_index = os.path.join(self.path_to_indexes, f"{field}.pkl")
-            with open(path_to_index, "wb") as file:
-                pickle.dump(index.btree, file)
+    def flush(self):
+        # Контрольная точка: записывает на диск страницы индексов, изменённые после прошлой.
+        # Между контрольными точками изменения индексов есть только в памяти и в журнале коллекции
+        for field in list(self.indexes.opened):
+            self._flush_index(field)
 
-    def indexed_search(self, field: str, query: dict) -> list:
+    def _flush_index(self, field: str):
+        if field not in self.indexes.opened:
+            return
+        index = self.indexes[field]     # Файл изменил другой процесс - индекс переоткрыт (тот процесс уже записал и наши изменения из журнала)
+        if index.btree.dirty or index.keys_by_id.btree.dirty:
+            index.flush()
+            self.indexes.touch(field)
+
+    def indexed_search(self, field: str, query: dict):
         # Поиск по индексированным полям
+        # Возвращает список id-кандидатов (надмножество подходящих документов) или None, если индекс не может ответить на условие
 
         index = self.indexes[field]  # B-дерево, в котором будет вестить поиск
         condition = query.get(field)
@@ -84,7 +444,124 @@ class Indexation:
         if condition is None:
             return []
         if isinstance(condition, dict):
-            operator, value = next(iter(condition.items()))  # Берёт первую пару (ключ; значение) из словаря
+            conditions = condition.items()
         else:
-            operator, value = "@eq", condition
-        return index.btree.search(value)  # Список подходящих документов по значению
+            conditions = [("@eq", condition)]
+
+        bounds = {operator: value for operator, value in conditions if operator in RANGE_OPERATORS}
+        ids_sets = [self.search_operator(field, operator, value) for operator, value in conditions
+                    if operator not in RANGE_OPERATORS]
+        if bounds:
+            ids_sets.append(self.search_range(field, bounds))  # Все границы по полю - одним обходом дерева
+
+        matched_ids = None
+        for ids in ids_sets:
+            if ids is None:  # Оператор не поддерживается индексом - его проверит предикат
+                continue
+            matched_ids = ids if matched_ids is None else matched_ids & ids
+
+        if matched_ids is None:
+            return None
+        return list(matched_ids)
+
+    def search_operator(self, field: str, operator: str, value):
+        # Возвращает множество id для одного оператора сравнения или None, если индекс не может на него ответить
+
+        if operator in RANGE_OPERATORS:
+            return self.search_range(field, {operator: value})
+        if operator in DATE_PARTS and field in self.date_fields:
+            return self.search_date(field, operator, value)
+        if operator not in ("@eq", "@ne"):
+            return None
+
+        index = self.indexes[field]
+        key = self.to_key(value, field)
+        try:
+            ids = set(index.btree.search(key))
+        except TypeError:  # Если типы несравнимы (например, str > int)
+            return None
+
+        if operator == "@eq":
+            return ids
+        # Исключать документы ключа можно, только если и значение, и все ключи индекса сохранены без приведения:
+        # иначе под ключом 18 лежат и 18.5, и "18", которые @ne 18 удовлетворяют
+        if not index.exact or not self.is_exact(value):
+            ids = set()
+        return set(self.collection.get_filenames()) - ids  # Документы без поля тоже удовлетворяют @ne
+
+    def search_range(self, field: str, bounds: dict):
+        # Возвращает множество id, ключи которых попадают в границы {"@gt"/"@gte"/"@lt"/"@lte": value}
+        # Если ключ при приведении изменился (например, 3.6 -> 3) - у границы или у значений в индексе,
+        # граница берётся включительно - лишнее отсеет предикат
+
+        if field in self.date_fields:   # Условие сравнивает строки, а ключи - даты: порядки могут не совпадать
+            return None
+        index = self.indexes[field]
+        lower = upper = None
+        include_lower = include_upper = True
+        try:
+            for operator, value in bounds.items():
+                if isinstance(value, str) and not index.exact:  # Строки из чисел ("9") приведены к int - порядок строк потерян
+                    return None
+                key = self.to_key(value)
+                exact = index.exact and self.is_exact(value)
+                if operator in ("@gt", "@gte"):
+                    inclusive = operator == "@gte" or not exact
+                    if lower is None or key > lower or (key == lower and not inclusive):
+                        lower, include_lower = key, inclusive
+                elif operator in ("@lt", "@lte"):
+                    inclusive = operator == "@lte" or not exact
+                    if upper is None or key < upper or (key == upper and not inclusive):
+                        upper, include_upper = key, inclusive
+                else:
+                    return None
+
+            ids = set()
+            for _, values in index.btree.range_search(lower, upper, include_lower, include_upper):
+                ids.update(values)
+            return ids
+        except TypeError:  # Если типы несравнимы (например, str > int)
+            return None
+
+    def search_date(self, field: str, operator: str, value) -> set:
+        # Множество id документов, у которых год/месяц/день даты равен value (@year/@month/@day на поле-дате).
+        # Условие превращается в диапазоны ключей: год - один диапазон, месяц и день - по диапазону на каждый год (месяц)
+        # между наименьшей и наибольшей датой индекса. Если диапазонов больше, чем ключей, дерево обходится один раз целиком
+        if not isinstance(value, int) or isinstance(value, bool):
+            return None
+
+        index = self.indexes[field]
+        first = next(index.btree.range_search(NOT_A_DATE, None, False), None)
+        if first is None:   # В индексе нет ни одной даты
+            return set()
+        first_year = datetime.date.fromordinal(first[0] // SECONDS_PER_DAY).year
+        last_year = datetime.date.fromordinal(index.btree.max_key() // SECONDS_PER_DAY).year
+
+        ids = set()
+        ranges = _date_ranges(operator, value, first_year, last_year)
+        if len(ranges) > index.distinct_keys:
+            part = DATE_PARTS[operator]
+            for key, values in index.btree.range_search(NOT_A_DATE, None, False):
+                if getattr(datetime.date.fromordinal(key // SECONDS_PER_DAY), part) == value:
+                    ids.update(values)
+            return ids
+        for start, end in ranges:
+            for _, values in index.btree.range_search(start * SECONDS_PER_DAY, end * SECONDS_PER_DAY, True, False):
+                ids.update(values)
+        return ids
+
+    def is_exact(self, value, field: str = None) -> bool:
+        # Ключ индекса совпадает с самим значением (значение не меняется при приведении)
+        if field in self.date_fields:
+            return False
+        key = self.to_key(value)
+        return type(key) is type(value) and key == value
+
+    def to_key(self, value, field: str = None):
+        # Приводит значение к ключу B-дерева так же, как при индексации поля field
+        if field in self.date_fields:
+            return date_key(value)
+        try:
+            return int(value)
+        except (ValueError, TypeError):
+            return str(value)
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:     # Windows: только исключительная блокировка
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    # Блокировка коллекции между процессами (и потоками одного процесса) через файл: много читателей или один писатель.
+    # Захваты в одном потоке вложенные: повторный захват и чтение под записью не блокируются, запись под чтением
+    # (например, удаление во время перебора результатов поиска) повышает блокировку до исключительной и потом понижает обратно.
+    # На Windows чтение тоже захватывает блокировку исключительно
+    # with lock.read(): ...; with lock.write(): ...
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()  # У каждого потока свой дескриптор файла и свои счётчики захватов
+
+    @contextmanager
+    def read(self):
+        self._acquire(shared=True)
+        try:
+            yield
+        finally:
+            self._release(shared=True)
+
+    @contextmanager
+    def write(self):
+        self._acquire(shared=False)
+        try:
+            yield
+        finally:
+            self._release(shared=False)
+
+    def _acquire(self, shared: bool):
+        state = self.local
+        if not hasattr(state, "file"):
+            state.file, state.readers, state.writers = None, 0, 0
+        readers, writers = state.readers + shared, state.writers + (not shared)
+        self._lock(state, _mode(state.readers, state.writers), _mode(readers, writers))
+        state.readers, state.writers = readers, writers
+
+    def _release(self, shared: bool):
+        state = self.local
+        readers, writers = state.readers - shared, state.writers - (not shared)
+        self._lock(state, _mode(state.readers, state.writers), _mode(readers, writers))
+        state.readers, state.writers = readers, writers
+
+    def _lock(self, state, current: int, mode: int):
+        if mode == current:
+            return
+        if state.file is None:
+            state.file = open(self.path, "a+b")
+        if fcntl is not None:   # Смена режима не атомарна: flock сначала снимает прежнюю блокировку, поэтому повышение не взаимоблокируется
+            fcntl.flock(state.file.fileno(), (fcntl.LOCK_UN, fcntl.LOCK_SH, fcntl.LOCK_EX)[mode])
+            return
+        if current and mode:    # На Windows блокировка и так исключительная
+            return
+        state.file.seek(0)
+        if not mode:
+            msvcrt.locking(state.file.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        while True:
+            try:
+                msvcrt.locking(state.file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:     # LK_LOCK сдаётся после 10 попыток - ждём дальше
+                continue
+
+
+def _mode(readers: int, writers: int) -> int:
+    # 0 - не захвачена, 1 - общая (чтение), 2 - исключительная (запись)
+    return 2 if writers else 1 if readers else 0
+
+
+class AsyncReadWriteLock:
+    # Блокировка для asyncio: много читателей или один писатель. Ожидающий писатель не пропускает новых читателей,
+    # поэтому поток чтений не откладывает запись бесконечно
+    # async with lock.read(): ...; async with lock.write(): ...
+
+    def __init__(self):
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+        self.condition = asyncio.Condition()
+
+    def read(self):
+        return _Held(self._acquire_read, self._release_read)
+
+    def write(self):
+        return _Held(self._acquire_write, self._release_write)
+
+    async def _acquire_read(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.writer and not self.waiting_writers)
+            self.readers += 1
+
+    async def _release_read(self):
+        async with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    async def _acquire_write(self):
+        async with self.condition:
+            self.waiting_writers += 1
+            try:
+                await self.condition.wait_for(lambda: not self.writer and not self.readers)
+            finally:
+                self.waiting_writers -= 1
+                self.condition.notify_all()     # Если ожидание прервано - читатели больше не ждут этого писателя
+            self.writer = True
+
+    async def _release_write(self):
+        async with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+
+class _Held:
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        await self.release()
@@ -0,0 +1,376 @@
+import os
+import json
+import struct
+import threading
+from collections import OrderedDict
+
+from code.btree import BTree
+from code.bplustree import BPlusNode, BPlusTree
+
+PAGE_SIZE = 512                                 # Минимальный размер страницы нового файла индекса (узел при t=3 обычно занимает одну страницу)
+PAGE_HEADER = struct.Struct("<II")              # Начало каждой страницы: номер следующей страницы цепочки (0 - нет) и длина данных
+FORMAT = "kbdsql-btree-1"
+
+
+def page_size_for(t: int) -> int:
+    # Размер страницы под порядок дерева: полный узел (2t - 1 ключей по ~64 байта) должен помещаться в одну страницу
+    page_size = PAGE_SIZE
+    while page_size < (2 * t - 1) * 64 and page_size < 64 * 1024:
+        page_size *= 2
+    return page_size
+
+
+class Pager:
+    # Файл из страниц фиксированного размера. Страница 0 - заголовок (JSON), остальные - узлы B-дерева.
+    # Узел, не помещающийся в одну страницу, продолжается в цепочке страниц.
+    # Освобождённые страницы связаны в список свободных, его голова хранится в заголовке
+
+    CACHE_PAGES = 1024      # Сколько прочитанных страниц держим в памяти (LRU)
+
+    def __init__(self, path: str, kind: str = "btree", t: int = 3):
+        self.path = path
+        self.cache = OrderedDict()  # {номер страницы: (следующая страница, данные)}
+        self.pending = {}           # {номер страницы: байты страницы} - записи, ещё не сброшенные на диск
+        self.lock = threading.Lock()    # Кэш страниц общий для читающих потоков
+
+        if os.path.exists(path):
+            with open(path, "rb") as file:  # Заголовок читаем до того, как узнаем размер страницы
+                _, length = PAGE_HEADER.unpack(file.read(PAGE_HEADER.size))
+                self.header = json.loads(file.read(length))
+            if self.header.get("format") != FORMAT:
+                raise ValueError(f"Unsupported index format: {path}")
+        else:
+            self.header = {"format": FORMAT, "kind": kind, "page_size": page_size_for(t), "t": t,
+                           "pages": 1, "free": 0, "root": 0, "meta": {}}
+        self.page_size = self.header["page_size"]
+        self.data_size = self.page_size - PAGE_HEADER.size
+
+    def read_page(self, page: int) -> tuple:
+        with self.lock:
+            cached = self.cache.get(page)
+            if cached is not None:
+                self.cache.move_to_end(page)
+                return cached
+        if page in self.pending:
+            raw = self.pending[page]
+        else:
+            with open(self.path, "rb") as file:
+                file.seek(page * self.page_size)
+                raw = file.read(self.page_size)
+        next_page, length = PAGE_HEADER.unpack_from(raw)
+        result = (next_page, raw[PAGE_HEADER.size:PAGE_HEADER.size + length])
+        self._cache(page, result)
+        return result
+
+    def read_chain(self, page: int) -> tuple:
+        # Возвращает ([номера страниц цепочки], данные узла)
+        pages = []
+        chunks = []
+        while page:
+            pages.append(page)
+            page, data = self.read_page(page)
+            chunks.append(data)
+        return pages, b"".join(chunks)
+
+    def write_chain(self, pages: list, data: bytes) -> list:
+        # Записывает данные в цепочку страниц, переиспользуя прежние страницы узла. Возвращает новую цепочку
+        chunks = [data[i:i + self.data_size] for i in range(0, len(data), self.data_size)] or [b""]
+        pages = pages[:]
+        while len(pages) < len(chunks):
+            pages.append(self.allocate())
+        for page in pages[len(chunks):]:    # Узел уменьшился - лишние страницы освобождаем
+            self.free(page)
+        pages = pages[:len(chunks)]
+
+        for i, chunk in enumerate(chunks):
+            next_page = pages[i + 1] if i + 1 < len(pages) else 0
+            self._write_page(pages[i], next_page, chunk)
+        return pages
+
+    def allocate(self) -> int:
+        page = self.header["free"]
+        if page:
+            self.header["free"] = self.read_page(page)[0]
+        else:
+            page = self.header["pages"]
+            self.header["pages"] += 1
+        return page
+
+    def free(self, page: int):
+        self._write_page(page, self.header["free"], b"")
+        self.header["free"] = page
+
+    def free_chain(self, pages: list):
+        for page in pages:
+            self.free(page)
+
+    def commit(self) -> int:
+        # Сбрасывает изменённые страницы и заголовок на диск (до fsync) одним открытием файла. Возвращает число записанных страниц
+        self._write_page(0, 0, json.dumps(self.header).encode("utf-8"))
+        return self.write_pending(sync=True)
+
+    def write_pending(self, sync: bool = False) -> int:
+        # Сбрасывает на диск накопленные страницы без заголовка (при построении индекса, чтобы не держать весь файл в памяти)
+        mode = "r+b" if os.path.exists(self.path) else "wb"
+        with open(self.path, mode) as file:
+            for page in sorted(self.pending):
+                file.seek(page * self.page_size)
+                file.write(self.pending[page])
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+        written = len(self.pending)
+        self.pending = {}
+        return written
+
+    def _write_page(self, page: int, next_page: int, data: bytes):
+        self.pending[page] = PAGE_HEADER.pack(next_page, len(data)) + data.ljust(self.data_size, b"\0")
+        self._cache(page, (next_page, data))
+
+    def _cache(self, page: int, value: tuple):
+        with self.lock:
+            self.cache[page] = value
+            self.cache.move_to_end(page)
+            if len(self.cache) > self.CACHE_PAGES:
+                self.cache.popitem(last=False)
+
+
+class PagedNode(BPlusNode):
+    # Узел дерева, лежащий в цепочке страниц. Узел, известный только по номеру страницы (заглушка),
+    # читается с диска при первом обращении к его ключам, значениям или детям
+    __slots__ = ("tree", "page", "pages", "child_pages", "next_page", "saved",
+                 "_keys", "_values", "_leaf", "_children", "_next")
+
+    def __init__(self, tree, leaf=False, page=0):
+        self.tree = tree
+        self.page = page            # Первая страница узла (0 - узел ещё не записан)
+        self.pages = []             # Цепочка страниц узла; None - узел ещё не прочитан с диска
+        self.child_pages = []       # Первые страницы дочерних узлов (в том виде, в каком они записаны)
+        self.next_page = 0          # Первая страница следующего листа (только в B+ дереве)
+        self.saved = None           # Данные узла в том виде, в каком они лежат на диске
+        super().__init__(leaf)
+        if page:
+            self.pages = None
+
+    def _load(self):
+        self.tree._read_node(self)
+
+    @property
+    def keys(self) -> list:
+        if self.pages is None:
+            self._load()
+        return self._keys
+
+    @keys.setter
+    def keys(self, keys: list):
+        if self.pages is None:
+            self._load()
+        self._keys = keys
+
+    @property
+    def values(self) -> list:
+        if self.pages is None:
+            self._load()
+        return self._values
+
+    @values.setter
+    def values(self, values: list):
+        if self.pages is None:
+            self._load()
+        self._values = values
+
+    @property
+    def leaf(self) -> bool:
+        if self.pages is None:
+            self._load()
+        return self._leaf
+
+    @leaf.setter
+    def leaf(self, leaf: bool):
+        self._leaf = leaf
+
+    @property
+    def children(self) -> list:
+        if self.pages is None:
+            self._load()
+        return self._children
+
+    @children.setter
+    def children(self, children: list):
+        if self.pages is None:
+            self._load()
+        self._children = children
+
+    @property
+    def next(self):
+        if self.pages is None:
+            self._load()
+        return self._next
+
+    @next.setter
+    def next(self, node):
+        if self.pages is None:
+            self._load()
+        self._next = node
+
+
+class PagedTree:
+    # Хранение дерева (BTree или BPlusTree) в файле страниц: при открытии читается только заголовок,
+    # узлы - по мере спуска, причём из детей узла читаются только те, в которые спускаемся.
+    # flush() записывает только изменившиеся узлы. Используется как первый базовый класс: PagedBTree(PagedTree, BTree)
+
+    KIND = None                 # Вид дерева в заголовке файла
+    MAX_LOADED_NODES = 4096     # После стольких узлов в памяти неизменённое дерево выгружается
+    BULK_PENDING_PAGES = 4096   # При построении снизу вверх накопленные страницы сбрасываются на диск пачками такого размера
+
+    def __init__(self, path: str, t: int = 3):
+        self.pager = Pager(path, self.KIND, t)
+        if self.pager.header.get("kind", "btree") != self.KIND:
+            raise ValueError(f"{path} is not a {self.KIND} index")
+        self.nodes = {}         # {первая страница: узел} - на одну страницу один объект узла (прочитанный или заглушка)
+        self.node_reads = 0     # Сколько узлов прочитано с диска всего (для статистики)
+        self.discarded = []     # Узлы, выпавшие из дерева; их страницы освобождаются при flush
+        self.dirty = False      # Есть изменения, ещё не записанные на диск
+        self.lock = threading.RLock()   # Чтение узлов с диска - по одному потоку за раз
+        super().__init__(self.pager.header["t"])
+        self.meta = self.pager.header["meta"]   # Произвольные сведения об индексе, хранятся в заголовке
+        if self.pager.header["root"]:
+            self.root = self._node(self.pager.header["root"])
+
+    def _create_node(self, leaf=False):
+        return PagedNode(self, leaf)
+
+    def _discard_node(self, node):
+        self.discarded.append(node)
+
+    def _node(self, page: int):
+        # Узел по номеру первой страницы; не прочитанный ещё узел возвращается заглушкой без чтения с диска
+        node = self.nodes.get(page)
+        if node is None:
+            node = PagedNode(self, page=page)
+            self.nodes[page] = node
+        return node
+
+    def _read_node(self, node):
+        # node.pages заполняется последним: другие потоки считают узел прочитанным только после заполнения всех полей
+        with self.lock:
+            if node.pages is not None:  # Узел уже прочитал другой поток
+                return
+            self._release()
+            pages, data = self.pager.read_chain(node.page)
+            leaf, keys, values, child_pages, *rest = json.loads(data)
+            node._leaf, node._keys, node._values = leaf, keys, values
+            node.child_pages = child_pages
+            node._children = [self._node(page) for page in child_pages]
+            node.next_page = rest[0] if rest else 0
+            node._next = self._node(node.next_page) if node.next_page else None
+            node.saved = data
+            node.pages = pages
+            self.node_reads += 1
+
+    def _release(self):
+        # Неизменённые узлы можно в любой момент перечитать с диска - сбрасываем их, когда их становится слишком много
+        if not self.dirty and len(self.nodes) > self.MAX_LOADED_NODES and self.root.page:
+            self.nodes = {}
+            self.root = self._node(self.root.page)
+
+    def pin(self):
+        # Читает все узлы в память и больше не выгружает их
+        self.MAX_LOADED_NODES = float("inf")
+        nodes = [self.root]
+        while nodes:
+            nodes.extend(nodes.pop().children)
+
+    def insert(self, key, value):
+        self.dirty = True
+        super().insert(key, value)
+
+    def delete(self, key, node=None):
+        self.dirty = True
+        super().delete(key, node)
+
+    def remove_key_value(self, key, value: str):
+        self.dirty = True
+        super().remove_key_value(key, value)
+
+    def remove_value(self, value: str, node=None):
+        self.dirty = True
+        super().remove_value(value, node)
+
+    def bulk_load(self, entries):
+        self.dirty = True
+        super().bulk_load(entries)
+
+    def _bulk_done(self, node):
+        # Готовый узел сразу пишется в свои страницы, в памяти от него остаётся только заглушка с номером страницы
+        for item in (node, node._next):
+            if item is not None and not item.pages:     # Страница нужна и следующему листу - на неё ссылается готовый лист
+                item.pages = [self.pager.allocate()]
+                item.page = item.pages[0]
+                self.nodes[item.page] = item
+        self._flush_node(node)
+        node.pages = None
+        node._keys = node._values = node._children = node._next = None
+        if len(self.pager.pending) >= self.BULK_PENDING_PAGES:
+            self.pager.write_pending()
+
+    def flush(self) -> int:
+        # Записывает на диск изменившиеся узлы и заголовок. Возвращает число записанных страниц
+        self._allocate_pages(self.root)  # Сначала страницы новым узлам - на них ссылаются родители и соседние листья
+        root_page = self._flush_node(self.root)
+        for node in self.discarded:
+            if node.pages:
+                self.nodes.pop(node.page, None)
+                self.pager.free_chain(node.pages)
+        self.discarded = []
+
+        self.pager.header["root"] = root_page
+        self.pager.header["meta"] = self.meta
+        written = self.pager.commit()
+        self.dirty = False
+        self._release()
+        return written
+
+    def _allocate_pages(self, node):
+        if node.pages is None:  # Не прочитанный узел не менялся
+            return
+        if not node.pages:
+            node.pages = [self.pager.allocate()]
+            node.page = node.pages[0]
+        for child in node._children:
+            self._allocate_pages(child)
+
+    def _flush_node(self, node) -> int:
+        if node.pages is None:
+            return node.page
+        node.child_pages = [self._flush_node(child) for child in node._children]
+        node.next_page = node._next.page if node._next is not None else 0
+
+        record = [node._leaf, node._keys, node._values, node.child_pages]
+        if self.KIND == "bplus":
+            record.append(node.next_page)
+        data = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if data != node.saved:
+            node.pages = self.pager.write_chain(node.pages, data)
+            node.saved = data
+        self.nodes[node.page] = node
+        return node.page
+
+
+class PagedBTree(PagedTree, BTree):
+    KIND = "btree"
+
+
+class PagedBPlusTree(PagedTree, BPlusTree):
+    KIND = "bplus"
+
+
+TREE_KINDS = {
+    "btree": PagedBTree,
+    "bplus": PagedBPlusTree,
+}
+
+
+def open_tree(path: str):
+    # Открывает файл индекса деревом того вида, которым он был создан
+    return TREE_KINDS[Pager(path).header.get("kind", "btree")](path)
@@ -1,190 +1,318 @@
 import re
+import json
+import operator
+import functools
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
 
+QUERY_OPTIONS = ("@limit", "@skip", "@sort")   # Параметры выдачи на верхнем уровне запроса - не условия на документы
+ID_FIELD = "_id"                                # Поле проекции, в которое выдаётся id документа
+
+
+def split_options(query: dict) -> tuple:
+    # Отделяет параметры выдачи от условий: {"age": 18, "@limit": 10} -> ({"age": 18}, {"@limit": 10})
+    conditions = {key: value for key, value in query.items() if key not in QUERY_OPTIONS}
+    options = {key: value for key, value in query.items() if key in QUERY_OPTIONS}
+    for key in ("@limit", "@skip"):
+        value = options.get(key, 0)
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError(f"{key} must be a non-negative integer")
+    if "@sort" in options:
+        options["@sort"] = parse_sort(options["@sort"])
+    return conditions, options
+
+
+def parse_sort(sort) -> tuple:
+    # Порядок выдачи: "age", ["age", "desc"], ("age", -1) -> (поле, по убыванию)
+    if isinstance(sort, str):
+        return sort, False
+    if isinstance(sort, (list, tuple)) and len(sort) == 2 and isinstance(sort[0], str):
+        field, direction = sort
+        if direction in ("asc", 1, False):
+            return field, False
+        if direction in ("desc", -1, True):
+            return field, True
+    raise ValueError("sort must be a field or [field, 'asc' | 'desc']")
+
+
+def sort_key(values: list, descending: bool = False) -> tuple:
+    # Ключ сортировки документа по значениям поля (как из get_value). Несколько значений - по наименьшему
+    # (по убыванию - по наибольшему). Числа идут раньше строк, строки раньше прочих значений; документы без поля - всегда в конце
+    if not values:
+        return (-1,) if descending else (3,)
+    ranked = []
+    for value in values:
+        if isinstance(value, (int, float)):
+            ranked.append((0, value))
+        elif isinstance(value, str):
+            ranked.append((1, value))
+        else:
+            ranked.append((2, json.dumps(value, sort_keys=True, default=str)))
+    return max(ranked) if descending else min(ranked)
+
+
+COMPARISONS = {"@eq": operator.eq, "@ne": operator.ne, "@gt": operator.gt, "@lt": operator.lt,
+               "@gte": operator.ge, "@lte": operator.le}
+DATE_PARTS = {"@year": "year", "@month": "month", "@day": "day"}
+SECONDS_PER_DAY = 86400
+NOT_A_DATE = float("-inf")     # Ключ индекса поля-даты для значений, которые не являются датой (меньше любой даты)
+
+# Оценки условий для порядка проверки: (стоимость проверки одного значения, доля документов, которые условие пропускает).
+# Первыми проверяются дешёвые и отсеивающие много документов условия: равенство раньше регулярных выражений и разбора дат
+OPERATOR_ESTIMATES = {"@eq": (1, 0.1), "@ne": (1, 0.9), "@gt": (1, 0.5), "@lt": (1, 0.5), "@gte": (1, 0.5),
+                      "@lte": (1, 0.5), "@abs": (1, 0.1), "@round": (1, 0.1), "@length": (1, 0.3),
+                      "@regex": (10, 0.3), "@year": (20, 0.3), "@month": (20, 0.3), "@day": (20, 0.3)}
+UNKNOWN_ESTIMATE = (1, 0.0)     # Неизвестный оператор не пропускает ничего
+FIELD_COST = 2                  # Стоимость извлечения значений поля из документа
+PLAN_CACHE_SIZE = 1024          # Сколько скомпилированных запросов хранить
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_date(value: str):
+    # Дата из ISO-строки (None - не дата); повторяющиеся значения не разбираются заново
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def date_key(value):
+    # Ключ индекса поля-даты: целое число секунд от 0001-01-01 - сортируется как даты, сутки не перекрываются
+    date = parse_date(value) if isinstance(value, str) else None
+    if date is None:
+        return NOT_A_DATE
+    return date.toordinal() * SECONDS_PER_DAY + date.hour * 3600 + date.minute * 60 + date.second
+
+
+def _canonical(value):
+    # Каноническая форма запроса для кэша: порядок ключей словарей не важен, типы значений различаются (1, 1.0 и True - разные)
+    if isinstance(value, dict):
+        return "dict", tuple(sorted((repr(key), _canonical(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(_canonical(item) for item in value)
+    return type(value).__name__, repr(value)
+
+
+_plans = OrderedDict()  # {(get_value, каноническая форма запроса): предикат} - LRU-кэш скомпилированных запросов
+_plans_lock = threading.Lock()
+
+
+class Conjunct:
+    # Одно из условий, которые должны выполняться одновременно: предикат с оценкой стоимости и доли пропускаемых документов
+    __slots__ = ("predicate", "cost", "selectivity")
+
+    def __init__(self, predicate, cost: float, selectivity: float):
+        self.predicate = predicate
+        self.cost = cost
+        self.selectivity = selectivity
+
+    def rank(self) -> float:    # Чем больше документов отсеивается на единицу стоимости, тем раньше проверка
+        return (1 - self.selectivity) / self.cost if self.cost else float("inf")
+
+
 class QueryEngine:
     def __init__(self, collection):
         self.collection = collection
 
     def parse_query(self, query: dict):
-        # Преобразует запрос в функцию-предикат.
-        # Обрабатываем сначала все логические операторы (@or, @and, @not), добавляя их в список условий, а затем – все поля.
-
-        conditions = []  # Все условия, которые были заданы
-
-        # Обработка логических операторов
-        if "@or" in query:
-            or_operators = [self.parse_query(sub_query) for sub_query in
-                            query["@or"]]  # Сбор всех подусловий как функций
-
-            def or_predicate(json_document: dict) -> bool:  # Возвращает True, если хоть одна подфункция вернула True
-                return any(or_operator(json_document) for or_operator in or_operators)
-
-            conditions.append(or_predicate)
-
-        if "@and" in query:
-            and_operators = [self.parse_query(sub_query) for sub_query in query["@and"]]
-
-            def and_predicate(json_document: dict) -> bool:  # Возвращающает True, если все подфункции вернут True
-                return all(and_operator(json_document) for and_operator in and_operators)
-
-            conditions.append(and_predicate)
-
-        if "@not" in query:
-            not_operator = self.parse_query(query["@not"])
-
-            def not_predicate(json_document: dict) -> bool:
-                return not not_operator(json_document)
-
-            conditions.append(not_predicate)
-
-        # Обработка полей и условий
+        # Преобразует запрос в функцию-предикат. Запрос компилируется один раз (результат кэшируется по канонической форме):
+        # операторы разбираются при компиляции, вложенные @and раскрываются в общий список условий, условия на одно поле
+        # проверяются по одному извлечению значений, условия упорядочиваются - сначала дешёвые и отсеивающие больше документов
+
+        key = (self.collection.get_value, _canonical(query))
+        with _plans_lock:
+            predicate = _plans.get(key)
+            if predicate is not None:
+                _plans.move_to_end(key)
+                return predicate
+
+        predicate = self._compile(query).predicate
+        with _plans_lock:
+            _plans[key] = predicate
+            if len(_plans) > PLAN_CACHE_SIZE:
+                _plans.popitem(last=False)
+        return predicate
+
+    def _compile(self, query: dict) -> Conjunct:
+        fields = {}         # {поле: [(проверка списка значений, стоимость, доля)]}
+        conjuncts = []
+        self._collect(query, fields, conjuncts)
+        for field, checks in fields.items():
+            conjuncts.append(self._field_conjunct(field, checks))
+        return self._conjunction(conjuncts)
+
+    def _collect(self, query: dict, fields: dict, conjuncts: list):
+        # Раскладывает запрос на условия: поля - в fields, логические операторы - в conjuncts; @and раскрывается на месте
         for field, condition in query.items():
-            if field in ("@or", "@and", "@not"):
-                continue
-
-            if isinstance(condition, dict):  # Если условие в словаре
-                for operator, value in condition.items():
-                    if operator == "@regex":
-                        conditions.append(self._regex_condition(field, value))
-                    elif operator == "@length":
-                        conditions.append(self._length_condition(field, value))
-                    # elif operator == "@lower":
-                    #     conditions.append(self.lower_condition(field, value))
-                    # elif operator == "@upper":
-                    #     conditions.append(self.upper_condition(field, value))
-                    else:  # Всё, что не является специальными функциями
-                        conditions.append(self._create_condition(field, operator, value))
+            if field == "@and":
+                for sub_query in condition:
+                    self._collect(sub_query, fields, conjuncts)
+            elif field == "@or":
+                conjuncts.append(self._disjunction([self._compile(sub_query) for sub_query in condition]))
+            elif field == "@not":
+                conjuncts.append(self._negation(self._compile(condition)))
+            elif isinstance(condition, dict):
+                for operator_name, value in condition.items():
+                    fields.setdefault(field, []).append(self._operator_check(operator_name, value))
+            elif isinstance(condition, (str, int, float, bool)):
+                fields.setdefault(field, []).append((self._plain_check(condition),) + OPERATOR_ESTIMATES["@eq"])
             else:
-                if isinstance(condition, (str, int, float, bool)):
-                    conditions.append(self._list_variable_condition(field, condition))
-                else:
-                    conditions.append(self._create_condition(field, "@eq", condition))
-
-        return lambda json_document: all(cond(json_document) for cond in conditions)
-
-    def _create_condition(self, field, operator: str, value):
-        # Для поля field и операции operator создаёт предикат, сравнивающий реальное значение из документа с value.
-
-        def check(json_document):  # Будет вызываться для каждого документа
-            doc_value = self.collection.get_value(json_document, field)
-            if doc_value is None:
-                return False
-
-            if isinstance(doc_value, list):
-                if operator == "@eq":  # Оператор ==
-                    return value in doc_value  # True, если искомое значение есть в списке
-                elif operator == "@ne":  # Оператор !=
-                    return value not in doc_value  # True, если искомого значения нет в списке
-
-                # Для всех остальных операторов пробегаем по элементам и сравниваем
-                return any(self._compare_items(item, operator, value) for item in doc_value)
-
-            # Если значение не список (одно значение), используем общий метод сравнения
-            return self._compare_items(doc_value, operator, value)
-
-        return check
-
-    def _compare_items(self, doc_value, operator: str, value) -> bool:
-        # Сравнивает между собой значение в документе и заданное значение
-
-        # Числовые специальные операторы
-        if isinstance(doc_value, (int, float)):
-            if operator == "@abs":
-                return abs(doc_value) == value
-            if operator == "@round":
-                return round(doc_value) == value
-
-        # Общие сравнения: =, !=, >, <, >=, <=
-        try:
-            if operator == "@eq": return doc_value == value
-            if operator == "@ne": return doc_value != value
-            if operator == "@gt": return doc_value > value
-            if operator == "@lt": return doc_value < value
-            if operator == "@gte": return doc_value >= value
-            if operator == "@lte": return doc_value <= value
-        except TypeError:  # Если типы несравнимы (например, str > int)
+                fields.setdefault(field, []).append(self._operator_check("@eq", condition))
+
+    def _conjunction(self, conjuncts: list) -> Conjunct:
+        if not conjuncts:
+            return Conjunct(lambda json_document: True, 0, 1.0)
+        if len(conjuncts) == 1:
+            return conjuncts[0]
+        conjuncts.sort(key=Conjunct.rank, reverse=True)
+        predicates = tuple(conjunct.predicate for conjunct in conjuncts)
+
+        def and_predicate(json_document: dict) -> bool:
+            for predicate in predicates:
+                if not predicate(json_document):
+                    return False
+            return True
+
+        cost, selectivity, passed = 0, 1.0, 1.0
+        for conjunct in conjuncts:  # Следующее условие проверяется только у документов, прошедших предыдущие
+            cost += passed * conjunct.cost
+            passed *= conjunct.selectivity
+        return Conjunct(and_predicate, cost, passed)
+
+    def _disjunction(self, conjuncts: list) -> Conjunct:
+        # Сначала - условия, пропускающие больше документов на единицу стоимости (раньше находят совпадение)
+        conjuncts.sort(key=lambda conjunct: conjunct.selectivity / conjunct.cost if conjunct.cost else 1.0, reverse=True)
+        predicates = tuple(conjunct.predicate for conjunct in conjuncts)
+
+        def or_predicate(json_document: dict) -> bool:
+            for predicate in predicates:
+                if predicate(json_document):
+                    return True
             return False
 
-        # Строковые операции и работа с датами
-        if isinstance(doc_value, str):
-            # Регистр
-            # if operator == "@lower":
-            #     return doc_value.lower() == value.lower()
-            # if operator == "@upper":
-            #     return doc_value.upper() == value.upper()
-
-            # Подстроковые операции
-            # if operator == "@contains":
-            #     return value.lower() in doc_value.lower()
-            # if operator == "@startswith":
-            #     return doc_value.lower().startswith(value.lower())
-            # if operator == "@endswith":
-            #     return doc_value.lower().endswith(value.lower())
-
-            try:  # Для работы с датами (как ISO-строка)
-                doc_date = datetime.fromisoformat(doc_value)
-                if operator == "@year":
-                    return doc_date.year == value
-                if operator == "@month":
-                    return doc_date.month == value
-                if operator == "@day":
-                    return doc_date.day == value
-            except ValueError:  # Не дата
-                pass
-
-        return False  # Если не сработало ни одно условие
-
-    def _list_variable_condition(self, field, value):
+        failed = 1.0
+        for conjunct in conjuncts:
+            failed *= 1 - conjunct.selectivity
+        return Conjunct(or_predicate, sum(conjunct.cost for conjunct in conjuncts), 1 - failed)
+
+    def _negation(self, conjunct: Conjunct) -> Conjunct:
+        predicate = conjunct.predicate
+        return Conjunct(lambda json_document: not predicate(json_document), conjunct.cost, 1 - conjunct.selectivity)
+
+    def _field_conjunct(self, field: str, checks: list) -> Conjunct:
+        # Все условия на одно поле: значения извлекаются один раз, проверки - по возрастанию стоимости на отсеянный документ
+        checks.sort(key=lambda check: (1 - check[2]) / check[1], reverse=True)
+        tests = tuple(check[0] for check in checks)
+        get_value = self.collection.get_value
+
+        if len(tests) == 1:
+            test = tests[0]
+
+            def field_predicate(json_document: dict) -> bool:
+                return test(get_value(json_document, field))
+        else:
+            def field_predicate(json_document: dict) -> bool:
+                values = get_value(json_document, field)
+                for test in tests:
+                    if not test(values):
+                        return False
+                return True
+
+        cost, selectivity = FIELD_COST, 1.0
+        for _, check_cost, check_selectivity in checks:
+            cost += selectivity * check_cost
+            selectivity *= check_selectivity
+        return Conjunct(field_predicate, cost, selectivity)
+
+    def _operator_check(self, operator_name: str, value) -> tuple:
+        # (проверка списка значений поля, стоимость, доля) для условия {"@оператор": value}
+        cost, selectivity = OPERATOR_ESTIMATES.get(operator_name, UNKNOWN_ESTIMATE)
+        if operator_name == "@regex":
+            return self._regex_check(value), cost, selectivity
+        if operator_name == "@length":
+            return self._length_check(value), cost, selectivity
+        if operator_name == "@eq":
+            return (lambda values: value in values), cost, selectivity    # True, если искомое значение есть в списке
+        if operator_name == "@ne":
+            return (lambda values: value not in values), cost, selectivity
+
+        test = self._item_test(operator_name, value)     # Для остальных операторов - хотя бы одно значение подходит
+        return (lambda values: any(map(test, values))), cost, selectivity
+
+    def _item_test(self, operator_name: str, value):
+        # Проверка одного значения из документа; оператор разбирается здесь один раз, а не для каждого значения
+        if operator_name in ("@abs", "@round"):
+            function = abs if operator_name == "@abs" else round
+            return lambda item: isinstance(item, (int, float)) and function(item) == value
+
+        if operator_name in COMPARISONS:
+            compare = COMPARISONS[operator_name]
+
+            def compare_test(item) -> bool:
+                try:
+                    return compare(item, value)
+                except TypeError:  # Если типы несравнимы (например, str > int)
+                    return False
+
+            return compare_test
+
+        if operator_name in DATE_PARTS:  # Для работы с датами (как ISO-строка)
+            part = DATE_PARTS[operator_name]
+
+            def date_test(item) -> bool:
+                date = parse_date(item) if isinstance(item, str) else None
+                return date is not None and getattr(date, part) == value
+
+            return date_test
+
+        return lambda item: False  # Неизвестный оператор
+
+    def _plain_check(self, value):
         # Если значение в документе - список или простое значение (пример: "field": value, а не {"@op": ...})
 
-        def check(json_document: dict) -> bool:
-            doc_value = self.collection.get_value(json_document, field)
-            if not doc_value:
+        def check(values: list) -> bool:
+            if not values:
                 return False
 
-            if len(doc_value) == 1:
-                single = doc_value[0]
+            if len(values) == 1:
+                single = values[0]
                 if isinstance(single, list):
                     return value in single  # распаковываем список-значение
                 return single == value  # обычное сравнение для скаляра
-                # несколько отдельных совпадений
-            return value in doc_value
+            return value in values  # несколько отдельных совпадений
 
         return check
 
-    def _regex_condition(self, field, pattern):
-        # Предикат: True, если в любом из значений поля field найдено совпадение с регуляркой pattern
+    def _regex_check(self, pattern):
+        # True, если в любом из значений поля найдено совпадение с регуляркой pattern
 
         try:
             prog = re.compile(pattern)
         except re.error:
             # Некорректное регулярное выражение — всегда False
-            return lambda json_document: False
+            return lambda values: False
 
-        def check(json_document: dict) -> bool:
-            doc_value = self.collection.get_value(json_document, field)
-            if not doc_value:
-                return False
-            for value in doc_value:
+        def check(values: list) -> bool:
+            for value in values:
                 if prog.search(str(value)):
                     return True
             return False
 
         return check
 
-    def _length_condition(self, field, length):
-        # Предикат: True, если длина значения поля равна length
+    def _length_check(self, length):
+        # True, если длина значения поля равна length
         # – 1 значение в doc_value: len(doc_value[0])
         # – несколько значений: len(doc_value) == length
 
-        def check(json_document: dict) -> bool:
-            doc_value = self.collection.get_value(json_document, field)
-            if not doc_value:
+        def check(values: list) -> bool:
+            if not values:
                 return False
             # один результат — проверяем длину самого объекта
-            if len(doc_value) == 1:
-                value = doc_value[0]
+            if len(values) == 1:
+                value = values[0]
                 if isinstance(value, (str, list)):
                     return len(value) == length
                 if isinstance(value, (int, float)):
@@ -192,7 +320,7 @@ class QueryEngine:
                 return False
 
             # несколько результатов — проверяем размер списка
-            return len(doc_value) == length
+            return len(values) == length
 
         return check
 
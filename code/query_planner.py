@@ -0,0 +1,545 @@
+import heapq
+
+from code.indexation import RANGE_OPERATORS
+from code.query_engine import ID_FIELD, DATE_PARTS, sort_key
+
+# Условные стоимости операций планировщика (в "чтениях документа")
+SCAN_COST = 1.0         # Чтение и проверка одного документа при полном переборе
+FETCH_COST = 1.5        # Чтение одного документа по id после поиска по индексу (вразнобой - дороже перебора подряд)
+INDEX_ID_COST = 0.01    # Получение одного id из B-дерева
+CONDITION_COST = 0.05   # Проверка одного условия запроса на одном документе
+RANGE_SELECTIVITY = 1 / 3   # Доля ключей для диапазона, если её нельзя оценить по min/max ключам
+SCAN_SELECTIVITY = 0.1     # Доля документов, подходящих под условие без индекса (оценка вслепую)
+SORT_COST = 0.05        # Вычисление ключа сортировки и место в куче для одного документа
+DATE_PART_SELECTIVITY = {"@year": 1 / 5, "@month": 1 / 12, "@day": 1 / 30}   # Доля ключей поля-даты для @year/@month/@day
+
+
+def count_conditions(query: dict) -> int:
+    # Количество элементарных условий в запросе (для оценки стоимости проверки документа)
+    count = 0
+    for field, condition in query.items():
+        if field in ("@or", "@and"):
+            count += sum(count_conditions(sub_query) for sub_query in condition)
+        elif field == "@not":
+            count += count_conditions(condition)
+        elif isinstance(condition, dict):
+            count += len(condition)
+        else:
+            count += 1
+    return count
+
+
+class PlanNode:
+    # Узел плана. execute() возвращает множество id документов-кандидатов
+
+    name = ""
+
+    def __init__(self, estimated_rows: float, children=()):
+        self.estimated_rows = estimated_rows
+        self.children = list(children)
+        self.actual_rows = None     # Заполняется после выполнения
+
+    def cost(self) -> float:
+        return sum(child.cost() for child in self.children)
+
+    def execute(self) -> set:
+        raise NotImplementedError
+
+    def details(self) -> str:
+        return ""
+
+    def explain(self, depth: int = 0) -> list:
+        # Возвращает строки плана с отступом по глубине
+        actual = "-" if self.actual_rows is None else self.actual_rows
+        line = f"{'  ' * depth}{self.name}{' ' + self.details() if self.details() else ''} " \
+               f"(estimated rows: {round(self.estimated_rows)}, actual rows: {actual}, cost: {round(self.cost(), 2)})"
+        lines = [line]
+        for child in self.children:
+            lines.extend(child.explain(depth + 1))
+        return lines
+
+
+class IndexSeek(PlanNode):
+    # Поиск одного ключа (@eq) или всех, кроме одного (@ne), в B-дереве
+    name = "IndexSeek"
+
+    def __init__(self, indexation, field: str, operator: str, value, estimated_rows: float):
+        super().__init__(estimated_rows)
+        self.indexation = indexation
+        self.field = field
+        self.operator = operator
+        self.value = value
+
+    def cost(self) -> float:
+        return self.estimated_rows * INDEX_ID_COST
+
+    def execute(self) -> set:
+        ids = self.indexation.search_operator(self.field, self.operator, self.value)
+        if ids is None:     # Типы значения и ключей несравнимы - кандидаты все документы, проверит фильтр
+            ids = set(self.indexation.collection.get_filenames())
+        self.actual_rows = len(ids)
+        return ids
+
+    def details(self) -> str:
+        return f"{self.field} {self.operator} {self.value!r}"
+
+
+class IndexRange(PlanNode):
+    # Упорядоченный обход B-дерева между границами
+    name = "IndexRange"
+
+    def __init__(self, indexation, field: str, bounds: dict, estimated_rows: float):
+        super().__init__(estimated_rows)
+        self.indexation = indexation
+        self.field = field
+        self.bounds = bounds
+
+    def cost(self) -> float:
+        return self.estimated_rows * INDEX_ID_COST
+
+    def execute(self) -> set:
+        ids = self.indexation.search_range(self.field, self.bounds)
+        if ids is None:     # Типы границ и ключей несравнимы - кандидаты все документы, проверит фильтр
+            ids = set(self.indexation.collection.get_filenames())
+        self.actual_rows = len(ids)
+        return ids
+
+    def details(self) -> str:
+        return f"{self.field} " + " ".join(f"{operator} {value!r}" for operator, value in self.bounds.items())
+
+
+class Intersection(PlanNode):
+    # @and: пересечение множеств id
+    name = "Intersection"
+
+    def execute(self) -> set:
+        ids = None
+        for child in sorted(self.children, key=lambda node: node.estimated_rows):   # Начинаем с самого селективного
+            child_ids = child.execute()
+            ids = child_ids if ids is None else ids & child_ids
+        self.actual_rows = len(ids)
+        return ids
+
+
+class Union(PlanNode):
+    # @or: объединение множеств id
+    name = "Union"
+
+    def execute(self) -> set:
+        ids = set()
+        for child in self.children:
+            ids |= child.execute()
+        self.actual_rows = len(ids)
+        return ids
+
+
+class FullScan(PlanNode):
+    # Перебор всех документов коллекции
+    name = "FullScan"
+
+    def __init__(self, collection, estimated_rows: float):
+        super().__init__(estimated_rows)
+        self.collection = collection
+
+    def cost(self) -> float:
+        return self.estimated_rows * SCAN_COST
+
+    def execute(self) -> set:
+        ids = set(self.collection.get_filenames())
+        self.actual_rows = len(ids)
+        return ids
+
+
+class ScanFilter(PlanNode):
+    # Перебор всей коллекции только для веток @or, на которые нет индекса.
+    # Найденные документы запоминаются, чтобы Filter не читал их повторно
+    name = "ScanFilter"
+
+    def __init__(self, collection, query: dict, query_func, total_rows: int):
+        super().__init__(total_rows * SCAN_SELECTIVITY)
+        self.collection = collection
+        self.query = query
+        self.query_func = query_func
+        self.total_rows = total_rows
+        self.documents = {}     # {id: json-документ} - документы, прошедшие проверку
+
+    def cost(self) -> float:
+        return self.total_rows * (SCAN_COST + CONDITION_COST * count_conditions(self.query))
+
+    def execute(self) -> set:
+        self.documents = dict(self.collection.scan(self.query, self.query_func))
+        self.actual_rows = len(self.documents)
+        return set(self.documents)
+
+    def details(self) -> str:
+        return str(self.query)
+
+
+class Filter(PlanNode):
+    # Корень плана: читает документы-кандидаты и проверяет на них весь запрос (остаточный фильтр)
+    name = "Filter"
+
+    def __init__(self, collection, source: PlanNode, query: dict, query_func, projection=None):
+        super().__init__(source.estimated_rows, [source])
+        self.collection = collection
+        self.source = source
+        self.query = query
+        self.query_func = query_func
+        self.projection = projection    # Список полей, которые нужно выдать (None - документ целиком)
+
+    def cost(self) -> float:
+        check_cost = self.source.estimated_rows * CONDITION_COST * count_conditions(self.query)
+        if isinstance(self.source, FullScan):
+            return self.source.cost() + check_cost
+        prefetched_rows = sum(node.estimated_rows for node in self._scan_filters(self.source))
+        return self.source.cost() + max(self.source.estimated_rows - prefetched_rows, 0) * FETCH_COST + check_cost
+
+    def _scan_filters(self, node: PlanNode) -> list:
+        if isinstance(node, ScanFilter):
+            return [node]
+        return [scan_filter for child in node.children for scan_filter in self._scan_filters(child)]
+
+    def execute(self) -> list:
+        return list(self.stream())  # Список всех, подходящих под условие, json-документов
+
+    def stream(self):
+        # Генератор подходящих json-документов по мере нахождения: если перестать его читать,
+        # оставшиеся документы не читаются и не проверяются
+        for filename, json_document in self.rows():
+            yield self._output(filename, json_document)
+
+    def rows(self):
+        # Генератор подходящих пар (id, json-документ) до проекции
+        self.actual_rows = 0
+        if isinstance(self.source, FullScan):   # Полный перебор - читаем документы подряд (или частями в пуле процессов), без поиска по id
+            self.source.actual_rows = self.source.estimated_rows
+            for filename, json_document in self.collection.scan(self.query, self.query_func):
+                self.actual_rows += 1
+                yield filename, json_document
+        else:
+            filenames = self.source.execute()
+            prefetched = {}     # Документы, уже прочитанные при переборе в ScanFilter
+            for scan_filter in self._scan_filters(self.source):
+                prefetched.update(scan_filter.documents)
+            for filename in filenames:
+                json_document = prefetched.get(filename) or self.collection.get_json(filename)
+                if json_document and self.query_func(json_document):
+                    self.actual_rows += 1
+                    yield filename, json_document
+
+    def _output(self, filename: str, json_document: dict):
+        if self.projection is None:
+            return json_document
+        return self.collection.project(filename, json_document, self.projection)
+
+    def details(self) -> str:
+        return str(self.query)
+
+
+class Sort(PlanNode):
+    # Упорядочивание результата Filter по полю. Если нужны только первые count документов - куча из count элементов
+    # (top-k за O(N log k) и O(k) памяти), иначе - полная сортировка
+    name = "Sort"
+
+    def __init__(self, source: Filter, field: str, descending: bool, count: int = None):
+        rows = source.estimated_rows if count is None else min(source.estimated_rows, count)
+        super().__init__(rows, [source])
+        self.source = source
+        self.field = field
+        self.descending = descending
+        self.count = count
+
+    def cost(self) -> float:
+        return self.source.cost() + self.source.estimated_rows * SORT_COST
+
+    def execute(self) -> list:
+        return list(self.stream())
+
+    def stream(self):
+        get_value = self.source.collection.get_value
+
+        def key(row):
+            return sort_key(get_value(row[1], self.field), self.descending)
+
+        rows = self.source.rows()
+        if self.count is None:
+            ordered = sorted(rows, key=key, reverse=self.descending)
+        elif self.descending:
+            ordered = heapq.nlargest(self.count, rows, key=key)
+        else:
+            ordered = heapq.nsmallest(self.count, rows, key=key)
+
+        self.actual_rows = 0
+        for filename, json_document in ordered:
+            self.actual_rows += 1
+            yield self.source._output(filename, json_document)
+
+    def details(self) -> str:
+        return f"{self.field} {'desc' if self.descending else 'asc'}" + ("" if self.count is None else f", top {self.count}")
+
+
+class IndexOrderScan(PlanNode):
+    # Выдача в порядке ключей точного индекса поля сортировки: документы читаются по мере обхода дерева
+    # и проверяются фильтром, обход останавливается, как только выдано нужное число документов.
+    # Если у фильтра есть план по индексам, документы не из его множества id пропускаются без чтения
+    name = "IndexOrderScan"
+
+    def __init__(self, filter_node: Filter, field: str, descending: bool, estimated_rows: float, cost: float):
+        indexed = not isinstance(filter_node.source, FullScan)
+        super().__init__(estimated_rows, [filter_node.source] if indexed else [])
+        self.filter = filter_node
+        self.field = field
+        self.descending = descending
+        self.indexed = indexed
+        self.walk_cost = cost
+
+    def cost(self) -> float:
+        return self.walk_cost
+
+    def execute(self) -> list:
+        return list(self.stream())
+
+    def stream(self):
+        collection = self.filter.collection
+        btree = collection.indexation.get_indexes()[self.field].btree
+        candidates = self.filter.source.execute() if self.indexed else None
+
+        self.actual_rows = 0
+        seen = set()
+        pairs = btree.reverse_search() if self.descending else btree.range_search()
+        ordered = (filename for _, filenames in pairs for filename in filenames)
+        for filename in ordered:
+            if filename in seen:    # Документ с несколькими значениями уже выдан по наименьшему (наибольшему) из них
+                continue
+            seen.add(filename)
+            yield from self._check(filename, candidates)
+        for filename in collection.get_filenames():     # Документы без поля сортировки - в конце
+            if filename not in seen:
+                yield from self._check(filename, candidates)
+
+    def _check(self, filename: str, candidates):
+        if candidates is not None and filename not in candidates:
+            return
+        json_document = self.filter.collection.get_json(filename)
+        if json_document and self.filter.query_func(json_document):
+            self.actual_rows += 1
+            yield self.filter._output(filename, json_document)
+
+    def details(self) -> str:
+        return f"{self.field} {'desc' if self.descending else 'asc'}"
+
+
+class IndexOnlyScan(PlanNode):
+    # Корень плана, когда и условия, и поля проекции покрыты точными индексами: id находятся по индексам,
+    # значения полей берутся из обратных отображений индексов - файлы документов не открываются
+    name = "IndexOnlyScan"
+
+    def __init__(self, collection, source: PlanNode, projection: list, skip_empty: bool = False):
+        super().__init__(source.estimated_rows, [source])
+        self.collection = collection
+        self.source = source
+        self.projection = projection
+        self.skip_empty = skip_empty    # Источник может выдать пустые документы {} (все id, @ne) - их, как и перебор, пропускаем
+
+    def execute(self) -> list:
+        return list(self.stream())
+
+    def ids(self) -> set:
+        # id подходящих документов - те же, что выдал бы перебор
+        ids = self.source.execute()
+        if self.skip_empty:
+            ids = ids - set(self.collection.get_empty_filenames())
+        return ids
+
+    def stream(self):
+        self.actual_rows = 0
+        indexes = self.collection.indexation.get_indexes()
+        keys_by_id = {field: indexes[field].keys_by_id for field in self.projection if field != ID_FIELD}
+        for filename in self.ids():
+            values = {field: keys.get(filename, []) for field, keys in keys_by_id.items()}
+            self.actual_rows += 1
+            yield self.collection.make_projection(filename, values, self.projection)
+
+    def details(self) -> str:
+        return ", ".join(self.projection)
+
+
+class QueryPlanner:
+    # Строит план выполнения запроса: выбирает индексы по оценке стоимости, иначе - полный перебор
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def plan(self, query: dict, projection: list = None, sort: tuple = None, count: int = None) -> PlanNode:
+        # projection - список полей для выдачи (None - документы целиком)
+        # sort - (поле, по убыванию): порядок выдачи; count - сколько первых документов понадобится (None - все)
+        indexation = self.collection.indexation
+        total_rows = sum(1 for _ in self.collection.get_filenames())
+        if projection and sort is None:
+            covered = self._plan_index_only(query, projection, indexation, total_rows)
+            if covered is not None:
+                return covered
+
+        plan = self._plan_filter(query, projection, indexation, total_rows)
+        if sort is None:
+            return plan
+        return self._plan_sort(plan, sort, count, indexation, total_rows)
+
+    def _plan_sort(self, plan: Filter, sort: tuple, count, indexation, total_rows: int) -> PlanNode:
+        # Обход индекса поля сортировки (останавливается после count документов) или куча top-k поверх фильтра - что дешевле
+        field, descending = sort
+        sorted_plan = Sort(plan, field, descending, count)
+        index = indexation.get_indexes()[field] if field in indexation.get_indexes() else None
+        if index is None or not index.exact:
+            return sorted_plan
+
+        matches = plan.estimated_rows
+        needed = matches if count is None else min(count, matches)
+        walk_rows = total_rows if matches <= 0 else min(total_rows, needed * total_rows / matches)  # Сколько id обойти до needed совпадений
+        fetch_rows = walk_rows
+        cost = walk_rows * INDEX_ID_COST
+        if not isinstance(plan.source, FullScan):   # Читаются только кандидаты из индексов фильтра
+            fetch_rows = walk_rows * plan.source.estimated_rows / total_rows if total_rows else 0
+            cost += plan.source.cost()
+        cost += fetch_rows * (FETCH_COST + CONDITION_COST * count_conditions(plan.query))
+
+        index_order = IndexOrderScan(plan, field, descending, needed, cost)
+        return index_order if index_order.cost() < sorted_plan.cost() else sorted_plan
+
+    def _plan_filter(self, query: dict, projection, indexation, total_rows: int) -> Filter:
+        # Доступ по индексам или полный перебор - по оценке стоимости, с остаточным фильтром
+        source = self._plan_conjunction(query, indexation, total_rows)
+
+        query_func = self.collection.query_engine.parse_query(query)
+        full_scan = Filter(self.collection, FullScan(self.collection, total_rows), query, query_func, projection)
+        if source is None:
+            return full_scan
+        indexed = Filter(self.collection, source, query, query_func, projection)
+        return indexed if indexed.cost() < full_scan.cost() else full_scan
+
+    def _plan_index_only(self, query: dict, projection: list, indexation, total_rows: int):
+        # План без чтения документов: каждое условие - точный поиск по индексу (@eq, @ne, границы) на поле с точным индексом,
+        # каждое поле проекции - поле с точным индексом. Иначе None
+        indexes = indexation.get_indexes()
+        if not all(field == ID_FIELD or (field in indexes and indexes[field].exact) for field in projection):
+            return None
+
+        nodes = []
+        for field, condition in query.items():
+            if field not in indexes or not indexes[field].exact:
+                return None
+            conditions = condition if isinstance(condition, dict) else {"@eq": condition}
+            key_type = type(indexes[field].btree.min_key())
+            for operator, value in conditions.items():
+                if operator not in ("@eq", "@ne") + RANGE_OPERATORS or not indexation.is_exact(value):
+                    return None
+                if indexes[field].key_count and type(value) is not key_type:   # Несравнимые типы индекс не отсеет
+                    return None
+            nodes.extend(self._plan_field(field, conditions, indexation, total_rows))
+
+        if not nodes:
+            source = FullScan(self.collection, total_rows)   # Без условий - все id коллекции (документы не читаются)
+        elif len(nodes) == 1:
+            source = nodes[0]
+        else:
+            source = Intersection(min(node.estimated_rows for node in nodes), nodes)
+        # У документа, найденного по @eq или границам, есть значение поля - он не пуст. Иначе пустые документы отсеиваются отдельно
+        skip_empty = not any(isinstance(node, IndexRange) or node.operator == "@eq" for node in nodes)
+        return IndexOnlyScan(self.collection, source, projection, skip_empty)
+
+    def _plan_conjunction(self, query: dict, indexation, total_rows: int):
+        # Все условия запроса должны выполняться одновременно: пересекаем самые выгодные доступы по индексам.
+        # Возвращает узел плана или None, если индексы не помогают
+
+        accesses = []
+        for field, condition in query.items():
+            if field == "@and":
+                for sub_query in condition:
+                    node = self._plan_conjunction(sub_query, indexation, total_rows)
+                    if node is not None:
+                        accesses.append(node)
+            elif field == "@or":
+                node = self._plan_union(condition, indexation, total_rows)
+                if node is not None:
+                    accesses.append(node)
+            elif field in indexation.get_indexes():
+                accesses.extend(self._plan_field(field, condition, indexation, total_rows))
+
+        if not accesses:
+            return None
+
+        # Жадный выбор: добавляем доступы по возрастанию оценки, пока пересечение уменьшает общую стоимость
+        accesses.sort(key=lambda node: node.estimated_rows)
+        chosen = [accesses[0]]
+        estimated_rows = accesses[0].estimated_rows
+        best_cost = accesses[0].cost() + estimated_rows * FETCH_COST
+        for node in accesses[1:]:
+            rows = estimated_rows * node.estimated_rows / total_rows if total_rows else 0   # Условия считаем независимыми
+            cost = sum(chosen_node.cost() for chosen_node in chosen) + node.cost() + rows * FETCH_COST
+            if cost < best_cost:
+                chosen.append(node)
+                estimated_rows, best_cost = rows, cost
+
+        if len(chosen) == 1:
+            return chosen[0]
+        return Intersection(estimated_rows, chosen)
+
+    def _plan_union(self, sub_queries: list, indexation, total_rows: int):
+        # Хотя бы одно из условий должно выполняться: объединяем id по индексируемым веткам,
+        # а ветки без индекса проверяем одним перебором коллекции (ScanFilter)
+        nodes = []
+        unindexed = []
+        for sub_query in sub_queries:
+            node = self._plan_conjunction(sub_query, indexation, total_rows)
+            if node is None:
+                unindexed.append(sub_query)
+            else:
+                nodes.append(node)
+        if not nodes:
+            return None
+        if unindexed:
+            scan_query = {"@or": unindexed}
+            nodes.append(ScanFilter(self.collection, scan_query,
+                                    self.collection.query_engine.parse_query(scan_query), total_rows))
+        return Union(min(total_rows, sum(node.estimated_rows for node in nodes)), nodes)
+
+    def _plan_field(self, field: str, condition, indexation, total_rows: int) -> list:
+        index = indexation.get_indexes()[field]
+        if not isinstance(condition, dict):
+            condition = {"@eq": condition}
+
+        average_rows = index.key_count / index.distinct_keys if index.distinct_keys else 0  # Среднее число id на ключ
+        nodes = []
+        bounds = {}
+        for operator, value in condition.items():
+            if operator in ("@eq", "@ne"):
+                try:
+                    seek_rows = len(index.btree.search(indexation.to_key(value, field)))  # Точный размер списка id по ключу
+                except TypeError:
+                    seek_rows = average_rows
+            if operator == "@eq":
+                nodes.append(IndexSeek(indexation, field, operator, value, seek_rows))
+            elif operator == "@ne":
+                nodes.append(IndexSeek(indexation, field, operator, value, max(total_rows - seek_rows, 0)))
+            elif operator in RANGE_OPERATORS and field not in indexation.date_fields:
+                bounds[operator] = value
+            elif operator in DATE_PARTS and field in indexation.date_fields:
+                nodes.append(IndexSeek(indexation, field, operator, value, index.key_count * DATE_PART_SELECTIVITY[operator]))
+        if bounds:
+            nodes.append(IndexRange(indexation, field, bounds, index.key_count * self._range_selectivity(index, bounds)))
+        return nodes
+
+    def _range_selectivity(self, index, bounds: dict) -> float:
+        # Доля ключей в диапазоне: линейная интерполяция между min и max ключом дерева для чисел
+        low, high = index.btree.min_key(), index.btree.max_key()
+        numbers = [value for value in [low, high, *bounds.values()] if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        if len(numbers) != len(bounds) + 2 or high == low:
+            return RANGE_SELECTIVITY
+
+        lower, upper = low, high
+        for operator, value in bounds.items():
+            if operator in ("@gt", "@gte"):
+                lower = max(lower, value)
+            else:
+                upper = min(upper, value)
+        return min(max((upper - lower) / (high - low), 0.0), 1.0)
@@ -0,0 +1,164 @@
+import os
+import json
+import socket
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from code.database import Database
+from code.client import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_THREADS
+from code.locks import AsyncReadWriteLock
+
+READ_OPERATIONS = {"ping", "search", "explain", "aggregate", "list_jsons", "cache_stats"}   # Остальные операции меняют коллекцию
+# Изменения отдельных документов идут через журнал коллекции с групповой записью (Collection._write): их изоляцию
+# обеспечивает блокировка коллекции на время записи группы, поэтому на сервере они не ждут друг друга
+LOGGED_OPERATIONS = {"insert", "insert_many", "delete"}
+
+
+def _text(value) -> str:
+    # Документы и запросы приходят объектами JSON или строками (как в CLI) - Database принимает строки
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+class Server:
+    # Долгоживущий процесс: держит открытыми базы данных (коллекции, индексы, кэш документов) и отвечает на запросы
+    # по локальному сокету (TCP на localhost или Unix-сокет). Протокол - JSON Lines, по строке на запрос и на ответ:
+    # запрос {"op": "search", "db": "mydb/users", "query": {"age": 18}, "limit": 10}
+    # ответ {"ok": true, "result": [...]} или {"ok": false, "error": "ValueError: ..."}
+    # Соединения обслуживает цикл asyncio, сами запросы выполняются в пуле потоков. Для каждой коллекции чтения идут
+    # одновременно, а перестройка индексов, сжатие и импорт - по одному и без читателей (AsyncReadWriteLock).
+    # Вставки и удаления разных клиентов выполняются одновременно: пока один поток пишет группу в журнал (один fsync),
+    # остальные ставят свои изменения в очередь, и следующая группа уходит в журнал целиком.
+    # Между потоками и процессами (другой сервер, CLI) коллекцию защищает файловая блокировка (Collection.lock)
+
+    def __init__(self, path_to_storage: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str = None,
+                 threads: int = DEFAULT_THREADS):
+        self.path_to_storage = path_to_storage
+        self.databases = {}     # {"база/коллекция": Database} - открываются при первом запросе
+        self.databases_lock = threading.Lock()
+        self.locks = {}         # {"база/коллекция": AsyncReadWriteLock}
+        self.executor = ThreadPoolExecutor(threads)
+        self.loop = None        # Цикл asyncio, пока работает serve_forever
+        self.stop = None
+        self.stopping = False
+        self.finished = threading.Event()
+        self.operations = {
+            "ping": lambda database, request: "pong",
+            "insert": lambda database, request: database.insert(_text(request["document"])),
+            "insert_many": lambda database, request: database.insert_many(_text(request["documents"])),
+            "import": lambda database, request: database.import_file(request["path"], request.get("batch_size", 1000)),
+            "delete": lambda database, request: database.delete(request["id"]),
+            "index": lambda database, request: database.index(request["field"], request.get("pin"), request.get("order"),
+                                                              request.get("tree"), request.get("date")),
+            "compact": lambda database, request: database.compact(),
+            "checkpoint": lambda database, request: database.checkpoint(),
+            "search": lambda database, request: list(database.search(_text(request.get("query", {})), request.get("limit"),
+                                                                     request.get("skip"), request.get("projection"),
+                                                                     request.get("sort"))),
+            "explain": lambda database, request: database.explain(_text(request["query"]), request.get("projection")),
+            "aggregate": lambda database, request: database.aggregate(_text(request.get("query", {})), request["aggregations"],
+                                                                      request.get("group_by")),
+            "list_jsons": lambda database, request: list(database.collection.get_filenames()),
+            "cache_stats": lambda database, request: database.collection.cache_stats(),
+        }
+
+        # Сокет открывается сразу, чтобы адрес (и свободный порт при port=0) был известен до serve_forever
+        if socket_path is not None:
+            if os.path.exists(socket_path):  # Сокет от прошлого запуска
+                os.remove(socket_path)
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.bind(socket_path)
+            self.socket.listen()
+        else:
+            self.socket = socket.create_server((host, port))
+        self.address = self.socket.getsockname()
+
+    def database(self, name: str, engine: str = None, workers: int = None, document_format: str = None) -> Database:
+        # Database для "база/коллекция"; открывается один раз и остаётся открытой (engine, workers и format - при открытии)
+        with self.databases_lock:
+            if name not in self.databases:
+                if not isinstance(name, str) or "/" not in name:
+                    raise ValueError("Please use format 'database_name/current_collection'")
+                current_database, current_collection = name.split("/", 1)
+                path_to_database = os.path.join(self.path_to_storage, current_database)
+                if not os.path.exists(path_to_database):
+                    raise FileNotFoundError(f"Database '{current_database}' at '{self.path_to_storage}' not found.")
+                self.databases[name] = Database(path_to_database, current_collection, engine, workers, document_format)
+            return self.databases[name]
+
+    def handle(self, request: dict) -> dict:
+        # Выполняет запрос в текущем потоке (без блокировок коллекции - их берёт handle_async)
+        operation = request.get("op") if isinstance(request, dict) else None
+        if operation not in self.operations:
+            return {"ok": False, "error": f"ValueError: Unknown operation '{operation}'"}
+        try:
+            database = None
+            if operation != "ping":
+                database = self.database(request.get("db"), request.get("engine"), request.get("workers"),
+                                         request.get("format"))
+            return {"ok": True, "result": self.operations[operation](database, request)}
+        except Exception as error:
+            return {"ok": False, "error": f"{type(error).__name__}: {error}"}
+
+    async def handle_async(self, request: dict) -> dict:
+        operation = request.get("op") if isinstance(request, dict) else None
+        name = request.get("db") if operation in self.operations and operation != "ping" else None
+        if not isinstance(name, str):   # ping, неизвестная операция или неверное имя - коллекция не затрагивается
+            return await self.loop.run_in_executor(self.executor, self.handle, request)
+
+        lock = self.locks.setdefault(name, AsyncReadWriteLock())
+        shared = operation in READ_OPERATIONS or operation in LOGGED_OPERATIONS
+        async with lock.read() if shared else lock.write():
+            return await self.loop.run_in_executor(self.executor, self.handle, request)
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Запросы одного соединения выполняются по порядку, разные соединения - одновременно
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                try:
+                    response = await self.handle_async(json.loads(line))
+                except json.JSONDecodeError as error:
+                    response = {"ok": False, "error": f"JSONDecodeError: {error}"}
+                writer.write(json.dumps(response, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _serve(self):
+        self.stop = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        if self.stopping:   # shutdown вызван раньше, чем запустился цикл
+            return
+        if self.socket.family == getattr(socket, "AF_UNIX", None):
+            server = await asyncio.start_unix_server(self._connection, sock=self.socket, limit=2 ** 26)
+        else:
+            server = await asyncio.start_server(self._connection, sock=self.socket, limit=2 ** 26)
+        async with server:
+            await self.stop.wait()
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self.finished.set()
+
+    def shutdown(self):
+        # Можно вызывать из другого потока: останавливает цикл и ждёт завершения serve_forever
+        self.stopping = True
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.stop.set)
+            except RuntimeError:    # Цикл уже закрыт
+                pass
+            self.finished.wait()
+        self.executor.shutdown(wait=True)
+        for database in self.databases.values():   # Следующему запуску не придётся применять журналы коллекций
+            database.checkpoint()
+        self.socket.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
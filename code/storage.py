@@ -0,0 +1,455 @@
+import os
+import pickle
+
+from code.document_cache import DocumentCache, DEFAULT_CACHE_BYTES
+from code.document_format import DOCUMENT_FORMATS
+
+EMPTY_DOCUMENTS = ({}, [], "", 0, 0.0, False, None)    # Документы, которые перебор пропускает (проверка "if json_document")
+
+
+class FileStorage:
+    # Каждый документ хранится в отдельном файле <id>.json (исходный формат хранения коллекции; <id>.bin - формат binary).
+    # Прочитанные документы кэшируются; версия документа - время изменения и размер файла (изменения извне тоже видны)
+
+    def __init__(self, path_to_collection: str, cache_bytes: int = DEFAULT_CACHE_BYTES, document_format: str = "json"):
+        self.path_to_collection = path_to_collection
+        self.cache = DocumentCache(cache_bytes)
+        self.format = DOCUMENT_FORMATS[document_format]
+        self.unsynced = set()   # Файлы, записанные после последней контрольной точки (их сбрасывает на диск sync)
+        self.deleted = False    # После контрольной точки удалялись файлы - нужно сбросить на диск и папку
+
+    def insert(self, filename: str, json_document: dict):
+        path_to_json_document = self._path(filename)
+        self.cache.discard(filename)
+        with open(path_to_json_document, "wb") as file:
+            file.write(self.format.dumps(json_document))
+        self.unsynced.add(filename)
+
+    def insert_many(self, documents: list):
+        for filename, json_document in documents:
+            self.insert(filename, json_document)
+
+    def delete(self, filename: str) -> str:
+        path_to_json_document = self._path(filename)
+        if not os.path.exists(path_to_json_document):
+            raise FileNotFoundError
+        self.cache.discard(filename)
+        os.remove(path_to_json_document)
+        self.unsynced.discard(filename)
+        self.deleted = True
+        return path_to_json_document
+
+    def restore(self, filename: str, json_document: dict):
+        # Повтор вставки из журнала: файл мог остаться недописанным при сбое - записываем заново
+        self.insert(filename, json_document)
+
+    def refresh(self):
+        pass    # Список документов - это файлы в папке, изменения других процессов видны и так
+
+    def sync(self):
+        # Сбрасывает на диск документы, записанные после прошлой контрольной точки
+        for filename in self.unsynced:
+            _fsync(self._path(filename))
+        if self.unsynced or self.deleted:
+            _fsync(self.path_to_collection)
+        self.unsynced = set()
+        self.deleted = False
+
+    def exists(self, filename: str) -> bool:
+        return os.path.exists(self._path(filename))
+
+    def get_json(self, filename: str, evict: bool = True, predicate=None, fields=None):
+        # Один stat вместо exists: по нему же проверяется, не устарел ли документ в кэше.
+        # predicate - вернуть документ, только если он подходит (иначе None); fields - поля верхнего уровня, которые читает
+        # predicate: в формате binary сначала разбираются только они, весь документ - только если он подошёл
+        path_to_json_document = self._path(filename)
+        try:
+            stat = os.stat(path_to_json_document)
+            version = (stat.st_mtime_ns, stat.st_size)
+            json_document = self.cache.get(filename, version)
+            if json_document is None:
+                with open(path_to_json_document, "rb") as file:
+                    data = file.read()
+                if predicate is not None and fields is not None and self.format.PARTIAL:
+                    if not predicate(self.format.loads(data, fields)):
+                        return None
+                    predicate = None
+                json_document = self.format.loads(data)
+                self.cache.put(filename, version, json_document, stat.st_size, evict)
+            if predicate is not None and not predicate(json_document):
+                return None
+            return json_document
+        except FileNotFoundError:
+            self.cache.discard(filename)
+            return None
+
+    def get_filenames(self):
+        extension = self.format.EXTENSION
+        for file in os.listdir(self.path_to_collection):
+            if file.endswith(extension):
+                yield file[:-len(extension)]  # Убираем расширение в конце имени файла
+
+    def empty_filenames(self):
+        # id пустых документов ({}, [], null...), которые перебор пропускает. Документ длиннее самого длинного пустого
+        # заведомо не пуст - читаются только совсем маленькие файлы
+        limit = max(len(self.format.dumps(json_document)) for json_document in EMPTY_DOCUMENTS)
+        extension = self.format.EXTENSION
+        with os.scandir(self.path_to_collection) as entries:
+            for entry in entries:
+                if entry.name.endswith(extension) and entry.stat().st_size <= limit:
+                    filename = entry.name[:-len(extension)]
+                    if not self.get_json(filename, False):
+                        yield filename
+
+    def get_jsons(self, predicate=None, fields=None):
+        # Пары (id, документ), подходящие под predicate (None - все); fields - как в get_json
+        for filename in self.get_filenames():
+            json_document = self.get_json(filename, False, predicate, fields)  # Перебор не вытесняет из кэша часто читаемые документы
+            if json_document:
+                yield filename, json_document
+
+    def partitions(self, count: int) -> list:
+        # Делит коллекцию на count частей для параллельного перебора; часть - список id
+        filenames = list(self.get_filenames())
+        size = -(-len(filenames) // count) or 1
+        return [filenames[i:i + size] for i in range(0, len(filenames), size)]
+
+    @staticmethod
+    def read_partition(path_to_collection: str, partition: list, document_format: str = "json", predicate=None,
+                       fields=None):
+        # Читает подходящие под predicate документы одной части в процессе-обработчике (без объекта хранилища)
+        storage = FileStorage(path_to_collection, 0, document_format)
+        for filename in partition:
+            json_document = storage.get_json(filename, True, predicate, fields)
+            if json_document:
+                yield filename, json_document
+
+    def compact(self) -> int:
+        return 0  # Файлы удаляются сразу - сжимать нечего
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.path_to_collection, f"{filename}{self.format.EXTENSION}")
+
+
+class SegmentStorage:
+    # Документы дописываются в большие файлы-сегменты segments/<номер>.seg.
+    # Запись в сегменте: b"<id>\t<json>\n"; надгробие (удаление): b"<id>\t\n".
+    # В памяти держится таблица смещений {id: (segment, offset, length)}, её снимок лежит в segments/offsets.pkl,
+    # после загрузки снимка дочитываются только записи, появившиеся после него.
+    # Прочитанные документы кэшируются; версия документа - его место в сегменте (меняется при любой перезаписи).
+    # Документы хранятся JSON без пробелов (формат json - тоже) или в формате binary; в двоичных записях байты \n и \x1b
+    # заменяются парами \x1b\x02 и \x1b\x01, чтобы запись оставалась одной строкой
+
+    SEGMENT_SIZE = 64 * 1024 * 1024     # Размер, после которого начинается новый сегмент
+    COMPACT_MIN_BYTES = 1024 * 1024     # Автоматическое сжатие - когда мёртвых байт больше живых и не меньше этого порога
+
+    def __init__(self, path_to_collection: str, cache_bytes: int = DEFAULT_CACHE_BYTES, document_format: str = "json"):
+        self.path_to_collection = path_to_collection
+        self.cache = DocumentCache(cache_bytes)
+        self.format = _segment_format(document_format)
+        self.path_to_segments = os.path.join(self.path_to_collection, "segments")
+        os.makedirs(self.path_to_segments, exist_ok=True)
+
+        self.offsets = {}       # {id: (segment, offset, length)}
+        self.live_bytes = 0     # Суммарный размер живых документов
+        self.dead_bytes = 0     # Суммарный размер удалённых/перезаписанных документов, которые ещё лежат в сегментах
+        self.segments = []      # Номера сегментов по возрастанию; последний - активный (в него пишем)
+        self.positions = {}     # {segment: до какого места сегмент прочитан или дописан этим процессом}
+        self.unsynced = set()   # Сегменты, дописанные после последней контрольной точки
+        self._load()
+
+    def insert(self, filename: str, json_document: dict):
+        self._append([(filename, self._encode(json_document))])
+
+    def insert_many(self, documents: list):
+        # Вся пачка [(id, json-документ)] дописывается в сегмент за одно открытие файла
+        self._append([(filename, self._encode(json_document)) for filename, json_document in documents])
+
+    def delete(self, filename: str) -> str:
+        if filename not in self.offsets:
+            raise FileNotFoundError
+        segment = self.offsets[filename][0]
+        self._append([(filename, None)])
+        if self.dead_bytes > self.live_bytes and self.dead_bytes >= self.COMPACT_MIN_BYTES:
+            self.compact()
+        return self._path(segment)
+
+    def exists(self, filename: str) -> bool:
+        return filename in self.offsets
+
+    def restore(self, filename: str, json_document: dict):
+        # Повтор вставки из журнала: недописанные записи сегментов отрезаются при загрузке, поэтому записанный документ целый
+        if filename not in self.offsets:
+            self.insert(filename, json_document)
+
+    def refresh(self):
+        # Дочитывает записи, которые другие процессы дописали в сегменты; после чужого сжатия - загружает таблицу заново
+        segments = sorted(int(file[:-len(".seg")]) for file in os.listdir(self.path_to_segments) if file.endswith(".seg"))
+        if any(segment not in segments for segment in self.segments):
+            self.cache.clear()
+            self.offsets, self.live_bytes, self.dead_bytes, self.segments, self.positions = {}, 0, 0, [], {}
+            self._load()
+            return
+        self.segments = segments
+        for segment in segments:
+            if os.path.getsize(self._path(segment)) != self.positions.get(segment, 0):
+                self._scan_segment(segment, self.positions.get(segment, 0))
+
+    def sync(self):
+        # Сбрасывает на диск сегменты, дописанные после прошлой контрольной точки
+        for segment in self.unsynced:
+            if segment in self.segments:
+                _fsync(self._path(segment))
+        self.unsynced = set()
+
+    def get_json(self, filename: str):
+        location = self.offsets.get(filename)
+        if location is None:
+            return None
+        json_document = self.cache.get(filename, location)
+        if json_document is None:
+            segment, offset, length = location
+            with open(self._path(segment), "rb") as file:
+                file.seek(offset)
+                json_document = self._decode(file.read(length))
+            self.cache.put(filename, location, json_document, length)
+        return json_document
+
+    def get_filenames(self):
+        yield from list(self.offsets)
+
+    def empty_filenames(self):
+        # id пустых документов, которые перебор пропускает; длины записей известны из таблицы смещений
+        limit = max(len(self._encode(json_document)) for json_document in EMPTY_DOCUMENTS)
+        for filename, (_, _, length) in list(self.offsets.items()):
+            if length <= limit and not self.get_json(filename):
+                yield filename
+
+    def get_jsons(self, predicate=None, fields=None):
+        # Последовательное чтение сегментов вместо отдельного открытия файла на каждый документ.
+        # Документы из кэша заново не разбираются; новые попадают в кэш, только если в нём есть свободное место.
+        # predicate и fields - как в FileStorage.get_json
+        partial = predicate is not None and fields is not None and self.format.PARTIAL
+        for filename, location, payload in self._get_payloads(self.offsets):
+            json_document = self.cache.get(filename, location)
+            if json_document is None:
+                if not self.format.TEXT:
+                    payload = _unescape(payload)
+                if partial and not predicate(self.format.loads(payload, fields)):
+                    continue
+                json_document = self.format.loads(payload)
+                self.cache.put(filename, location, json_document, location[2], evict=False)
+                if partial:     # Условие уже проверено по полям запроса; пустые документы перебор пропускает
+                    if json_document:
+                        yield filename, json_document
+                    continue
+            if json_document and (predicate is None or predicate(json_document)):
+                yield filename, json_document
+
+    def partitions(self, count: int) -> list:
+        # Делит коллекцию на count частей для параллельного перебора; часть - список (путь сегмента, смещение, длина, id)
+        # по порядку расположения в сегментах, чтобы каждый обработчик читал свой участок файла подряд
+        locations = sorted((segment, offset, length, filename) for filename, (segment, offset, length) in self.offsets.items())
+        locations = [(self._path(segment), offset, length, filename) for segment, offset, length, filename in locations]
+        size = -(-len(locations) // count) or 1
+        return [locations[i:i + size] for i in range(0, len(locations), size)]
+
+    @staticmethod
+    def read_partition(path_to_collection: str, partition: list, document_format: str = "json", predicate=None,
+                       fields=None):
+        # Читает подходящие под predicate документы одной части в процессе-обработчике;
+        # таблица смещений не загружается - смещения уже в части
+        document_format = _segment_format(document_format)
+        partial = predicate is not None and fields is not None and document_format.PARTIAL
+        file = None
+        try:
+            for path, offset, length, filename in partition:
+                if file is None or file.name != path:
+                    if file is not None:
+                        file.close()
+                    file = open(path, "rb")
+                file.seek(offset)
+                payload = file.read(length)
+                if not document_format.TEXT:
+                    payload = _unescape(payload)
+                if partial and not predicate(document_format.loads(payload, fields)):
+                    continue
+                json_document = document_format.loads(payload)
+                if json_document and (partial or predicate is None or predicate(json_document)):
+                    yield filename, json_document
+        finally:
+            if file is not None:
+                file.close()
+
+    def compact(self) -> int:
+        # Переписывает живые документы в новый сегмент и удаляет старые. Возвращает количество освобождённых байт
+
+        old_segments = self.segments[:]
+        size_before = sum(os.path.getsize(self._path(segment)) for segment in old_segments)
+        payloads = self._get_payloads(self.offsets)  # Генератор держит ссылку на старую таблицу смещений
+
+        self.segments = [old_segments[-1] + 1]
+        self.offsets = {}
+        self.live_bytes = 0
+        self.dead_bytes = 0
+        open(self._path(self.segments[-1]), "ab").close()
+
+        batch = []
+        for filename, _, payload in payloads:
+            batch.append((filename, payload))
+            if len(batch) == 1000:
+                self._append(batch)
+                batch = []
+        self._append(batch)
+        self._save_snapshot(obsolete=old_segments)  # После сбоя на этом месте старые сегменты удалятся при загрузке
+
+        for segment in old_segments:
+            os.remove(self._path(segment))
+
+        size_after = sum(os.path.getsize(self._path(segment)) for segment in self.segments)
+        return size_before - size_after
+
+    def _get_payloads(self, offsets: dict):
+        # Возвращает тройки (id, место в сегменте, json-байты) живых документов без разбора JSON, читая сегменты по порядку
+        by_segment = {}
+        for filename, (segment, offset, length) in offsets.items():
+            by_segment.setdefault(segment, []).append((offset, length, filename))
+
+        for segment in sorted(by_segment):
+            with open(self._path(segment), "rb") as file:
+                for offset, length, filename in sorted(by_segment[segment]):
+                    file.seek(offset)
+                    yield filename, (segment, offset, length), file.read(length)
+
+    def _append(self, records: list):
+        # Дописывает записи [(id, json-байты или None для надгробия)] в активный сегмент одним открытием файла
+
+        segment = self.segments[-1]
+        with open(self._path(segment), "ab") as file:
+            position = file.tell()
+            for filename, payload in records:
+                prefix = f"{filename}\t".encode("utf-8")
+                if payload is None:
+                    file.write(prefix + b"\n")
+                    self._forget(filename)
+                else:
+                    file.write(prefix + payload + b"\n")
+                    self._forget(filename)
+                    self.offsets[filename] = (segment, position + len(prefix), len(payload))
+                    self.live_bytes += len(payload)
+                position += len(prefix) + (0 if payload is None else len(payload)) + 1
+        self.positions[segment] = position
+        self.unsynced.add(segment)
+
+        if position >= self.SEGMENT_SIZE:  # Активный сегмент заполнен - начинаем новый и фиксируем таблицу смещений
+            self.segments.append(segment + 1)
+            open(self._path(segment + 1), "ab").close()
+            self._save_snapshot()
+
+    def _forget(self, filename: str):
+        self.cache.discard(filename)
+        location = self.offsets.pop(filename, None)
+        if location is not None:
+            self.live_bytes -= location[2]
+            self.dead_bytes += location[2]
+
+    def _load(self):
+        for file in os.listdir(self.path_to_segments):
+            if file.endswith(".seg"):
+                self.segments.append(int(file[:-len(".seg")]))
+        self.segments.sort()
+
+        positions = {}  # {segment: до какого места сегмент учтён в снимке}
+        path_to_snapshot = os.path.join(self.path_to_segments, "offsets.pkl")
+        if os.path.exists(path_to_snapshot):
+            with open(path_to_snapshot, "rb") as file:
+                snapshot = pickle.load(file)
+            if all(segment in self.segments for segment in snapshot["positions"]):
+                self.offsets = snapshot["offsets"]
+                self.live_bytes = snapshot["live_bytes"]
+                self.dead_bytes = snapshot["dead_bytes"]
+                positions = snapshot["positions"]
+
+                for segment in snapshot["obsolete"]:  # Остаток прерванного сжатия
+                    if segment in self.segments:
+                        os.remove(self._path(segment))
+                        self.segments.remove(segment)
+
+        if not self.segments:
+            self.segments.append(1)
+            open(self._path(1), "ab").close()
+
+        for segment in self.segments:
+            self._scan_segment(segment, positions.get(segment, 0))
+
+    def _scan_segment(self, segment: int, position: int):
+        # Дочитывает записи сегмента начиная с position и обновляет таблицу смещений
+
+        with open(self._path(segment), "r+b") as file:
+            file.seek(position)
+            for line in file:
+                if not line.endswith(b"\n"):  # Недописанная при сбое запись - отрезаем, чтобы следующая запись не склеилась с ней
+                    file.truncate(position)
+                    break
+                filename, payload = line.split(b"\t", 1)
+                filename = filename.decode("utf-8")
+                self._forget(filename)
+                if len(payload) > 1:
+                    self.offsets[filename] = (segment, position + len(filename.encode("utf-8")) + 1, len(payload) - 1)
+                    self.live_bytes += len(payload) - 1
+                position += len(line)
+        self.positions[segment] = position
+
+    def _save_snapshot(self, obsolete=()):
+        snapshot = {
+            "obsolete": list(obsolete),
+            "offsets": self.offsets,
+            "live_bytes": self.live_bytes,
+            "dead_bytes": self.dead_bytes,
+            "positions": {segment: os.path.getsize(self._path(segment)) for segment in self.segments},
+        }
+        path_to_snapshot = os.path.join(self.path_to_segments, "offsets.pkl")
+        with open(f"{path_to_snapshot}.tmp", "wb") as file:
+            pickle.dump(snapshot, file)
+        os.replace(f"{path_to_snapshot}.tmp", path_to_snapshot)
+
+    def _encode(self, json_document) -> bytes:
+        payload = self.format.dumps(json_document)
+        if not self.format.TEXT:    # Двоичная запись не должна содержать \n - он разделяет записи сегмента
+            payload = payload.replace(b"\x1b", b"\x1b\x01").replace(b"\n", b"\x1b\x02")
+        return payload
+
+    def _decode(self, payload: bytes):
+        return self.format.loads(payload if self.format.TEXT else _unescape(payload))
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.path_to_segments, f"{segment:06d}.seg")
+
+
+def _segment_format(document_format: str):
+    # Запись сегмента - одна строка, поэтому JSON в сегментах всегда без пробелов и переводов строк
+    return DOCUMENT_FORMATS["compact" if document_format == "json" else document_format]
+
+
+def _unescape(payload: bytes) -> bytes:
+    return payload.replace(b"\x1b\x02", b"\n").replace(b"\x1b\x01", b"\x1b")
+
+
+def _fsync(path: str):
+    # Сбрасывает на диск файл или папку (запись в папке - появление и удаление файлов); на Windows папки не открываются
+    try:
+        descriptor = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+STORAGE_ENGINES = {
+    "files": FileStorage,
+    "segments": SegmentStorage,
+}
@@ -0,0 +1,72 @@
+import os
+import zlib
+import pickle
+import struct
+
+RECORD_HEADER = struct.Struct("<II")        # Начало каждой записи журнала: длина данных и их crc32
+DEFAULT_CHECKPOINT_BYTES = 4 * 1024 * 1024  # Размер журнала, после которого коллекция делает контрольную точку
+
+
+class WriteAheadLog:
+    # Журнал предзаписи коллекции (wal.log). Изменение сначала дописывается в журнал и сбрасывается на диск (fsync),
+    # и только потом применяется к хранилищу и индексам. Страницы индексов пишутся на диск не после каждого изменения,
+    # а в контрольной точке - после неё журнал очищается. При открытии коллекции записи журнала применяются заново.
+    # Запись: заголовок (длина, crc32) и pickle операции: ("insert", id, документ), ("delete", id),
+    # ("checkpoint",) - начало контрольной точки (если журнал с ней не очищен, индексы могли быть записаны не полностью)
+
+    def __init__(self, path: str, sync: bool = True):
+        self.path = path
+        self.sync = sync    # False - без fsync при каждой записи (данные переживут падение процесса, но не отключение питания)
+        self.size = 0       # Размер журнала после последней записи этого процесса; другой размер - журнал менял другой процесс
+        self.syncs = 0      # Сколько раз журнал сбрасывался на диск (для статистики)
+
+    def append(self, operations: list):
+        # Дописывает операции одной записью в файл и одним fsync - группа изменений становится надёжной целиком
+        if not operations:
+            return
+        data = b"".join(self._frame(operation) for operation in operations)
+        with open(self.path, "ab") as file:
+            file.write(data)
+            file.flush()
+            if self.sync:
+                os.fsync(file.fileno())
+                self.syncs += 1
+            self.size = file.tell()
+
+    def records(self) -> list:
+        # Операции журнала по порядку; недописанная при сбое последняя запись отбрасывается
+        operations = []
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            data = b""
+        position = 0
+        while position + RECORD_HEADER.size <= len(data):
+            length, checksum = RECORD_HEADER.unpack_from(data, position)
+            payload = data[position + RECORD_HEADER.size:position + RECORD_HEADER.size + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            operations.append(pickle.loads(payload))
+            position += RECORD_HEADER.size + length
+        self.size = len(data)
+        return operations
+
+    def truncate(self):
+        # Очищает журнал после контрольной точки
+        with open(self.path, "wb") as file:
+            file.flush()
+            os.fsync(file.fileno())
+        self.size = 0
+
+    def behind(self) -> bool:
+        # Журнал менял другой процесс (дописал записи или сделал контрольную точку) - состояние в памяти устарело
+        try:
+            return os.path.getsize(self.path) != self.size
+        except FileNotFoundError:
+            return self.size != 0
+
+    @staticmethod
+    def _frame(operation: tuple) -> bytes:
+        payload = pickle.dumps(operation, pickle.HIGHEST_PROTOCOL)
+        return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
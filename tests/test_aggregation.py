@@ -0,0 +1,75 @@
+import unittest
+import tempfile
+import shutil
+from unittest import mock
+from code.collection import Collection
+
+
+class TestAggregation(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.collection = Collection(self.tempdir)
+        self.collection.insert_many([
+            {'status': 'paid', 'amount': 10, 'customer': {'city': 'Moscow'}},
+            {'status': 'paid', 'amount': 30.5, 'customer': {'city': 'Kazan'}},
+            {'status': 'new', 'amount': 5, 'customer': {'city': 'Moscow'}},
+            {'status': 'new', 'amount': 'unknown'},
+            {'amount': 1},
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_aggregate_without_groups(self):
+        rows = self.collection.aggregate({}, {'n': {'@count': '*'}, 'with_city': {'@count': 'customer.city'},
+                                              'total': {'@sum': 'amount'}, 'mean': {'@avg': 'amount'},
+                                              'low': {'@min': 'amount'}, 'high': {'@max': 'amount'}})
+        self.assertEqual(rows, [{'n': 5, 'with_city': 3, 'total': 46.5, 'mean': 46.5 / 4, 'low': 1, 'high': 'unknown'}])
+
+        rows = self.collection.aggregate({'status': 'none'}, {'n': {'@count': '*'}, 'mean': {'@avg': 'amount'}})
+        self.assertEqual(rows, [{'n': 0, 'mean': None}])
+
+        with self.assertRaises(ValueError):
+            self.collection.aggregate({}, {'n': {'@median': 'amount'}})
+
+    def test_aggregate_by_groups(self):
+        rows = self.collection.aggregate({'amount': {'@gte': 5}}, {'n': {'@count': '*'}, 'total': {'@sum': 'amount'}},
+                                         group_by='customer.city')
+        self.assertEqual(rows, [{'customer.city': 'Kazan', 'n': 1, 'total': 30.5},
+                                {'customer.city': 'Moscow', 'n': 2, 'total': 15}])
+
+        rows = self.collection.aggregate({}, {'n': {'@count': '*'}}, group_by=['status'])
+        self.assertEqual(rows, [{'status': 'new', 'n': 2}, {'status': 'paid', 'n': 2}, {'status': None, 'n': 1}])
+
+    def test_aggregate_from_indexes(self):
+        self.collection.indexation.create_index('status')
+        self.collection.indexation.create_index('customer.city')
+        expected = self.collection.aggregate({}, {'n': {'@count': '*'}}, group_by='status')
+
+        with mock.patch.object(self.collection.storage, 'get_json', wraps=self.collection.storage.get_json) as get_json:
+            self.assertEqual(self.collection.aggregate({}, {'n': {'@count': '*'}}, group_by='status'), expected)
+            rows = self.collection.aggregate({}, {'n': {'@count': '*'}, 'cities': {'@count': 'customer.city'},
+                                                  'first': {'@min': 'customer.city'}, 'last': {'@max': 'customer.city'}})
+            self.assertEqual(rows, [{'n': 5, 'cities': 3, 'first': 'Kazan', 'last': 'Moscow'}])
+            self.assertEqual(self.collection.aggregate({'status': 'paid'}, {'n': {'@count': '*'}}), [{'n': 2}])
+            self.assertEqual(get_json.call_count, 0)  # Документы не читались
+
+            self.collection.aggregate({'status': 'paid'}, {'total': {'@sum': 'amount'}})
+            self.assertEqual(get_json.call_count, 2)
+
+    def test_empty_documents_are_not_counted(self):
+        self.collection.insert({})
+        self.collection.indexation.create_index('status')
+        scanned = self.collection.aggregate({}, {'n': {'@count': '*'}, 'total': {'@sum': 'amount'}})
+        self.assertEqual(scanned[0]['n'], 5)
+
+        with mock.patch.object(self.collection.storage, 'get_json', wraps=self.collection.storage.get_json) as get_json:
+            self.assertEqual(self.collection.aggregate({}, {'n': {'@count': '*'}}), [{'n': 5}])
+            self.assertEqual(self.collection.aggregate({'status': {'@ne': 'new'}}, {'n': {'@count': '*'}}), [{'n': 3}])
+            rows = self.collection.aggregate({}, {'n': {'@count': '*'}}, group_by='status')
+            self.assertEqual(rows, [{'status': 'new', 'n': 2}, {'status': 'paid', 'n': 2}, {'status': None, 'n': 1}])
+            self.assertEqual(get_json.call_count, 3)    # Читался только маленький документ {} - по разу на запрос
+
+
+if __name__ == '__main__':
+    unittest.main()
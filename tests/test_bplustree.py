@@ -0,0 +1,97 @@
+import unittest
+import random
+from code.btree import BTree
+from code.bplustree import BPlusTree
+
+
+class TestBPlusTree(unittest.TestCase):
+    def setUp(self):
+        self.tree = BPlusTree(3)
+        for key in range(100):
+            self.tree.insert(key, f'id{key}')
+
+    def _leaves(self):
+        node = self.tree.root
+        while not node.leaf:
+            node = node.children[0]
+        leaves = []
+        while node is not None:
+            leaves.append(node)
+            node = node.next
+        return leaves
+
+    def test_is_btree(self):
+        self.assertIsInstance(self.tree, BTree)
+
+    def test_search(self):
+        self.assertEqual(self.tree.search(42), ['id42'])
+        self.assertEqual(self.tree.search(1000), [])
+
+        self.tree.insert(42, 'id42_2')
+        self.assertEqual(self.tree.search(42), ['id42', 'id42_2'])
+
+    def test_values_only_in_linked_leaves(self):
+        leaves = self._leaves()
+        self.assertEqual([key for leaf in leaves for key in leaf.keys], list(range(100)))
+        self.assertTrue(all(len(leaf.keys) <= 5 for leaf in leaves))
+
+        internal = self.tree.root
+        self.assertFalse(internal.leaf)
+        self.assertEqual(internal.values, [])
+
+    def test_range_search(self):
+        self.assertEqual([key for key, _ in self.tree.range_search(10, 15)], [10, 11, 12, 13, 14, 15])
+        self.assertEqual([key for key, _ in self.tree.range_search(10, 15, False, False)], [11, 12, 13, 14])
+        self.assertEqual([key for key, _ in self.tree.range_search(97)], [97, 98, 99])
+        self.assertEqual([key for key, _ in self.tree.range_search(upper=1)], [0, 1])
+        self.assertEqual((self.tree.min_key(), self.tree.max_key()), (0, 99))
+
+    def test_reverse_search(self):
+        self.assertEqual([key for key, _ in self.tree.reverse_search()], list(range(99, -1, -1)))
+
+    def test_delete(self):
+        for key in range(0, 100, 2):
+            self.tree.delete(key)
+        self.assertEqual([key for key, _ in self.tree.range_search()], list(range(1, 100, 2)))
+        self.assertEqual([key for leaf in self._leaves() for key in leaf.keys], list(range(1, 100, 2)))
+
+        for key in range(1, 100, 2):
+            self.tree.remove_key_value(key, f'id{key}')
+        self.assertEqual(list(self.tree.range_search()), [])
+        self.assertTrue(self.tree.root.leaf)
+        self.assertIsNone(self.tree.min_key())
+
+    def test_randomized_against_dict(self):
+        random_generator = random.Random(12)
+        for t in (2, 4):
+            tree = BPlusTree(t)
+            model = {}
+            for step in range(3000):
+                key = random_generator.randrange(400)
+                if random_generator.random() < 0.55:
+                    tree.insert(key, f'id{step}')
+                    model.setdefault(key, []).append(f'id{step}')
+                elif key in model:
+                    tree.remove_key_value(key, model[key].pop())
+                    if not model[key]:
+                        del model[key]
+            self.assertEqual(dict(tree.range_search()), model)
+
+    def test_bulk_load(self):
+        for count in (0, 1, 5, 6, 7, 100, 1000):
+            self.tree = BPlusTree(3)
+            self.tree.bulk_load((key, [f'id{key}']) for key in range(count))
+            leaves = self._leaves()
+            self.assertEqual([key for leaf in leaves for key in leaf.keys], list(range(count)))
+            if count > 5:
+                self.assertTrue(all(2 <= len(leaf.keys) <= 5 for leaf in leaves))
+            self.assertEqual([key for key, _ in self.tree.range_search(3, 5)], [key for key in (3, 4, 5) if key < count])
+
+        for key in range(0, 1000, 2):
+            self.tree.delete(key)
+        self.tree.insert(1000, 'id1000')
+        self.assertEqual([key for key, _ in self.tree.range_search()], list(range(1, 1000, 2)) + [1000])
+
+
+if __name__ == '__main__':
+    unittest.main()
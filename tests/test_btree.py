@@ -181,6 +181,21 @@ class TestNode(unittest.TestCase):
                 [],
                 ["id5_1", "id5_2"]]])
 
+    def test_parallel_arrays(self):
+        self.assertFalse(hasattr(self.node, '__dict__'))
+        self.assertIs(self.node.data[0], self.node.keys)
+        self.assertIs(self.node.data[1], self.node.values)
+
+    def test_find(self):
+        self.assertEqual(self.node.find(3), 2)
+        self.assertEqual(self.node.find(0), 0)
+        self.assertEqual(self.node.find(6), 5)
+
+    def test_insert_pair_existing_key(self):
+        self.node.insert_pair(0, 3, "id3_5")  # Ключ уже есть в другом месте узла - дубликат не создаётся
+        self.assertEqual(self.node.keys, [1, 2, 3, 4, 5])
+        self.assertEqual(self.node.values[2], ["id3_1", "id3_2", "id3_3", "id3_4", "id3_5"])
+
 
 class TestBTreeInsert(unittest.TestCase):
     def setUp(self):
@@ -398,6 +413,97 @@ class TestBTreeRemoveID(unittest.TestCase):
         self.assertEqual(self.btree.search("A"), ["idA_1", "idA_2", "idA_3"])
         self.assertEqual(self.btree.search("J"), ["idJ_1", "idJ_2", "idJ_3"])
 
+    def test_remove_key_value(self):
+        self.btree.remove_key_value("M", "idG_1")
+        self.assertEqual(self.btree.search("M"), ["idM_1", "idM_2"])
+        self.assertEqual(self.btree.search("A"), ["idA_1", "idG_1", "idA_2", "idA_3"])
+
+        self.btree.remove_key_value("E", "idE_1")
+        self.assertEqual(self.btree.search("E"), [])
+        self.assertNotIn("E", [key for key, _ in self.btree.range_search()])
+
+
+class TestBTreeRandomized(unittest.TestCase):
+    def test_duplicate_keys_are_merged(self):
+        btree = BTree(3)
+        for i in range(200):
+            btree.insert(i % 20, f"id{i}")
+        for key in range(20):
+            self.assertEqual(btree.search(key), [f"id{i}" for i in range(key, 200, 20)])
+
+    def test_delete_all_keys(self):
+        btree = BTree(3)
+        keys = [(i * 37) % 101 for i in range(101)]
+        for key in keys:
+            btree.insert(key, f"id{key}")
+        for n, key in enumerate(reversed(keys)):
+            btree.delete(key)
+            self.assertEqual(btree.search(key), [])
+            self.assertEqual(len(list(btree.range_search())), len(keys) - n - 1)
+        self.assertEqual(btree.root.get_keys(), [])
+
+
+class TestBTreeBulkLoad(unittest.TestCase):
+    def _check_node(self, btree, node, is_root=True) -> int:    # Возвращает высоту поддерева
+        if not is_root:
+            self.assertTrue(btree.t - 1 <= len(node.keys) <= 2 * btree.t - 1)
+        if node.leaf:
+            return 0
+        self.assertEqual(len(node.children), len(node.keys) + 1)
+        heights = {self._check_node(btree, child, False) for child in node.children}
+        self.assertEqual(len(heights), 1)
+        return heights.pop() + 1
+
+    def test_bulk_load(self):
+        for count in (0, 1, 5, 6, 7, 40, 1000):
+            btree = BTree(3)
+            btree.bulk_load((key, [f"id{key}"]) for key in range(count))
+            self._check_node(btree, btree.root)
+            self.assertEqual([key for key, _ in btree.range_search()], list(range(count)))
+
+    def test_bulk_loaded_tree_accepts_changes(self):
+        btree = BTree(3)
+        btree.bulk_load((key, [f"id{key}"]) for key in range(0, 200, 2))
+        for key in range(1, 200, 2):
+            btree.insert(key, f"id{key}")
+        for key in range(0, 200, 4):
+            btree.delete(key)
+        self._check_node(btree, btree.root)
+        self.assertEqual([key for key, _ in btree.range_search()], [key for key in range(200) if key % 4])
+        self.assertEqual(btree.search(7), ["id7"])
+
+
+class TestBTreeRangeSearch(unittest.TestCase):
+    def setUp(self):
+        self.btree = BTree(3)
+        for key in range(1, 31):
+            self.btree.insert(key, f"id{key}")
+
+    def test_full_range_is_ordered(self):
+        keys = [key for key, _ in self.btree.range_search()]
+        self.assertEqual(keys, list(range(1, 31)))
+
+    def test_inclusive_bounds(self):
+        pairs = list(self.btree.range_search(10, 15))
+        self.assertEqual([key for key, _ in pairs], [10, 11, 12, 13, 14, 15])
+        self.assertEqual(pairs[0][1], ["id10"])
+
+    def test_exclusive_bounds(self):
+        keys = [key for key, _ in self.btree.range_search(10, 15, include_lower=False, include_upper=False)]
+        self.assertEqual(keys, [11, 12, 13, 14])
+
+    def test_open_bounds(self):
+        self.assertEqual([key for key, _ in self.btree.range_search(lower=28)], [28, 29, 30])
+        self.assertEqual([key for key, _ in self.btree.range_search(upper=3, include_upper=False)], [1, 2])
+
+    def test_reverse_search(self):
+        self.assertEqual([key for key, _ in self.btree.reverse_search()], list(range(30, 0, -1)))
+        self.assertEqual(list(BTree(3).reverse_search()), [])
+
+    def test_empty_range(self):
+        self.assertEqual(list(self.btree.range_search(31, 40)), [])
+        self.assertEqual(list(self.btree.range_search(5, 5, include_lower=False)), [])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import unittest.mock
 import tempfile
 import shutil
 import os
@@ -108,10 +109,31 @@ class TestCLIIntegration(unittest.TestCase):
         result = self.db.database.search_by_condition("{}")
         self.assertEqual(len(result), 2)
 
+    def test_search_with_limit(self):
+        for name in ('Alice', 'Bob', 'Charlie'):
+            self.db.insert(f"{{'name': '{name}', 'age': 30}}")
+        with unittest.mock.patch('code.cli_core.typer.echo') as echo:
+            self.db.search_by_condition("{'age': 30}", limit=2)
+        self.assertEqual(echo.call_count, 3)  # [FOUND]: и два документа
+
+        with unittest.mock.patch('code.cli_core.typer.echo') as echo:
+            self.db.search_by_condition("{'age': 30, '@skip': 3}")
+        echo.assert_called_once_with("[SEARCH]: Not found json_documents.")
+
+    def test_aggregate(self):
+        for name, age in (('Alice', 30), ('Bob', 20), ('Charlie', 30)):
+            self.db.insert(f"{{'name': '{name}', 'age': {age}}}")
+        rows = self.db.aggregate("{}", group="age", count=True, maxs="name")
+        self.assertEqual(rows, [{'age': 20, 'count': 1, 'max(name)': 'Bob'},
+                                {'age': 30, 'count': 2, 'max(name)': 'Charlie'}])
+        self.assertEqual(self.db.aggregate("{'age': 30}"), [{'count': 2}])
+
     def test_delete_document(self):
         self.db.insert("{'name': 'Charlie'}")
-        filename = os.listdir(self.path_to_collection)[0][:-5]
-        self.db.delete(filename)
+        # В папке коллекции кроме документа лежат индексы, журнал и файл блокировки - порядок listdir не определён
+        json_files = [f for f in os.listdir(self.path_to_collection) if f.endswith('.json')]
+        self.assertEqual(len(json_files), 1)
+        self.db.delete(json_files[0][:-len('.json')])
         json_files = [f for f in os.listdir(self.path_to_collection) if f.endswith('.json')]
         self.assertEqual(len(json_files), 0)
 
@@ -2,7 +2,9 @@ import unittest
 import tempfile
 import shutil
 import os
-from code.collection import Collection
+import jsonpath_ng
+from unittest import mock
+from code.collection import Collection, compile_field
 
 
 class TestCollectionIntegration(unittest.TestCase):
@@ -69,11 +71,68 @@ class TestCollectionIntegration(unittest.TestCase):
         values = self.collection.get_value(json_doc, 'details.city[')
         self.assertEqual(values, [])
 
+    def test_plain_path_matches_jsonpath(self):
+        documents = [
+            {'a': {'b': [1, 2]}}, {'a': {'b': None}}, {'a': 5}, {'a': None},
+            {'a': [{'b': 1}, {'b': 2}]}, {'a-b': {'c_d': 'x'}}, [1, 2], 'text',
+        ]
+        for field in ('a', 'a.b', 'a-b.c_d'):
+            for document in documents:
+                expected = [match.value for match in jsonpath_ng.parse(field).find(document)]
+                self.assertEqual(compile_field(field)(document), expected, (field, document))
+
+    def test_compiled_paths_are_cached(self):
+        compile_field.cache_clear()
+        json_doc = self.collection.get_json(self.id3)
+        self.collection.get_value(json_doc, 'details.city')
+        self.collection.get_value(json_doc, 'details.city')
+        self.collection.get_value(json_doc, '$..city')
+        self.collection.get_value(json_doc, '$..city')
+        self.assertEqual(compile_field.cache_info().hits, 2)
+        self.assertEqual(self.collection.get_value(json_doc, '$..city'), ['Moscow'])
+
     def test_search_with_empty_query(self):
         query = {}
         results = self.collection.search_by_condition(query)
         self.assertEqual(len(results), 3)
 
+    def test_search_by_range_with_index(self):
+        self.collection.indexation.create_index('age')
+        results = self.collection.search_by_condition({'age': {'@gte': 26}})
+        self.assertEqual([doc['name'] for doc in results], ['Alice'])
+
+        results = self.collection.search_by_condition({'age': {'@ne': 30}})
+        self.assertCountEqual([doc['name'] for doc in results], ['Bob', 'Charlie'])
+
+    def test_insert_with_incomparable_key_changes_nothing(self):
+        self.collection.indexation.create_index('name')
+        self.collection.indexation.create_index('age')
+        filenames = set(self.collection.get_filenames())
+
+        with self.assertRaises(TypeError):
+            self.collection.insert_many([{'name': 'Dan', 'age': 20}, {'name': 'Zed', 'age': 'n/a'}])
+
+        self.assertEqual(set(self.collection.get_filenames()), filenames)    # Ни документа, ни записей в других индексах
+        self.assertEqual(self.collection.indexation.indexed_search('name', {'name': 'Dan'}), [])
+        self.assertEqual(self.collection.indexation.indexed_search('name', {'name': 'Zed'}), [])
+
+    def test_search_streams_with_limit_and_skip(self):
+        with mock.patch.object(self.collection.storage, 'get_json', wraps=self.collection.storage.get_json) as get_json:
+            results = self.collection.search({})
+            next(results)
+            self.assertEqual(get_json.call_count, 1)  # Документы читаются по мере выдачи, а не все сразу
+
+        self.assertEqual(len(self.collection.search_by_condition({}, limit=2)), 2)
+        self.assertEqual(len(self.collection.search_by_condition({}, skip=1)), 2)
+        self.assertEqual(len(self.collection.search_by_condition({'@limit': 5, '@skip': 2})), 1)
+        self.assertEqual(self.collection.search_by_condition({'name': 'Bob', '@limit': 0}), [])
+        self.assertEqual(len(self.collection.search_by_condition({'@limit': 1}, limit=3)), 3)  # Аргумент важнее запроса
+
+        self.collection.indexation.create_index('age')
+        self.assertEqual(len(self.collection.search_by_condition({'age': {'@gte': 0}, '@limit': 1})), 1)
+        with self.assertRaises(ValueError):
+            self.collection.search_by_condition({'@limit': -1})
+
     def test_search_after_deletion(self):
         self.collection.delete(self.id2)
         query = {'name': {'@eq': 'Bob'}}
@@ -81,5 +140,36 @@ class TestCollectionIntegration(unittest.TestCase):
         self.assertEqual(len(results), 0)
 
 
+class TestParallelScan(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_parallel_scan_matches_sequential(self):
+        for engine in ('files', 'segments'):
+            collection = Collection(os.path.join(self.tempdir, engine), engine)
+            collection.insert_many([{'name': f'user{i}', 'age': i % 50} for i in range(200)])
+            collection.delete(collection.insert({'name': 'deleted', 'age': 1}))
+            query = {'@or': [{'age': {'@lt': 5}}, {'name': {'@regex': '^user19'}}]}
+
+            expected = collection.search_by_condition(query)
+            collection.scan_workers = 2
+            with mock.patch('code.collection.MIN_PARALLEL_DOCUMENTS', 0):
+                self.assertEqual(len(collection.storage.partitions(8)), 8)
+                self.assertCountEqual(collection.search_by_condition(query), expected)
+                self.assertEqual(len(list(collection.get_jsons())), 200)
+                self.assertEqual(collection.explain(query)[0].split('(')[0].strip(), "Filter " + str(query))
+
+    def test_small_collection_is_scanned_in_process(self):
+        collection = Collection(self.tempdir)
+        collection.insert({'name': 'Alice'})
+        collection.scan_workers = 4
+        with mock.patch('code.collection._executor') as executor:
+            self.assertEqual([doc['name'] for doc in collection.search_by_condition({'name': 'Alice'})], ['Alice'])
+        executor.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main()
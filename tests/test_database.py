@@ -130,6 +130,58 @@ class TestDatabaseIntegration(unittest.TestCase):
         self.assertEqual(len(guests_results), 1)
         self.assertEqual(guests_results[0]['name'], 'Guest1')
 
+    def test_insert_many(self):
+        self.database.index('age')
+        ids = self.database.insert_many(json.dumps([{'name': 'Dan', 'age': 30}, {'name': 'Eve', 'age': 41}]))
+        self.assertEqual(len(ids), 2)
+
+        results = self.database.search_by_condition(json.dumps({'age': {'@eq': 30}}))
+        self.assertCountEqual([doc['name'] for doc in results], ['Alice', 'Dan'])
+
+    def test_import_json_array(self):
+        documents = [{'name': f'user{i}', 'age': i, 'bio': 'x' * (i % 7)} for i in range(50)]
+        path_to_file = os.path.join(self.tempdir, 'users.json')
+        with open(path_to_file, 'w', encoding='utf-8') as f:
+            json.dump(documents, f, indent=2)
+
+        collection = Database(self.tempdir, 'imported')
+        # Маленький буфер чтения и маленькие пачки, чтобы документы разрезались между чтениями
+        self.assertEqual(list(collection._read_json_documents(path_to_file, chunk_size=16)), documents)
+        self.assertEqual(collection.import_file(path_to_file, batch_size=7), 50)
+        self.assertEqual(len(list(collection.get_filenames())), 50)
+
+    def test_import_json_lines(self):
+        path_to_file = os.path.join(self.tempdir, 'users.jsonl')
+        with open(path_to_file, 'w', encoding='utf-8') as f:
+            f.write('{"name": "Dan", "age": 30}\n\n{"name": "Eve", "age": 41}\n')
+
+        self.database.index('age')
+        self.assertEqual(self.database.import_file(path_to_file), 2)
+        results = self.database.search_by_condition(json.dumps({'age': {'@gt': 35}}))
+        self.assertEqual([doc['name'] for doc in results], ['Eve'])
+
+    def test_import_concatenated_objects(self):
+        documents = [{'name': f'user{i}', 'tags': ['a', 'b'][:i % 3]} for i in range(10)]
+        path_to_file = os.path.join(self.tempdir, 'users.json')
+        with open(path_to_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(json.dumps(document, indent=i % 2) for i, document in enumerate(documents)))
+
+        collection = Database(self.tempdir, 'imported')
+        self.assertEqual(list(collection._read_json_documents(path_to_file, chunk_size=16)), documents)
+        self.assertEqual(collection.import_file(path_to_file), 10)
+
+        with open(path_to_file, 'a', encoding='utf-8') as f:
+            f.write(' garbage')
+        with self.assertRaises(json.JSONDecodeError):
+            list(collection._read_json_documents(path_to_file))
+
+    def test_import_truncated_file(self):
+        path_to_file = os.path.join(self.tempdir, 'broken.json')
+        with open(path_to_file, 'w', encoding='utf-8') as f:
+            f.write('[{"name": "Dan"}, {"name": "Ev')
+        with self.assertRaises(json.JSONDecodeError):
+            self.database.import_file(path_to_file)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,9 +3,11 @@ import tempfile
 import shutil
 import os
 import pickle
+from unittest import mock
 from code.collection import Collection
 from code.indexation import Indexation, Index
 from code.btree import BTree
+from code.paged_btree import PagedBTree, PagedBPlusTree
 
 
 class TestIndexationIntegration(unittest.TestCase):
@@ -31,12 +33,12 @@ class TestIndexationIntegration(unittest.TestCase):
         count = self.indexation.create_index('age')
         self.assertEqual(count, 4)
 
-        index_file = os.path.join(self.indexation.path_to_indexes, 'age.pkl')
+        index_file = os.path.join(self.indexation.path_to_indexes, 'age.idx')
         self.assertTrue(os.path.exists(index_file))
 
-        with open(index_file, 'rb') as f:
-            btree = pickle.load(f)
-            self.assertIsInstance(btree, BTree)
+        btree = PagedBTree(index_file)
+        self.assertIsInstance(btree, BTree)
+        self.assertCountEqual(btree.search(30), [self.id1, self.id3])
 
     def test_indexed_search(self):
         self.indexation.create_index('age')
@@ -91,6 +93,190 @@ class TestIndexationIntegration(unittest.TestCase):
         self.assertIn(self.id1, result)
         self.assertNotIn(self.id2, result)
 
+    def test_indexed_range_search(self):
+        self.indexation.create_index('age')
+
+        result = self.indexation.indexed_search('age', {'age': {'@gt': 25}})
+        self.assertCountEqual(result, [self.id1, self.id3, self.id4])
+
+        result = self.indexation.indexed_search('age', {'age': {'@gte': 25, '@lt': 40}})
+        self.assertCountEqual(result, [self.id1, self.id2, self.id3])
+
+        result = self.indexation.indexed_search('age', {'age': {'@lte': 25}})
+        self.assertCountEqual(result, [self.id2])
+
+    def test_indexed_ne_search(self):
+        self.indexation.create_index('age')
+        result = self.indexation.indexed_search('age', {'age': {'@ne': 30}})
+        self.assertCountEqual(result, [self.id2, self.id4])
+
+    def test_indexed_search_with_lossy_keys_matches_scan(self):
+        # 18.5 и "18" лежат в индексе под ключом 18: индекс должен вернуть надмножество того, что находит перебор
+        for age in (18, 18.5, '18', -0.5, 17, 19):
+            self.collection.insert({'name': 'Mixed', 'age': age})
+        indexation = self.collection.indexation
+        indexation.create_index('age')
+        self.assertFalse(indexation.indexes['age'].exact)
+
+        for condition in ({'@ne': 18}, {'@gt': 18}, {'@lt': 18}, {'@gte': 18.5}, {'@lt': 0}, {'@gt': '17'}):
+            query = {'age': condition}
+            predicate = self.collection.query_engine.parse_query(query)
+            scanned = {filename for filename, _ in self.collection.scan(query)}
+            candidates = indexation.indexed_search('age', query)
+            if candidates is not None:
+                candidates = {filename for filename in candidates if predicate(self.collection.get_json(filename))}
+                self.assertEqual(candidates, scanned, condition)
+            found = {row['_id'] for row in self.collection.search_by_condition(query, projection=['_id'])}
+            self.assertEqual(found, scanned, condition)
+
+    def test_indexed_search_unsupported_operator(self):
+        self.indexation.create_index('name')
+        self.assertIsNone(self.indexation.indexed_search('name', {'name': {'@regex': '^A'}}))
+        self.assertIsNone(self.indexation.indexed_search('name', {'name': {'@gt': 5}}))
+
+    def test_insert_updates_index(self):
+        self.collection.indexation.create_index('age')
+        new_id = self.collection.insert({'name': 'Eve', 'age': 30})
+
+        result = self.collection.indexation.indexed_search('age', {'age': {'@eq': 30}})
+        self.assertCountEqual(result, [self.id1, self.id3, new_id])
+
+        # Вставка должна пережить перезагрузку коллекции (индексы восстанавливаются по журналу)
+        reloaded = Collection(self.tempdir).indexation
+        self.assertIn(new_id, reloaded.indexed_search('age', {'age': {'@eq': 30}}))
+
+    def test_delete_is_persisted(self):
+        self.collection.indexation.create_index('age')
+        new_id = self.collection.insert({'name': 'Eve', 'age': 50})
+        self.collection.delete(self.id1)
+
+        reloaded = Collection(self.tempdir).indexation
+        self.assertEqual(reloaded.indexed_search('age', {'age': {'@eq': 50}}), [new_id])
+        self.assertNotIn(self.id1, reloaded.indexed_search('age', {'age': {'@eq': 30}}))
+        self.assertNotIn(self.id1, reloaded.indexes['age'].keys_by_id)
+
+    def test_legacy_pickle_index_is_migrated(self):
+        btree = BTree(3)
+        for filename, age in [(self.id1, 30), (self.id2, 25), (self.id3, 30)]:
+            btree.insert(age, filename)
+        with open(os.path.join(self.indexation.path_to_indexes, 'age.pkl'), 'wb') as f:
+            pickle.dump(btree, f)
+        with open(os.path.join(self.indexation.path_to_indexes, 'age.log'), 'wb') as f:
+            pickle.dump((self.id4, [40]), f)
+            pickle.dump((self.id1, None), f)
+
+        reloaded = Indexation(self.collection)
+        self.assertCountEqual(reloaded.indexed_search('age', {'age': {'@gte': 0}}), [self.id2, self.id3, self.id4])
+        self.assertEqual(reloaded.indexes['age'].keys_by_id[self.id2], [25])
+        self.assertEqual(sorted(os.listdir(self.indexation.path_to_indexes)), ['age.ids', 'age.idx'])
+
+    def test_remove_from_index_uses_reverse_map(self):
+        self.indexation.create_index('age')
+        self.assertEqual(self.indexation.indexes['age'].keys_by_id[self.id4], [40])
+
+        self.indexation.remove_from_index(self.id4)
+        self.assertEqual(self.indexation.indexed_search('age', {'age': {'@eq': 40}}), [])
+        self.assertNotIn(self.id4, self.indexation.indexes['age'].keys_by_id)
+
+    def test_statistics_survive_reload(self):
+        self.indexation.create_index('age')
+        self.collection.indexation.create_index('age')
+        self.collection.delete(self.id4)
+
+        reloaded = Collection(self.tempdir).indexation
+        self.assertEqual((reloaded.indexes['age'].key_count, reloaded.indexes['age'].distinct_keys), (3, 2))
+
+    def test_indexes_open_on_first_use(self):
+        self.indexation.create_index('age')
+        reloaded = Indexation(self.collection)
+        self.assertIn('age', reloaded.indexes)
+        self.assertEqual(reloaded.indexes.opened, {})
+
+        reloaded.add_to_index('new_id', {'name': 'Eve'})  # Документ без поля age - индекс не нужен
+        self.assertEqual(reloaded.indexes.opened, {})
+
+        self.assertCountEqual(reloaded.indexed_search('age', {'age': 30}), [self.id1, self.id3])
+        self.assertIn('age', reloaded.indexes.opened)
+
+    def test_index_reopened_after_external_change(self):
+        self.indexation.create_index('age')
+        other = Indexation(self.collection)
+        self.assertEqual(other.indexed_search('age', {'age': 50}), [])
+
+        self.indexation.add_to_index('new_id', {'age': 50})
+        self.assertEqual(other.indexed_search('age', {'age': 50}), [])   # Изменение пока только в памяти
+        self.indexation.flush()
+        self.assertEqual(other.indexed_search('age', {'age': 50}), ['new_id'])
+
+    def test_pinned_index(self):
+        self.indexation.create_index('age', pin=True)
+        self.assertEqual(Collection(self.tempdir).settings['pinned_indexes'], ['age'])
+
+        index = Indexation(Collection(self.tempdir)).indexes['age']
+        self.assertEqual(index.btree.MAX_LOADED_NODES, float('inf'))
+        self.assertEqual(index.btree.search(40), [self.id4])
+
+        self.indexation.pin_index('age', False)
+        index = Indexation(Collection(self.tempdir)).indexes['age']
+        self.assertEqual(index.btree.MAX_LOADED_NODES, PagedBTree.MAX_LOADED_NODES)
+
+    def test_index_order_and_tree(self):
+        self.indexation.create_index('age', order=16, tree='bplus')
+        btree = self.indexation.indexes['age'].btree
+        self.assertIsInstance(btree, PagedBPlusTree)
+        self.assertEqual(btree.t, 16)
+        self.assertCountEqual(self.indexation.indexed_search('age', {'age': {'@gte': 30}}), [self.id1, self.id3, self.id4])
+
+        self.indexation.create_index('age')  # Повторная индексация сохраняет порядок и вид дерева
+        reloaded = Indexation(self.collection)
+        self.assertEqual((reloaded.indexes['age'].btree.t, reloaded.indexes['age'].btree.KIND), (16, 'bplus'))
+
+        with self.assertRaises(ValueError):
+            self.indexation.create_index('age', order=1)
+        with self.assertRaises(ValueError):
+            self.indexation.create_index('age', tree='hash')
+
+    def test_create_index_with_external_sort(self):
+        for i in range(30):
+            self.collection.insert({'name': f'user{i}', 'age': i % 7, 'tags': [f'tag{i % 3}', 'x']})
+        with mock.patch('code.external_sort.RUN_SIZE', 10):  # Пары не помещаются в один кусок - сортировка через файлы
+            count = self.indexation.create_index('age', order=2)
+        self.assertEqual(count, 34)
+        self.assertEqual([name for name in os.listdir(self.indexation.path_to_indexes) if name.endswith('.run')], [])
+
+        index = self.indexation.indexes['age']
+        self.assertEqual((index.key_count, index.distinct_keys), (34, 10))
+        self.assertCountEqual(self.indexation.indexed_search('age', {'age': 30}), [self.id1, self.id3])
+        self.assertEqual(len(self.indexation.indexed_search('age', {'age': {'@lt': 7}})), 30)
+        self.assertEqual(index.keys_by_id[self.id4], [40])
+
+        document_id = self.collection.insert({'tags': ['x', 'b', 'x']})
+        self.indexation.create_index('tags')  # Ключи документа в обратном отображении - в порядке значений поля
+        self.assertEqual(self.indexation.indexes['tags'].keys_by_id[document_id], ['x', 'b', 'x'])
+
+    def test_date_index(self):
+        ids = [self.collection.insert({'created': created}) for created in
+               ('2024-03-05', '2024-03-05T23:59:59.999999', '2023-03-31T10:00:00+03:00', '2024-12-01', 'unknown')]
+        indexation = self.collection.indexation
+        indexation.create_index('created', date=True)
+        self.assertEqual(self.collection.settings['date_fields'], ['created'])
+        self.assertFalse(indexation.indexes['created'].exact)
+
+        self.assertCountEqual(indexation.search_operator('created', '@year', 2024), ids[:2] + ids[3:4])
+        self.assertCountEqual(indexation.search_operator('created', '@month', 3), ids[:3])
+        self.assertCountEqual(indexation.search_operator('created', '@day', 31), ids[2:3])
+        self.assertEqual(indexation.search_operator('created', '@month', 13), set())
+        self.assertIsNone(indexation.search_operator('created', '@year', '2024'))  # Не число - проверит предикат
+        self.assertIsNone(indexation.search_range('created', {'@gte': '2024'}))
+
+        found = self.collection.search_by_condition({'created': {'@year': 2024, '@day': 5}}, projection=['_id'])
+        self.assertCountEqual([row['_id'] for row in found], ids[:2])
+        self.assertIn('IndexSeek created @day 5', '\n'.join(self.collection.explain({'created': {'@day': 5}})))
+        self.assertEqual(len(self.collection.search_by_condition({'created': 'unknown'})), 1)
+
+        indexation.create_index('created', date=False)
+        self.assertTrue(indexation.indexes['created'].exact)
+
     def test_index_search_empty_collection(self):
         empty_tempdir = tempfile.mkdtemp()
         empty_collection = Collection(empty_tempdir)
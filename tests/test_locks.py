@@ -0,0 +1,129 @@
+import unittest
+import tempfile
+import shutil
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from code.locks import FileLock, AsyncReadWriteLock
+from code.collection import Collection
+
+
+def _insert_documents(path_to_collection, start):
+    collection = Collection(path_to_collection)
+    for i in range(start, start + 50):
+        collection.insert({'n': i})
+
+
+class TestFileLock(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.lock = FileLock(os.path.join(self.tempdir, 'collection.lock'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_writer_excludes_other_threads(self):
+        events = []
+
+        def read():
+            with self.lock.read():
+                events.append('read')
+
+        with self.lock.write():
+            thread = threading.Thread(target=read)
+            thread.start()
+            time.sleep(0.1)
+            events.append('write done')
+        thread.join()
+        self.assertEqual(events, ['write done', 'read'])
+
+    def test_readers_share(self):
+        with self.lock.read():
+            thread = threading.Thread(target=lambda: self.lock.read().__enter__())
+            thread.start()
+            thread.join(1)
+            self.assertFalse(thread.is_alive())  # Второй читатель не ждёт первого
+
+    def test_nested_and_upgrade(self):
+        with self.lock.read():
+            with self.lock.read():
+                with self.lock.write():  # Запись во время перебора результатов в том же потоке
+                    with self.lock.read():
+                        pass
+        acquired = []
+        thread = threading.Thread(target=lambda: self.lock.write().__enter__() or acquired.append(True))
+        thread.start()
+        thread.join(1)
+        self.assertEqual(acquired, [True])  # Все захваты сняты
+
+    def test_processes_keep_index_consistent(self):
+        path_to_collection = os.path.join(self.tempdir, 'users')
+        Collection(path_to_collection).indexation.create_index('n')
+        processes = [multiprocessing.Process(target=_insert_documents, args=(path_to_collection, start))
+                     for start in (0, 50, 100)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        collection = Collection(path_to_collection)
+        self.assertEqual(len(list(collection.get_filenames())), 150)
+        self.assertEqual(len(collection.search_by_condition({'n': {'@gte': 0}})), 150)
+        self.assertEqual(len(collection.indexation.indexes['n'].keys_by_id), 150)
+
+
+class TestAsyncReadWriteLock(unittest.TestCase):
+    def test_readers_run_together_writers_alone(self):
+        async def scenario():
+            lock = AsyncReadWriteLock()
+            active = {'readers': 0, 'writers': 0}
+            peaks = {'readers': 0, 'overlap': False}
+
+            async def reader():
+                async with lock.read():
+                    active['readers'] += 1
+                    peaks['readers'] = max(peaks['readers'], active['readers'])
+                    peaks['overlap'] |= active['writers'] > 0
+                    await asyncio.sleep(0.01)
+                    active['readers'] -= 1
+
+            async def writer():
+                async with lock.write():
+                    active['writers'] += 1
+                    peaks['overlap'] |= active['readers'] > 0 or active['writers'] > 1
+                    await asyncio.sleep(0.01)
+                    active['writers'] -= 1
+
+            await asyncio.gather(*(reader() if i % 3 else writer() for i in range(30)))
+            return peaks
+
+        peaks = asyncio.run(scenario())
+        self.assertGreater(peaks['readers'], 1)
+        self.assertFalse(peaks['overlap'])
+
+    def test_waiting_writer_blocks_new_readers(self):
+        async def scenario():
+            lock = AsyncReadWriteLock()
+            order = []
+
+            async def reader(name, delay):
+                await asyncio.sleep(delay)
+                async with lock.read():
+                    order.append(name)
+                    await asyncio.sleep(0.02)
+
+            async def writer():
+                await asyncio.sleep(0.005)
+                async with lock.write():
+                    order.append('writer')
+
+            await asyncio.gather(reader('first', 0), writer(), reader('second', 0.01))
+            return order
+
+        self.assertEqual(asyncio.run(scenario()), ['first', 'writer', 'second'])
+
+
+if __name__ == '__main__':
+    unittest.main()
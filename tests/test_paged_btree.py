@@ -0,0 +1,162 @@
+import unittest
+import tempfile
+import shutil
+import os
+import random
+from code.paged_btree import PagedBTree, PagedBPlusTree, open_tree, page_size_for
+
+
+class TestPagedBTree(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'age.idx')
+        self.tree = PagedBTree(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _fill(self, count):
+        for key in range(count):
+            self.tree.insert(key, f'id{key}')
+        self.tree.flush()
+
+    def test_reopen_after_random_changes(self):
+        random_generator = random.Random(9)
+        model = {}
+        for step in range(2000):
+            key = random_generator.randrange(300)
+            if random_generator.random() < 0.6:
+                self.tree.insert(key, f'id{step}')
+                model.setdefault(key, []).append(f'id{step}')
+            elif key in model:
+                value = model[key].pop()
+                self.tree.remove_key_value(key, value)
+                if not model[key]:
+                    del model[key]
+            if step % 100 == 0:
+                self.tree.flush()
+        self.tree.flush()
+
+        reopened = PagedBTree(self.path)
+        self.assertEqual({key: sorted(values) for key, values in reopened.range_search()},
+                         {key: sorted(values) for key, values in model.items()})
+
+    def test_open_reads_only_search_path(self):
+        self._fill(1000)
+        reopened = PagedBTree(self.path)
+        self.assertEqual(reopened.node_reads, 0)
+        self.assertEqual(reopened.search(500), ['id500'])
+        self.assertLess(reopened.node_reads, 10)  # Только узлы на пути от корня до ключа
+
+    def test_flush_writes_only_dirty_pages(self):
+        self._fill(1000)
+        pages = os.path.getsize(self.path) // self.tree.pager.page_size
+        self.tree.insert(1000, 'id1000')
+        written = self.tree.flush()
+        self.assertLess(written, 10)  # Заголовок и путь от корня до листа, а не весь файл
+        self.assertGreater(pages, 100)
+
+    def test_large_node_spans_several_pages(self):
+        for i in range(1000):
+            self.tree.insert('active', f'document-{i:05d}')
+        self.tree.flush()
+        self.assertGreater(len(self.tree.root.pages), 1)
+
+        reopened = PagedBTree(self.path)
+        self.assertEqual(len(reopened.search('active')), 1000)
+
+    def test_freed_pages_are_reused(self):
+        self._fill(500)
+        size = os.path.getsize(self.path)
+        for key in range(500):
+            self.tree.delete(key)
+        self.tree.flush()
+        self.assertNotEqual(self.tree.pager.header['free'], 0)
+
+        self._fill(500)
+        self.assertEqual(os.path.getsize(self.path), size)
+
+    def test_unchanged_nodes_are_released(self):
+        self._fill(3000)
+        self.tree.MAX_LOADED_NODES = 10
+        self.tree.flush()
+        self.assertEqual(len(self.tree.nodes), 1)
+        self.assertEqual(len(list(self.tree.range_search())), 3000)
+        self.assertEqual(self.tree.max_key(), 2999)
+
+
+    def test_bulk_load_writes_pages_as_it_goes(self):
+        self.tree.BULK_PENDING_PAGES = 16
+        self.tree.bulk_load((key, [f'id{key}']) for key in range(3000))
+        self.assertLess(len(self.tree.pager.pending), 16 + 10)
+        self.assertTrue(os.path.exists(self.path))  # Готовые узлы уже на диске до flush
+        self.tree.flush()
+
+        reopened = PagedBTree(self.path)
+        self.assertEqual([key for key, _ in reopened.range_search()], list(range(3000)))
+        self.assertEqual(reopened.search(1234), ['id1234'])
+
+    def test_order_and_page_size(self):
+        path = os.path.join(self.tempdir, 'wide.idx')
+        tree = PagedBTree(path, 64)
+        for key in range(1000):
+            tree.insert(key, f'id{key}')
+        tree.flush()
+
+        reopened = open_tree(path)
+        self.assertEqual(reopened.t, 64)
+        self.assertEqual(reopened.pager.page_size, page_size_for(64))
+        self.assertGreater(page_size_for(64), page_size_for(3))
+        self.assertEqual(reopened.search(999), ['id999'])
+
+
+class TestPagedBPlusTree(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'age.idx')
+        self.tree = PagedBPlusTree(self.path, 4)
+        for key in range(2000):
+            self.tree.insert(key, f'id{key}')
+        self.tree.flush()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_open_tree_restores_kind(self):
+        reopened = open_tree(self.path)
+        self.assertIsInstance(reopened, PagedBPlusTree)
+        with self.assertRaises(ValueError):
+            PagedBTree(self.path)
+
+    def test_range_scan_follows_leaf_links(self):
+        reopened = open_tree(self.path)
+        self.assertEqual([key for key, _ in reopened.range_search(1500, 1510)], list(range(1500, 1511)))
+        self.assertLess(reopened.node_reads, 10)  # Спуск к первому листу и несколько соседних листов
+
+        self.assertEqual(len(list(reopened.range_search())), 2000)
+
+    def test_changes_survive_reopen(self):
+        for key in range(0, 2000, 3):
+            self.tree.delete(key)
+        self.tree.insert(5000, 'id5000')
+        self.tree.flush()
+
+        reopened = open_tree(self.path)
+        expected = [key for key in range(2000) if key % 3] + [5000]
+        self.assertEqual([key for key, _ in reopened.range_search()], expected)
+
+    def test_bulk_load(self):
+        path = os.path.join(self.tempdir, 'bulk.idx')
+        tree = PagedBPlusTree(path, 4)
+        tree.BULK_PENDING_PAGES = 8
+        tree.bulk_load((key, [f'id{key}']) for key in range(2000))
+        tree.flush()
+        self.assertLess(os.path.getsize(path), os.path.getsize(self.path))  # Полные узлы - меньше страниц, чем после вставок
+
+        reopened = open_tree(path)
+        self.assertEqual([key for key, _ in reopened.range_search(1500, 1510)], list(range(1500, 1511)))
+        self.assertEqual(len(list(reopened.range_search())), 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
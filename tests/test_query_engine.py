@@ -1,6 +1,7 @@
 import unittest
 import tempfile
 import shutil
+from unittest import mock
 from code.collection import Collection
 from code.query_engine import QueryEngine
 
@@ -158,5 +159,21 @@ class TestQueryEngineIntegration(unittest.TestCase):
         self.assertFalse(pred({'name': None}))
 
 
+    def test_compiled_queries_are_cached(self):
+        query = {'age': {'@gte': 18}, 'name': 'Ivan'}
+        pred = self.query_engine.parse_query(query)
+        self.assertIs(self.query_engine.parse_query({'name': 'Ivan', 'age': {'@gte': 18}}), pred)  # Порядок ключей не важен
+        self.assertIsNot(self.query_engine.parse_query({'age': {'@gte': 18.0}, 'name': 'Ivan'}), pred)
+
+    def test_conditions_share_field_and_cheap_checks_go_first(self):
+        with mock.patch.object(self.collection, 'get_value', wraps=self.collection.get_value) as get_value:
+            pred = QueryEngine(self.collection).parse_query(
+                {'@and': [{'created': {'@year': 2024}}, {'name': {'@regex': '^I'}}, {'age': {'@gte': 18, '@lt': 30}}]})
+            self.assertFalse(pred({'age': 40, 'name': 'Ivan', 'created': '2024-01-01'}))
+            self.assertEqual([call.args[1] for call in get_value.call_args_list], ['age'])  # До regex и дат не дошло
+
+            self.assertTrue(pred({'age': 20, 'name': 'Ivan', 'created': '2024-01-01'}))
+            self.assertEqual(get_value.call_count, 4)  # age извлекается один раз для обоих условий
+
 if __name__ == '__main__':
     unittest.main()
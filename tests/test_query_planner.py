@@ -0,0 +1,159 @@
+import unittest
+import tempfile
+import shutil
+from code.collection import Collection
+from unittest import mock
+from code.query_planner import FullScan, IndexSeek, IndexRange, Intersection, Union, ScanFilter, IndexOnlyScan, Filter, \
+    Sort, IndexOrderScan
+
+
+class TestQueryPlanner(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.collection = Collection(self.tempdir)
+        self.collection.insert_many(
+            [{'name': f'user{i}', 'age': i % 50, 'status': 'active' if i % 10 else 'blocked'} for i in range(200)])
+        self.collection.indexation.create_index('age')
+        self.collection.indexation.create_index('status')
+        self.planner = self.collection.query_planner
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_index_statistics(self):
+        index = self.collection.indexation.get_indexes()['age']
+        self.assertEqual(index.key_count, 200)
+        self.assertEqual(index.distinct_keys, 50)
+
+        self.collection.insert({'age': 1000})
+        self.assertEqual((index.key_count, index.distinct_keys), (201, 51))
+
+    def test_seek_on_selective_index(self):
+        plan = self.planner.plan({'age': 7})
+        self.assertIsInstance(plan.source, IndexSeek)
+        self.assertEqual(len(plan.execute()), 4)
+
+    def test_unindexed_field_uses_full_scan(self):
+        plan = self.planner.plan({'name': {'@regex': '^user1'}})
+        self.assertIsInstance(plan.source, FullScan)
+        self.assertEqual(len(plan.execute()), 111)
+
+    def test_unselective_index_uses_full_scan(self):
+        plan = self.planner.plan({'status': 'active'})  # 90% коллекции - дешевле перебрать всё
+        self.assertIsInstance(plan.source, FullScan)
+        self.assertEqual(len(plan.execute()), 180)
+
+    def test_range_and_intersection(self):
+        plan = self.planner.plan({'age': {'@gte': 10, '@lt': 12}, 'status': 'blocked'})
+        self.assertIsInstance(plan.source, Intersection)
+        self.assertIsInstance(plan.source.children[0], IndexRange)
+        self.assertCountEqual([doc['name'] for doc in plan.execute()], ['user10', 'user60', 'user110', 'user160'])
+
+    def test_or_uses_union(self):
+        plan = self.planner.plan({'@or': [{'age': 1}, {'age': {'@gt': 48}}]})
+        self.assertIsInstance(plan.source, Union)
+        self.assertEqual(len(plan.execute()), 8)
+
+    def test_or_of_many_indexed_branches(self):
+        query = {'@or': [{'age': age} for age in range(0, 50, 5)] + [{'status': 'blocked', 'age': 3}]}
+        plan = self.planner.plan(query)
+        self.assertIsInstance(plan.source, Union)
+        self.assertEqual(len(plan.source.children), 11)
+        self.assertEqual(len(plan.execute()), 40)
+
+    def test_nested_and_inside_or(self):
+        query = {'@or': [{'@and': [{'age': 10}, {'status': 'blocked'}]}, {'age': {'@lte': 1}}]}
+        plan = self.planner.plan(query)
+        self.assertIsInstance(plan.source, Union)
+        self.assertEqual(len(plan.execute()), 12)
+
+    def test_or_scans_only_unindexed_branches(self):
+        branches = [{'age': age} for age in range(10)] + [{'name': {'@regex': '^user19$'}}]
+        plan = self.planner.plan({'@or': branches})
+        self.assertIsInstance(plan.source, Union)
+        scan_filter = plan.source.children[-1]
+        self.assertIsInstance(scan_filter, ScanFilter)
+        self.assertEqual(scan_filter.query, {'@or': [{'name': {'@regex': '^user19$'}}]})
+
+        names = [doc['name'] for doc in plan.execute()]
+        self.assertEqual(len(names), 41)
+        self.assertIn('user19', names)
+        self.assertEqual(scan_filter.actual_rows, 1)
+
+    def test_explain(self):
+        lines = self.collection.explain({'age': {'@eq': 3}})
+        self.assertTrue(lines[0].startswith('Filter'))
+        self.assertIn('actual rows: 4', lines[0])
+        self.assertIn('IndexSeek age @eq 3', lines[1])
+
+    def test_projection_from_documents(self):
+        results = self.collection.search_by_condition({'name': 'user7'}, projection=['name', 'age', 'missing'])
+        self.assertEqual(results, [{'name': 'user7', 'age': 7}])
+
+    def test_covered_query_does_not_read_documents(self):
+        plan = self.planner.plan({'age': {'@gte': 45}, 'status': 'blocked'}, ['_id', 'age'])
+        self.assertIsInstance(plan, IndexOnlyScan)
+        self.assertIsInstance(plan.source, Intersection)
+
+        with mock.patch.object(self.collection.storage, 'get_json') as get_json:
+            results = self.collection.search_by_condition({'age': {'@gte': 45}, 'status': 'blocked'}, projection=['_id', 'age'])
+        get_json.assert_not_called()
+        self.assertEqual(len(results), 0)   # blocked - только i % 10 == 0, а age = i % 50 >= 45 у них не бывает
+
+        results = self.collection.search_by_condition({'age': 3}, projection=['_id', 'status'])
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertEqual(result['status'], self.collection.get_json(result['_id'])['status'])
+
+    def test_covered_query_skips_empty_documents(self):
+        for engine in ('files', 'segments'):
+            tempdir = tempfile.mkdtemp()
+            try:
+                collection = Collection(tempdir, engine)
+                collection.insert_many([{'age': 1}, {}, {'name': 'x'}, {'age': 2}])
+                collection.indexation.create_index('age')
+                for query in ({}, {'age': {'@ne': 1}}, {'age': {'@gte': 1}}):
+                    self.assertIsInstance(collection.query_planner.plan(query, ['_id']), IndexOnlyScan)
+                    covered = collection.search_by_condition(query, projection=['_id'])
+                    scanned = [filename for filename, _ in collection.scan(query)]
+                    self.assertCountEqual([row['_id'] for row in covered], scanned, (engine, query))
+            finally:
+                shutil.rmtree(tempdir)
+
+    def test_not_covered_query_reads_documents(self):
+        self.assertIsInstance(self.planner.plan({'age': 3}, ['name']), Filter)                     # name не индексирован
+        self.assertIsInstance(self.planner.plan({'age': {'@regex': '3'}}, ['age']), Filter)         # Оператор не из индекса
+        self.assertIsInstance(self.planner.plan({'age': '3'}, ['age']), Filter)                     # Ключ индекса отличается от значения
+
+        self.collection.insert({'age': 3.5})    # Индекс хранит 3 вместо 3.5 - значения из него брать нельзя
+        self.assertFalse(self.collection.indexation.get_indexes()['age'].exact)
+        self.assertIsInstance(self.planner.plan({'age': 3}, ['age']), Filter)
+        self.assertIn({'age': 3.5}, self.collection.search_by_condition({'age': {'@gte': 3}}, projection=['age']))
+
+    def test_sort_uses_index_walk_for_top_k(self):
+        plan = self.planner.plan({}, sort=('age', True), count=5)
+        self.assertIsInstance(plan, IndexOrderScan)
+        with mock.patch.object(self.collection.storage, 'get_json', wraps=self.collection.storage.get_json) as get_json:
+            results = self.collection.search_by_condition({'@sort': ['age', 'desc'], '@limit': 5})
+        self.assertEqual([doc['age'] for doc in results], [49, 49, 49, 49, 48])
+        self.assertEqual(get_json.call_count, 5)  # Обход индекса остановился на пятом документе
+
+        results = self.collection.search_by_condition({'status': 'blocked'}, limit=3, skip=3, sort='age')
+        self.assertEqual([doc['age'] for doc in results], [0, 10, 10])
+
+    def test_sort_without_index_uses_heap(self):
+        plan = self.planner.plan({'age': {'@lt': 3}}, sort=('name', False), count=3)
+        self.assertIsInstance(plan, Sort)
+        self.assertEqual(plan.details(), 'name asc, top 3')
+        self.assertEqual([doc['name'] for doc in plan.execute()], ['user0', 'user1', 'user100'])
+
+        self.collection.insert({'name': 'no age'})
+        results = self.collection.search_by_condition({}, sort=('age', 'desc'))
+        self.assertEqual(results[-1], {'name': 'no age'})  # Документы без поля сортировки - в конце
+        self.assertEqual(len(results), 201)
+        with self.assertRaises(ValueError):
+            self.collection.search_by_condition({}, sort=('age', 'up'))
+
+
+if __name__ == '__main__':
+    unittest.main()
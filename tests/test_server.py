@@ -0,0 +1,120 @@
+import unittest
+import unittest.mock
+import tempfile
+import shutil
+import os
+import threading
+import time
+import subprocess
+import sys
+from code.server import Server
+from code.client import Client, ServerError
+from code.cli_core import DB
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tempdir, 'testdb'))
+        self.server = Server(self.tempdir, port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = Client(*self.server.address)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        shutil.rmtree(self.tempdir)
+
+    def test_requests(self):
+        self.assertEqual(self.client.request('ping'), 'pong')
+        ids = self.client.request('insert_many', 'testdb/users', documents=[{'name': 'Alice', 'age': 30},
+                                                                           {'name': 'Bob', 'age': 25}])
+        self.client.request('insert', 'testdb/users', document="{'name': 'Charlie', 'age': 30}")
+        self.assertEqual(self.client.request('index', 'testdb/users', field='age'), 3)
+
+        found = self.client.request('search', 'testdb/users', query={'age': 30}, projection=['name'], sort=['name', 'desc'])
+        self.assertEqual(found, [{'name': 'Charlie'}, {'name': 'Alice'}])
+        self.assertEqual(self.client.request('aggregate', 'testdb/users', aggregations={'n': {'@count': '*'}}, group_by='age'),
+                         [{'age': 25, 'n': 1}, {'age': 30, 'n': 2}])
+        self.client.request('delete', 'testdb/users', id=ids[0])
+        self.assertEqual(len(self.client.request('list_jsons', 'testdb/users')), 2)
+        self.assertIs(self.server.databases['testdb/users'], self.server.database('testdb/users'))  # База остаётся открытой
+
+    def test_errors(self):
+        with self.assertRaises(ServerError):
+            self.client.request('search', 'missing/users', query={})
+        with self.assertRaises(ServerError):
+            self.client.request('drop_everything', 'testdb/users')
+        with self.assertRaisesRegex(ServerError, 'FileNotFoundError'):
+            self.client.request('delete', 'testdb/users', id='nonexistent')
+        self.assertEqual(self.client.request('ping'), 'pong')  # Соединение живо после ошибок
+
+    def test_cli_client_mode(self):
+        db = DB('testdb', '/nonexistent', 'users', client=self.client)  # Локальная папка не нужна - команды выполняет сервер
+        db.insert("{'name': 'Alice', 'age': 30}")
+        with unittest.mock.patch('code.cli_core.typer.echo') as echo:
+            db.search_by_condition("{'age': 30}", fields='name')
+        echo.assert_called_with({'name': 'Alice'})
+        self.assertEqual(db.aggregate("{}"), [{'count': 1}])
+
+    def test_cli_client_mode_does_not_load_engine(self):
+        code = "import sys, code.cli_core; print(sorted(m for m in ('code.database', 'code.server') if m in sys.modules))"
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+        self.assertEqual(output.strip(), '[]')
+
+    def test_concurrent_inserts_share_journal_writes(self):
+        collection = self.server.database('testdb/users').collection
+        append = collection.wal.append
+        calls = []
+
+        def slow_append(operations):
+            calls.append(len(operations))
+            if len(calls) == 1:
+                time.sleep(0.3)     # Пока первая группа пишется в журнал, остальные вставки встают в очередь
+            append(operations)
+
+        def write(i):
+            with Client(*self.server.address) as client:
+                client.request('insert', 'testdb/users', document={'n': i})
+
+        with unittest.mock.patch.object(collection.wal, 'append', side_effect=slow_append):
+            threads = [threading.Thread(target=write, args=(i,)) for i in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sum(calls), 5)
+        self.assertLess(len(calls), 5)
+        self.assertEqual(len(self.client.request('list_jsons', 'testdb/users')), 5)
+
+    def test_concurrent_clients(self):
+        self.client.request('index', 'testdb/users', field='n')
+        errors = []
+
+        def write(start):
+            with Client(*self.server.address) as client:
+                for i in range(start, start + 20):
+                    client.request('insert', 'testdb/users', document={'n': i})
+
+        def read():
+            with Client(*self.server.address) as client:
+                for _ in range(20):
+                    found = client.request('search', 'testdb/users', query={'n': {'@gte': 0}})
+                    counted = client.request('aggregate', 'testdb/users', aggregations={'n': {'@count': '*'}})
+                    if len(found) > counted[0]['n']:   # Между запросами документы только добавляются
+                        errors.append((len(found), counted))
+
+        threads = [threading.Thread(target=write, args=(start,)) for start in (0, 20)]
+        threads += [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.client.request('search', 'testdb/users', query={'n': {'@gte': 0}})), 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
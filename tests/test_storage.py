@@ -0,0 +1,244 @@
+import unittest
+import tempfile
+import shutil
+import os
+from unittest import mock
+from code.collection import Collection, query_fields
+from code.storage import SegmentStorage
+from code.document_format import DOCUMENT_FORMATS, BinaryFormat
+
+
+class TestSegmentStorage(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.storage = SegmentStorage(self.tempdir)
+
+        self.storage.insert('id1', {'name': 'Alice', 'age': 30})
+        self.storage.insert('id2', {'name': 'Bob', 'age': 25})
+        self.storage.insert('id3', {'name': 'Иван', 'city': 'Москва'})
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_insert_and_get_json(self):
+        self.assertEqual(self.storage.get_json('id1'), {'name': 'Alice', 'age': 30})
+        self.assertEqual(self.storage.get_json('id3')['city'], 'Москва')
+        self.assertIsNone(self.storage.get_json('nonexistent_id'))
+
+    def test_documents_share_one_segment(self):
+        segments = [f for f in os.listdir(self.storage.path_to_segments) if f.endswith('.seg')]
+        self.assertEqual(len(segments), 1)
+
+    def test_delete_writes_tombstone(self):
+        self.storage.delete('id2')
+        self.assertFalse(self.storage.exists('id2'))
+        self.assertIsNone(self.storage.get_json('id2'))
+        self.assertCountEqual(self.storage.get_filenames(), ['id1', 'id3'])
+
+        with self.assertRaises(FileNotFoundError):
+            self.storage.delete('id2')
+
+    def test_reopen_restores_offsets(self):
+        self.storage.delete('id1')
+        reopened = SegmentStorage(self.tempdir)
+        self.assertCountEqual(reopened.get_filenames(), ['id2', 'id3'])
+        self.assertEqual(reopened.get_json('id2'), {'name': 'Bob', 'age': 25})
+
+    def test_reopen_after_torn_write(self):
+        path_to_segment = self.storage._path(self.storage.segments[-1])
+        with open(path_to_segment, 'ab') as file:
+            file.write(b'id4\t{"name": "Da')
+
+        reopened = SegmentStorage(self.tempdir)
+        self.assertCountEqual(reopened.get_filenames(), ['id1', 'id2', 'id3'])
+        reopened.insert('id5', {'name': 'Eve'})
+        self.assertEqual(SegmentStorage(self.tempdir).get_json('id5'), {'name': 'Eve'})
+
+    def test_compact(self):
+        self.storage.delete('id1')
+        self.storage.delete('id2')
+        reclaimed = self.storage.compact()
+        self.assertGreater(reclaimed, 0)
+        self.assertEqual(self.storage.dead_bytes, 0)
+        self.assertEqual(list(self.storage.get_jsons()), [('id3', {'name': 'Иван', 'city': 'Москва'})])
+
+        reopened = SegmentStorage(self.tempdir)
+        self.assertEqual(list(reopened.get_filenames()), ['id3'])
+        self.assertEqual(reopened.get_json('id3')['name'], 'Иван')
+
+    def test_document_cache(self):
+        self.storage.get_json('id1')
+        self.assertEqual(self.storage.get_json('id1'), self.storage.get_json('id1'))
+        self.assertEqual(self.storage.cache.stats()['hits'], 2)
+
+        self.storage.insert('id1', {'name': 'Alice', 'age': 31})  # Перезапись меняет место записи - старый документ не отдаётся
+        self.assertEqual(self.storage.get_json('id1')['age'], 31)
+        self.storage.delete('id1')
+        self.assertIsNone(self.storage.get_json('id1'))
+
+
+class TestSegmentCollection(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.collection = Collection(self.tempdir, engine='segments')
+
+        self.id1 = self.collection.insert({'name': 'Alice', 'age': 30})
+        self.id2 = self.collection.insert({'name': 'Bob', 'age': 25})
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_engine_is_persisted(self):
+        reopened = Collection(self.tempdir)
+        self.assertIsInstance(reopened.storage, SegmentStorage)
+        self.assertEqual(reopened.get_json(self.id1)['name'], 'Alice')
+        self.assertFalse(any(f.endswith('.json') for f in os.listdir(self.tempdir)))
+
+    def test_engine_cannot_be_changed(self):
+        with self.assertRaises(ValueError):
+            Collection(self.tempdir, engine='files')
+
+    def test_search_and_delete(self):
+        self.collection.indexation.create_index('age')
+        self.collection.delete(self.id1)
+        self.assertEqual(self.collection.search_by_condition({'age': {'@gte': 0}}), [{'name': 'Bob', 'age': 25}])
+        self.assertGreater(self.collection.compact(), 0)
+
+
+
+class TestDocumentFormats(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        # 10 полей - в заголовке binary есть байт \n; \x1b в значении - тоже экранируется в сегментах
+        self.document = {f'f{i}': i for i in range(8)}
+        self.document.update({'name': 'Иван\n\x1b', 'tags': [1, {'a': None}]})
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_round_trip(self):
+        for name, document_format in DOCUMENT_FORMATS.items():
+            for document in (self.document, {}, {'a\0b': 1}, [1, 2]):
+                self.assertEqual(document_format.loads(document_format.dumps(document)), document, name)
+        binary = BinaryFormat()
+        self.assertEqual(binary.loads(binary.dumps(self.document), {'name', 'missing'}), {'name': 'Иван\n\x1b'})
+        self.assertEqual(binary.loads(binary.dumps({1: [True], None: {2: 'x'}})), {'1': [True], 'null': {'2': 'x'}})
+        self.assertLess(len(DOCUMENT_FORMATS['compact'].dumps(self.document)), len(DOCUMENT_FORMATS['json'].dumps(self.document)))
+
+    def test_binary_values_are_typed(self):
+        binary = BinaryFormat()
+        for value in (0, -128, 127, 128, -32769, 2 ** 31, -2 ** 63, 2 ** 63, -2 ** 100, 1.5, float('inf'), '', 'я' * 300,
+                      None, False, list(range(300)), {'k' * 300: {'nested': [None, 'x' * 70000]}}):
+            self.assertEqual(binary.loads(binary.dumps({'v': value, 'w': 1}), {'v'}), {'v': value}, value)
+        # Значения не текст JSON: int16 - тег и два байта, строка - тег, длина и байты без кавычек
+        self.assertTrue(binary.dumps({'v': 1000}).endswith(b'h\xe8\x03'))
+        self.assertTrue(binary.dumps({'v': 'ab'}).endswith(b's\x02ab'))
+
+    def test_query_fields(self):
+        self.assertEqual(query_fields({'age': 1, 'address.city': 'X', '@or': [{'a': 1}, {'@not': {'b': 2}}]}),
+                         {'age', 'address', 'a', 'b'})
+        self.assertIsNone(query_fields({'$..name': 'X'}))
+
+    def test_collections_in_every_format(self):
+        for engine in ('files', 'segments'):
+            for name in DOCUMENT_FORMATS:
+                path = os.path.join(self.tempdir, engine + name)
+                collection = Collection(path, engine, name)
+                ids = collection.insert_many([self.document, {'name': 'Bob', 'f1': 5}])
+                collection.indexation.create_index('f1')
+                collection.delete(ids[1])
+
+                reopened = Collection(path)
+                self.assertEqual(reopened.settings['format'], name)
+                self.assertEqual(reopened.get_json(ids[0]), self.document)
+                self.assertEqual(reopened.search_by_condition({'f1': 1}), [self.document])
+                self.assertEqual(reopened.search_by_condition({'name': {'@regex': '^Иван'}, 'f2': 2}), [self.document])
+                self.assertEqual(reopened.search_by_condition({'name': 'Bob'}), [])
+                reopened.compact()
+                self.assertEqual(reopened.search_by_condition({}), [self.document])
+
+    def test_binary_scan_decodes_matching_documents_only(self):
+        collection = Collection(os.path.join(self.tempdir, 'users'), document_format='binary')
+        collection.insert_many([{'age': i, 'name': f'user{i}'} for i in range(10)])
+        collection.storage.cache.max_bytes = 0
+        with mock.patch.object(BinaryFormat, 'loads', autospec=True, side_effect=BinaryFormat.loads) as loads:
+            self.assertEqual(collection.search_by_condition({'age': 3}), [{'age': 3, 'name': 'user3'}])
+        self.assertEqual(sum(call.args[2:] == () for call in loads.call_args_list), 1)  # Целиком - только подошедший
+
+    def test_scan_skips_empty_documents_in_every_format(self):
+        for engine in ('files', 'segments'):
+            for name in DOCUMENT_FORMATS:
+                collection = Collection(os.path.join(self.tempdir, engine + name), engine, name)
+                collection.insert_many([{}, {'name': 'bob'}])
+                self.assertEqual(collection.search_by_condition({'@not': {'name': 'bob'}}), [], (engine, name))
+
+    def test_parallel_scan_in_binary(self):
+        collection = Collection(os.path.join(self.tempdir, 'users'), 'segments', 'binary')
+        collection.insert_many([{'age': i % 50} for i in range(2000)])
+        collection.scan_workers = 2
+        self.assertEqual(len(collection.search_by_condition({'age': 7})), 40)
+
+    def test_format_cannot_be_changed(self):
+        path = os.path.join(self.tempdir, 'users')
+        Collection(path).insert({'a': 1})
+        with self.assertRaises(ValueError):
+            Collection(path, document_format='binary')
+        with self.assertRaises(ValueError):
+            Collection(os.path.join(self.tempdir, 'other'), document_format='xml')
+
+
+class TestDocumentCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.collection = Collection(self.tempdir)
+        self.ids = self.collection.insert_many([{'name': f'user{i}', 'age': i} for i in range(5)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_get_json_is_cached_and_checks_mtime(self):
+        first = self.collection.get_json(self.ids[0])
+        self.assertEqual(self.collection.get_json(self.ids[0]), first)
+        self.assertEqual(self.collection.cache_stats()['hits'], 1)
+
+        path = os.path.join(self.tempdir, f'{self.ids[0]}.json')
+        with open(path, 'w', encoding='utf-8') as file:   # Изменение файла в обход коллекции
+            file.write('{"name": "changed", "age": 100}')
+        os.utime(path, ns=(1, 1))
+        self.assertEqual(self.collection.get_json(self.ids[0])['name'], 'changed')
+
+        self.collection.delete(self.ids[0])
+        self.assertIsNone(self.collection.get_json(self.ids[0]))
+        self.assertNotIn(self.ids[0], self.collection.storage.cache.entries)
+
+    def test_changing_returned_document_does_not_change_cache(self):
+        for engine in ('files', 'segments'):
+            collection = Collection(os.path.join(self.tempdir, engine), engine)
+            filename = collection.insert({'age': 1, 'tags': ['a']})
+            for json_document in (collection.get_json(filename), collection.get_json(filename),
+                                  collection.search_by_condition({'age': 1})[0]):
+                json_document['age'] = 99
+                json_document['tags'].append('b')
+            self.assertEqual(collection.get_json(filename), {'age': 1, 'tags': ['a']})
+            self.assertEqual(collection.search_by_condition({'age': 99}), [])
+            self.assertGreater(collection.cache_stats()['hits'], 0)
+
+    def test_lru_eviction_by_bytes(self):
+        cache = self.collection.storage.cache
+        size = os.path.getsize(os.path.join(self.tempdir, f'{self.ids[0]}.json'))
+        cache.max_bytes = size * 2
+        for filename in self.ids[:3]:
+            self.collection.get_json(filename)
+        self.assertEqual(list(cache.entries), self.ids[1:3])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        self.collection.get_json(self.ids[1])   # Недавно прочитанный документ вытесняется последним
+        self.collection.get_json(self.ids[3])
+        self.assertEqual(list(cache.entries), [self.ids[1], self.ids[3]])
+
+        list(self.collection.get_jsons())       # Перебор коллекции не вытесняет документы из кэша
+        self.assertCountEqual(cache.entries, [self.ids[1], self.ids[3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+import tempfile
+import shutil
+import os
+import time
+import threading
+from unittest import mock
+from code.collection import Collection
+from code.indexation import Indexation
+from code.wal import WriteAheadLog
+
+
+class TestWriteAheadLog(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'wal.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_records_and_torn_tail(self):
+        wal = WriteAheadLog(self.path)
+        wal.append([('insert', 'a', {'n': 1}), ('delete', 'b')])
+        wal.append([('insert', 'c', {'n': 3})])
+        self.assertEqual(wal.syncs, 2)  # Одна группа - один fsync
+        with open(self.path, 'ab') as f:
+            f.write(b'\x10\x00\x00\x00garbage')  # Запись, недописанная при сбое
+
+        other = WriteAheadLog(self.path)
+        self.assertTrue(other.behind())
+        self.assertEqual(other.records(), [('insert', 'a', {'n': 1}), ('delete', 'b'), ('insert', 'c', {'n': 3})])
+        other.truncate()
+        self.assertEqual(os.path.getsize(self.path), 0)
+        self.assertTrue(wal.behind())
+
+
+class TestCollectionLog(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.collection = Collection(self.tempdir)
+        self.collection.indexation.create_index('age')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_index_pages_written_at_checkpoint(self):
+        new_id = self.collection.insert({'age': 50})
+        self.assertGreater(os.path.getsize(self.collection.wal.path), 0)
+        self.assertEqual(Indexation(self.collection).indexed_search('age', {'age': 50}), [])  # Пока только в журнале и в памяти
+
+        self.collection.checkpoint()
+        self.assertEqual(os.path.getsize(self.collection.wal.path), 0)
+        self.assertEqual(Indexation(self.collection).indexed_search('age', {'age': 50}), [new_id])
+
+    def test_automatic_checkpoint(self):
+        self.collection.checkpoint_bytes = 1
+        new_id = self.collection.insert({'age': 50})
+        self.assertEqual(os.path.getsize(self.collection.wal.path), 0)
+        self.assertEqual(Indexation(self.collection).indexed_search('age', {'age': 50}), [new_id])
+
+    def test_recovery_replays_log(self):
+        kept = self.collection.insert({'age': 50})
+        removed = self.collection.insert({'age': 50})
+        self.collection.delete(removed)
+        # Сбой после записи в журнал, но до применения к хранилищу
+        self.collection.wal.append([('insert', 'logged', {'age': 50})])
+
+        recovered = Collection(self.tempdir)
+        self.assertEqual(os.path.getsize(recovered.wal.path), 0)
+        self.assertEqual(recovered.get_json('logged'), {'age': 50})
+        self.assertCountEqual(recovered.indexation.indexed_search('age', {'age': 50}), [kept, 'logged'])
+        self.assertCountEqual(Indexation(recovered).indexed_search('age', {'age': 50}), [kept, 'logged'])
+
+    def test_interrupted_checkpoint_rebuilds_indexes(self):
+        new_id = self.collection.insert({'age': 50})
+        self.collection.wal.append([('checkpoint',)])   # Сбой во время записи страниц индексов
+        with mock.patch.object(Indexation, 'create_index', autospec=True, side_effect=Indexation.create_index) as create_index:
+            recovered = Collection(self.tempdir)
+        self.assertEqual([call.args[1] for call in create_index.call_args_list], ['age'])
+        self.assertEqual(recovered.indexation.indexed_search('age', {'age': 50}), [new_id])
+
+    def test_group_commit(self):
+        threads = [threading.Thread(target=self.collection.insert, args=({'age': i},)) for i in range(8)]
+        syncs = self.collection.wal.syncs
+        with self.collection.lock.write():  # Пока блокировка занята, вставки копятся в очереди
+            for thread in threads:
+                thread.start()
+            while len(self.collection.pending) < len(threads):
+                time.sleep(0.001)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.collection.wal.syncs - syncs, 1)   # Вся очередь - одной записью журнала
+        self.assertEqual(len(self.collection.search_by_condition({'age': {'@gte': 0}})), 8)
+
+    def test_failed_operation_in_group(self):
+        with self.assertRaises(FileNotFoundError):
+            self.collection.delete('nonexistent')
+        self.assertEqual(self.collection.wal.records(), [])  # Неудачная операция не попадает в журнал
+
+    def test_incomparable_key_is_not_logged(self):
+        kept = self.collection.insert({'age': 50})
+        with self.assertRaises(TypeError):
+            self.collection.insert({'age': 'n/a'})
+        self.assertEqual(len(self.collection.wal.records()), 1)  # Только первая вставка
+
+        reopened = Collection(self.tempdir)
+        self.assertEqual(list(reopened.get_filenames()), [kept])
+        self.assertEqual(reopened.indexation.indexed_search('age', {'age': 50}), [kept])
+
+    def test_recovery_skips_bad_record(self):
+        kept = self.collection.insert({'age': 50})
+        # Журнал старой версии: запись с несравнимым ключом попала в журнал, документ - в хранилище
+        self.collection.wal.append([('insert', 'bad', {'age': 'n/a'}), ('insert', 'logged', {'age': 51})])
+        self.collection.storage.insert('bad', {'age': 'n/a'})
+
+        with self.assertLogs('code.collection', 'WARNING'):
+            recovered = Collection(self.tempdir)
+        self.assertEqual(os.path.getsize(recovered.wal.path), 0)
+        self.assertCountEqual(recovered.get_filenames(), [kept, 'logged'])
+        self.assertCountEqual(recovered.indexation.indexed_search('age', {'age': {'@gte': 0}}), [kept, 'logged'])
+        self.assertEqual(WriteAheadLog(os.path.join(self.tempdir, 'wal.rejected')).records(),
+                         [('insert', 'bad', {'age': 'n/a'})])
+        Collection(self.tempdir)    # Открывается и дальше
+
+    def test_open_does_not_wait_for_readers(self):
+        self.collection.checkpoint()
+        opened = threading.Event()
+        with self.collection.lock.read():   # Читатель (у каждого потока свой дескриптор - как у другого процесса)
+            thread = threading.Thread(target=lambda: (Collection(self.tempdir), opened.set()))
+            thread.start()
+            self.assertTrue(opened.wait(5))
+        thread.join()
+
+    def test_other_process_changes_are_applied(self):
+        for engine in ('files', 'segments'):
+            path = os.path.join(self.tempdir, engine)
+            first = Collection(path, engine)
+            first.indexation.create_index('age')
+            second = Collection(path)
+
+            first_id = first.insert({'age': 50})
+            self.assertEqual(second.search_by_condition({'age': 50}, projection=['_id']), [{'_id': first_id}])
+            second_id = second.insert({'age': 60})
+            second.delete(first_id)
+            self.assertEqual(first.search_by_condition({'age': {'@gte': 0}}, projection=['_id']), [{'_id': second_id}])
+            self.assertEqual(first.get_json(second_id), {'age': 60})
+
+
+if __name__ == '__main__':
+    unittest.main()